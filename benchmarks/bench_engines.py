@@ -0,0 +1,77 @@
+# This file is part of python-bidi
+#
+# python-bidi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Compares the Rust, NumPy and pure Python implementations.
+
+Usage::
+
+    python benchmarks/bench_engines.py [--chars N] [--repeat N]
+
+Each implementation lays out a few kinds of text of about N chars, and the
+best time of the repeats is reported. Implementations which can't be
+imported (NumPy not installed) are skipped.
+"""
+
+import argparse
+import timeit
+
+HEBREW = "".join(["ש", "ל", "ו", "ם"])
+ARABIC = "".join(["م", "ر", "ح", "ب", "ا"])
+
+SAMPLES = {
+    "ltr": "The quick brown fox jumps over the lazy dog, 123 times. ",
+    "rtl": f"{HEBREW} {ARABIC} ({HEBREW}) {HEBREW}, ",
+    "mixed": f"{HEBREW} said: hello world 2024, {ARABIC} ١٢٣! ",
+    "lines": f"{HEBREW} 12 hello\n",
+}
+
+
+def engines():
+    from bidi import get_display as rust_get_display
+    from bidi.algorithm import get_display as python_get_display
+
+    found = {"rust": rust_get_display}
+    try:
+        from bidi.numpy_engine import get_display as numpy_get_display
+    except ImportError:
+        print("NumPy is not installed, skipping its implementation")
+    else:
+        found["numpy"] = numpy_get_display
+    found["python"] = python_get_display
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chars", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    options = parser.parse_args()
+
+    found = engines()
+    print(f"{'text':8}" + "".join(f"{name:>12}" for name in found))
+
+    for kind, sample in SAMPLES.items():
+        text = sample * (options.chars // len(sample) + 1)
+        timings = []
+        for get_display in found.values():
+            timing = min(
+                timeit.repeat(lambda: get_display(text), number=1, repeat=options.repeat)
+            )
+            timings.append(timing)
+        print(f"{kind:8}" + "".join(f"{timing * 1000:10.1f}ms" for timing in timings))
+
+
+if __name__ == "__main__":
+    main()
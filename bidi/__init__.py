@@ -18,9 +18,49 @@
 # Copyright (C) 2010-2024 Meir kriheli <mkriheli@gmail.com>.
 #
 
-from .wrapper import get_base_level, get_display
-
-__all__ = ["get_base_level", "get_display"]
+from .cache import CacheInfo, cache_clear, cache_info, disable_cache, enable_cache
+from .disk_cache import DiskCache
+from .wrapper import (
+    FastPathStats,
+    IndexMaps,
+    LevelsAndClasses,
+    fast_path_stats,
+    get_base_level,
+    get_base_level_many,
+    get_display,
+    get_display_lines,
+    get_display_many,
+    get_index_maps,
+    get_levels,
+    get_levels_and_classes,
+    get_visual_runs,
+    reset_fast_path_stats,
+    set_fast_path_stats,
+)
+
+__all__ = [
+    "CacheInfo",
+    "DiskCache",
+    "cache_clear",
+    "cache_info",
+    "disable_cache",
+    "enable_cache",
+    "FastPathStats",
+    "fast_path_stats",
+    "get_base_level",
+    "get_base_level_many",
+    "get_display",
+    "get_display_lines",
+    "get_display_many",
+    "get_index_maps",
+    "IndexMaps",
+    "get_levels",
+    "get_levels_and_classes",
+    "LevelsAndClasses",
+    "get_visual_runs",
+    "reset_fast_path_stats",
+    "set_fast_path_stats",
+]
 
 VERSION_TUPLE = (0, 6, 11)
 VERSION = ".".join(str(x) for x in VERSION_TUPLE)
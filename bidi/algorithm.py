@@ -17,12 +17,41 @@
 # Copyright (C) 2010-2015 Meir kriheli <mkriheli@gmail.com>.
 "bidirectional algorithm implementation"
 import inspect
+import re
 import sys
-from collections import deque
-from typing import Optional, Union
-from unicodedata import bidirectional, mirrored
-
+from concurrent.futures import Executor
+from itertools import repeat
+from time import perf_counter, thread_time
+from typing import Callable, Optional, Union
+from unicodedata import mirrored
+
+from .cache import cached
+from .classes import (
+    AL,
+    AN,
+    B,
+    BN,
+    CS,
+    EN,
+    ES,
+    ET,
+    L,
+    LRE,
+    LRO,
+    NAMES,
+    NSM,
+    ON,
+    PDF,
+    R,
+    RLE,
+    RLO,
+    S,
+    WS,
+    bidi_class,
+    classify,
+)
 from .mirror import MIRRORED
+from .tracing import DebugTracer, PhaseTrace, Snapshot
 
 StrOrBytes = Union[str, bytes]
 
@@ -30,6 +59,30 @@ StrOrBytes = Union[str, bytes]
 PARAGRAPH_LEVELS = {"L": 0, "AL": 1, "R": 1}
 EXPLICIT_LEVEL_LIMIT = 62
 
+# ASCII chars of the BN class, removed from the display by rule X9. Other
+# ASCII text has no RTL or explicit formatting chars and is displayed as is.
+_ASCII_BN = re.compile("[\x00-\x08\x0e-\x1b\x7f]")
+
+_PARAGRAPH_SEPARATOR = bytes([B])
+
+# Class codes of the strong types P2 looks for, and of the paragraph
+# separator it stops at, and how many chars it classifies at a time
+_P2_STOP = re.compile(b"[%c%c%c%c]" % (L, R, AL, B))
+_P2_CHUNK = 256
+
+# P1. The chars of the paragraph separator (B) class, each ending a
+# paragraph, and the paragraphs of a text
+_PARAGRAPH_SEPARATORS = "\n\r\x1c\x1d\x1e\x85\u2029"
+_PARAGRAPH = re.compile("[^{0}]*[{0}]|[^{0}]+".format(_PARAGRAPH_SEPARATORS))
+_PARAGRAPH_END = re.compile(f"[{_PARAGRAPH_SEPARATORS}]")
+_PARAGRAPH_TYPES = re.compile(b"[^%c]*%c|[^%c]+" % (B, B, B))
+
+# Least number of chars of the paragraphs laid out by each task given to an
+# executor, and most of those consecutive paragraphs at the same base level
+# laid out together
+_TASK_CHARS = 1 << 16
+_BATCH_CHARS = 1 << 12
+
 
 def _LEAST_GREATER_ODD(x):
     return (x + 1) | 1
@@ -40,24 +93,51 @@ def _LEAST_GREATER_EVEN(x):
 
 
 X2_X5_MAPPINGS = {
-    "RLE": (_LEAST_GREATER_ODD, "N"),
-    "LRE": (_LEAST_GREATER_EVEN, "N"),
-    "RLO": (_LEAST_GREATER_ODD, "R"),
-    "LRO": (_LEAST_GREATER_EVEN, "L"),
+    RLE: (_LEAST_GREATER_ODD, None),
+    LRE: (_LEAST_GREATER_EVEN, None),
+    RLO: (_LEAST_GREATER_ODD, R),
+    LRO: (_LEAST_GREATER_EVEN, L),
 }
 
 # Added 'B' so X6 won't execute in that case and X8 will run it's course
-X6_IGNORED = list(X2_X5_MAPPINGS.keys()) + ["BN", "PDF", "B"]
-X9_REMOVED = list(X2_X5_MAPPINGS.keys()) + ["BN", "PDF"]
+X6_IGNORED = frozenset(X2_X5_MAPPINGS) | {BN, PDF, B}
+X9_REMOVED = frozenset(X2_X5_MAPPINGS) | {BN, PDF}
+
+
+# Types starting or ending explicit embeddings and overrides
+_EXPLICIT = frozenset(X2_X5_MAPPINGS) | {PDF}
 
 
 def _embedding_direction(x):
-    return ("L", "R")[x % 2]
+    return (L, R)[x % 2]
 
 
 _IS_UCS2 = sys.maxunicode == 65535
 _SURROGATE_MIN, _SURROGATE_MAX = 55296, 56319  # D800, DBFF
 
+# Runs of chars of the same class, or at the same level
+_SAME_BYTE_RUN = re.compile(rb"(.)\1*", re.S)
+
+# L1. Whitespace before segment and paragraph separators, with the
+# separators, and whitespace at the end of the line
+_L1_RESET = re.compile(b"[%c%c]*[%c%c]|[%c%c]+\\Z" % (BN, WS, B, S, BN, WS))
+
+# Sequences of chars at odd, right-to-left, levels
+_ODD_LEVELS = re.compile(
+    b"[%s]+" % re.escape(bytes(range(1, EXPLICIT_LEVEL_LIMIT + 2, 2)))
+)
+
+# Single byte strings, by value
+_BYTES = tuple(bytes((value,)) for value in range(256))
+
+# L4. `str.translate` table of the mirrored chars
+_MIRRORING = {ord(_ch): mirror for _ch, mirror in MIRRORED.items() if mirrored(_ch)}
+
+# The tracer called after each phase and whether it gets snapshots, set
+# together so that threads laying out texts read them at once
+_tracing = (None, False)
+_DEBUG_TRACER = DebugTracer()
+
 
 def debug_storage(storage, base_info=False, chars=True, runs=False):
     "Display debug information for the storage"
@@ -72,23 +152,31 @@ def debug_storage(storage, base_info=False, chars=True, runs=False):
         stderr.write("  base dir    : {}\n".format(storage["base_dir"]))
 
     if runs:
-        stderr.write("  runs        : {}\n".format(list(storage["runs"])))
+        runs_info = [
+            (first, end, NAMES[sor], NAMES[eor])
+            for first, end, sor, eor in storage["level_runs"]
+        ]
+        stderr.write("  runs        : {}\n".format(runs_info))
 
     if chars:
-        output = "  Chars       : "
-        for _ch in storage["chars"]:
-            if _ch != "\n":
-                output += _ch["ch"]
-            else:
-                output += "C"
-        stderr.write(output + "\n")
+        if storage["levels"] is None:
+            # not reordered yet, the state is held by the runs
+            _chars, levels, types, _ = _expand_runs(storage)
+        else:
+            _chars, levels, types = (
+                storage["chars"],
+                storage["levels"],
+                storage["types"],
+            )
 
-        output = "  Res. levels : {}\n".format("".join(
-            [str(_ch["level"]) for _ch in storage["chars"]]
-        ))
+        stderr.write("  Chars       : {}\n".format("".join(_chars)))
+
+        output = "  Res. levels : {}\n".format(
+            "".join([str(level) for level in levels])
+        )
         stderr.write(output)
 
-        _types = [_ch["type"].ljust(3) for _ch in storage["chars"]]
+        _types = [NAMES[bidi_type].ljust(3) for bidi_type in types]
 
         for i in range(3):
             output = "                %s\n" if i else "  Res. types  : %s\n"
@@ -96,8 +184,8 @@ def debug_storage(storage, base_info=False, chars=True, runs=False):
 
 
 def get_base_level(text, upper_is_rtl=False) -> int:
-    """Get the paragraph base embedding level. Returns 0 for LTR,
-    1 for RTL.
+    """Get the base embedding level of the first paragraph. Returns 0 for
+    LTR, 1 for RTL.
 
     `text` a unicode object.
 
@@ -105,6 +193,22 @@ def get_base_level(text, upper_is_rtl=False) -> int:
     for debugging (default: False).
 
     """
+    if _IS_UCS2 or upper_is_rtl:
+        return _get_base_level_by_char(text, upper_is_rtl)
+
+    # P2, classifying the text a chunk at a time as the first strong char
+    # is usually close to its start
+    for start in range(0, len(text), _P2_CHUNK):
+        match = _P2_STOP.search(classify(text[start : start + _P2_CHUNK]))
+        if match:
+            bidi_type = match.group()[0]
+            return 0 if bidi_type == B else PARAGRAPH_LEVELS[NAMES[bidi_type]]
+
+    # P3
+    return 0
+
+
+def _get_base_level_by_char(text, upper_is_rtl):
     base_level = None
 
     prev_surrogate = False
@@ -123,13 +227,13 @@ def get_base_level(text, upper_is_rtl=False) -> int:
             base_level = 1
             break
 
-        bidi_type = bidirectional(_ch)
+        bidi_type = bidi_class(_ch)
 
-        if bidi_type in ("AL", "R"):
+        if bidi_type in (AL, R):
             base_level = 1
             break
 
-        elif bidi_type == "L":
+        elif bidi_type in (L, B):
             base_level = 0
             break
 
@@ -140,27 +244,74 @@ def get_base_level(text, upper_is_rtl=False) -> int:
     return base_level
 
 
-def get_embedding_levels(text, storage, upper_is_rtl=False, debug=False):
-    """Get the paragraph base embedding level and direction,
-    set the storage to the array of chars"""
+def _split_chars(text):
+    "The chars of `text`, with surrogate pairs kept together in case of ucs2"
 
-    prev_surrogate = False
-    base_level = storage["base_level"]
+    if not _IS_UCS2:
+        return text
 
-    # preset the storage's chars
+    chars = []
+    prev_surrogate = False
     for _ch in text:
-        if _IS_UCS2 and (_SURROGATE_MIN <= ord(_ch) <= _SURROGATE_MAX):
+        if _SURROGATE_MIN <= ord(_ch) <= _SURROGATE_MAX:
             prev_surrogate = _ch
             continue
         elif prev_surrogate:
             _ch = prev_surrogate + _ch
             prev_surrogate = False
+        chars.append(_ch)
+    return chars
 
-        bidi_type = "R" if upper_is_rtl and _ch.isupper() else bidirectional(_ch)
 
-        storage["chars"].append(
-            {"ch": _ch, "level": base_level, "type": bidi_type, "orig": bidi_type}
-        )
+def _join_chars(pieces):
+    "Concatenates slices of the chars, lists of them in case of ucs2"
+
+    if _IS_UCS2:
+        return [_ch for piece in pieces for _ch in piece]
+    return "".join(pieces)
+
+
+def _classify_chars(chars, upper_is_rtl):
+    "The codes of the bidi types of `chars`, upper case ones R if `upper_is_rtl`"
+
+    if _IS_UCS2:
+        orig_types = bytes([bidi_class(_ch) for _ch in chars])
+    else:
+        orig_types = classify(chars)
+
+    if upper_is_rtl:
+        orig_types = bytearray(orig_types)
+        for idx, _ch in enumerate(chars):
+            if _ch.isupper():
+                orig_types[idx] = R
+        orig_types = bytes(orig_types)
+
+    return orig_types
+
+
+def get_embedding_levels(
+    text, storage, upper_is_rtl=False, debug=False, orig_types=None
+):
+    """Get the paragraph base embedding level and direction,
+    set the storage to the chars, their types, and the runs of chars of
+    the same type. `orig_types` are those of the chars, when already
+    classified."""
+
+    chars = _split_chars(text)
+
+    if orig_types is None:
+        orig_types = _classify_chars(chars, upper_is_rtl)
+
+    # the base level may not be set yet, in tests
+    base_level = storage["base_level"] or 0
+
+    storage["chars"] = chars
+    storage["orig_types"] = orig_types
+    storage["runs"] = [
+        [orig_types[match.start()], base_level, match.start(), len(match[0])]
+        for match in _SAME_BYTE_RUN.finditer(orig_types)
+    ]
+
     if debug:
         debug_storage(storage, base_info=True)
 
@@ -170,49 +321,60 @@ def explicit_embed_and_overrides(storage, debug=False):
 
     See http://unicode.org/reports/tr9/#Explicit_Levels_and_Directions
 
+    Explicit embeddings and overrides are applied char by char, the other
+    types a run at a time.
+
     """
     overflow_counter = almost_overflow_counter = 0
-    directional_override = "N"
-    levels = deque()
+    directional_override = None
+    stack = []
+    runs = storage["runs"]
 
     # X1
     embedding_level = storage["base_level"]
 
-    for _ch in storage["chars"]:
-        bidi_type = _ch["type"]
+    # without explicit embeddings and overrides, X2 to X8 leave every char
+    # at the base level
+    if _EXPLICIT.isdisjoint([run[0] for run in runs]):
+        explicit_runs = ()
+    else:
+        explicit_runs = runs
 
+    for run in explicit_runs:
+        bidi_type = run[0]
         level_func, override = X2_X5_MAPPINGS.get(bidi_type, (None, None))
 
         if level_func:
-            # So this is X2 to X5
-            # if we've past EXPLICIT_LEVEL_LIMIT, note it and do nothing
+            # So this is X2 to X5, for each char of the run
+            for _ in range(run[3]):
+                # if we've past EXPLICIT_LEVEL_LIMIT, note it and do nothing
+                if overflow_counter != 0:
+                    overflow_counter += 1
+                    continue
+
+                new_level = level_func(embedding_level)
+                if new_level < EXPLICIT_LEVEL_LIMIT:
+                    stack.append((embedding_level, directional_override))
+                    embedding_level, directional_override = new_level, override
+
+                elif embedding_level == EXPLICIT_LEVEL_LIMIT - 2:
+                    # The new level is invalid, but a valid level can still be
+                    # achieved if this level is 60 and we encounter an RLE or
+                    # RLO further on.  So record that we 'almost' overflowed.
+                    almost_overflow_counter += 1
 
-            if overflow_counter != 0:
-                overflow_counter += 1
-                continue
-
-            new_level = level_func(embedding_level)
-            if new_level < EXPLICIT_LEVEL_LIMIT:
-                levels.append((embedding_level, directional_override))
-                embedding_level, directional_override = new_level, override
+                else:
+                    overflow_counter += 1
 
-            elif embedding_level == EXPLICIT_LEVEL_LIMIT - 2:
-                # The new level is invalid, but a valid level can still be
-                # achieved if this level is 60 and we encounter an RLE or
-                # RLO further on.  So record that we 'almost' overflowed.
-                almost_overflow_counter += 1
+        # X6
+        elif bidi_type not in X6_IGNORED:
+            run[1] = embedding_level
+            if directional_override is not None:
+                run[0] = directional_override
 
-            else:
-                overflow_counter += 1
-        else:
-            # X6
-            if bidi_type not in X6_IGNORED:
-                _ch["level"] = embedding_level
-                if directional_override != "N":
-                    _ch["type"] = directional_override
-
-            # X7
-            elif bidi_type == "PDF":
+        # X7, for each char of the run
+        elif bidi_type == PDF:
+            for _ in range(run[3]):
                 if overflow_counter:
                     overflow_counter -= 1
                 elif (
@@ -220,24 +382,23 @@ def explicit_embed_and_overrides(storage, debug=False):
                     and embedding_level != EXPLICIT_LEVEL_LIMIT - 1
                 ):
                     almost_overflow_counter -= 1
-                elif levels:
-                    embedding_level, directional_override = levels.pop()
+                elif stack:
+                    embedding_level, directional_override = stack.pop()
 
-            # X8
-            elif bidi_type == "B":
-                levels.clear()
-                overflow_counter = almost_overflow_counter = 0
-                embedding_level = _ch["level"] = storage["base_level"]
-                directional_override = "N"
+        # X8
+        elif bidi_type == B:
+            stack.clear()
+            overflow_counter = almost_overflow_counter = 0
+            embedding_level = run[1] = storage["base_level"]
+            directional_override = None
 
     # Removes the explicit embeds and overrides of types
-    # RLE, LRE, RLO, LRO, PDF, and BN. Adjusts extended chars
-    # next and prev as well
+    # RLE, LRE, RLO, LRO, PDF, and BN. The chars stay in place, only
+    # their runs are dropped.
 
     # Applies X9. See http://unicode.org/reports/tr9/#X9
-    storage["chars"] = [
-        _ch for _ch in storage["chars"] if _ch["type"] not in X9_REMOVED
-    ]
+    if not X9_REMOVED.isdisjoint([run[0] for run in runs]):
+        storage["runs"] = [run for run in runs if run[0] not in X9_REMOVED]
 
     calc_level_runs(storage)
 
@@ -249,345 +410,477 @@ def calc_level_runs(storage):
     """Split the storage to run of char types at the same level.
 
     Applies X10. See http://unicode.org/reports/tr9/#X10
+
+    Level runs are (first, end, sor, eor) tuples, `first` and `end` the
+    indices of their first run of chars and of the run following their last.
+    They also end with paragraph separators, so that the paragraphs of the
+    storage are resolved independently.
     """
     # run level depends on the higher of the two levels on either side of
     # the boundary If the higher level is odd, the type is R; otherwise,
     # it is L
 
-    storage["runs"].clear()
-    chars = storage["chars"]
+    level_runs = storage["level_runs"] = []
+    runs = storage["runs"]
 
     # empty string ?
-    if not chars:
+    if not runs:
         return
 
-    def calc_level_run(b_l, b_r):
-        return ["L", "R"][max(b_l, b_r) % 2]
-
-    first_char = chars[0]
-
-    sor = calc_level_run(storage["base_level"], first_char["level"])
-    eor = None
-
-    run_start = run_length = 0
-
-    curr_level, curr_type = 0, ""
-    prev_level, prev_type = first_char["level"], first_char["type"]
-
-    for _ch in chars:
-        curr_level, curr_type = _ch["level"], _ch["type"]
-
-        if curr_level == prev_level:
-            run_length += 1
-        else:
-            eor = calc_level_run(prev_level, curr_level)
-            storage["runs"].append(
-                {
-                    "sor": sor,
-                    "eor": eor,
-                    "start": run_start,
-                    "type": prev_type,
-                    "length": run_length,
-                }
-            )
+    base_level = storage["base_level"]
+    sor = _embedding_direction(max(base_level, runs[0][1]))
+    first = 0
+
+    for idx in range(1, len(runs)):
+        prev_level, curr_level = runs[idx - 1][1], runs[idx][1]
+        if runs[idx - 1][0] == B:
+            # P1, the next paragraph starts as the text would
+            eor = _embedding_direction(max(prev_level, base_level))
+            level_runs.append((first, idx, sor, eor))
+            sor = _embedding_direction(max(base_level, curr_level))
+            first = idx
+        elif curr_level != prev_level:
+            eor = _embedding_direction(max(prev_level, curr_level))
+            level_runs.append((first, idx, sor, eor))
             sor = eor
-            run_start += run_length
-            run_length = 1
-
-        prev_level, prev_type = curr_level, curr_type
+            first = idx
 
     # for the last char/runlevel
-    eor = calc_level_run(curr_level, storage["base_level"])
-    storage["runs"].append(
-        {
-            "sor": sor,
-            "eor": eor,
-            "start": run_start,
-            "type": curr_type,
-            "length": run_length,
-        }
-    )
+    eor = _embedding_direction(max(runs[-1][1], base_level))
+    level_runs.append((first, len(runs), sor, eor))
 
 
 def resolve_weak_types(storage, debug=False):
-    """Resolve weak type rules W1 - W3.
+    """Resolve weak type rules W1 - W7.
 
     See: http://unicode.org/reports/tr9/#Resolving_Weak_Types
 
+    Two linear passes per level run, in place: W1 to W3, then W4 to W7. The
+    rules resolve every char of a run of chars of the same type alike, but
+    for W4, which only applies to single separators.
+
     """
+    runs = storage["runs"]
 
-    for run in storage["runs"]:
-        prev_strong = prev_type = run["sor"]
-        start, length = run["start"], run["length"]
-        chars = storage["chars"][start : start + length]
-        for _ch in chars:
+    for first, end, sor, _ in storage["level_runs"]:
+        prev_strong = prev_type = sor
+        for idx in range(first, end):
+            run = runs[idx]
             # W1. Examine each nonspacing mark (NSM) in the level run, and
             # change the type of the NSM to the type of the previous character.
             # If the NSM is at the start of the level run, it will get the type
             # of sor.
-            bidi_type = _ch["type"]
-
-            if bidi_type == "NSM":
-                _ch["type"] = bidi_type = prev_type
+            bidi_type = run[0]
+            if bidi_type == NSM:
+                bidi_type = prev_type
 
             # W2. Search backward from each instance of a European number until
             # the first strong type (R, L, AL, or sor) is found. If an AL is
             # found, change the type of the European number to Arabic number.
-            if bidi_type == "EN" and prev_strong == "AL":
-                _ch["type"] = "AN"
+            prev_type = bidi_type
+            if bidi_type == EN and prev_strong == AL:
+                prev_type = AN
 
             # update prev_strong if needed
-            if bidi_type in ("R", "L", "AL"):
+            if bidi_type in (R, L, AL):
                 prev_strong = bidi_type
 
-            prev_type = _ch["type"]
-
-        # W3. Change all ALs to R
-        for _ch in chars:
-            if _ch["type"] == "AL":
-                _ch["type"] = "R"
-
-        # W4. A single European separator between two European numbers changes
-        # to a European number. A single common separator between two numbers of
-        # the same type changes to that type.
-        for idx in range(1, len(chars) - 1):
-            bidi_type = chars[idx]["type"]
-            prev_type = chars[idx - 1]["type"]
-            next_type = chars[idx + 1]["type"]
-
-            if bidi_type == "ES" and (prev_type == next_type == "EN"):
-                chars[idx]["type"] = "EN"
-
-            if (
-                bidi_type == "CS"
-                and prev_type == next_type
-                and prev_type in ("AN", "EN")
-            ):
-                chars[idx]["type"] = prev_type
-
-        # W5. A sequence of European terminators adjacent to European numbers
-        # changes to all European numbers.
-        for idx in range(len(chars)):
-            if chars[idx]["type"] == "EN":
-                for et_idx in range(idx - 1, -1, -1):
-                    if chars[et_idx]["type"] == "ET":
-                        chars[et_idx]["type"] = "EN"
-                    else:
-                        break
-                for et_idx in range(idx + 1, len(chars)):
-                    if chars[et_idx]["type"] == "ET":
-                        chars[et_idx]["type"] = "EN"
-                    else:
-                        break
-
-        # W6. Otherwise, separators and terminators change to Other Neutral.
-        for _ch in chars:
-            if _ch["type"] in ("ET", "ES", "CS"):
-                _ch["type"] = "ON"
-
-        # W7. Search backward from each instance of a European number until the
-        # first strong type (R, L, or sor) is found. If an L is found, then
-        # change the type of the European number to L.
-        prev_strong = run["sor"]
-        for _ch in chars:
-            if _ch["type"] == "EN" and prev_strong == "L":
-                _ch["type"] = "L"
-
-            if _ch["type"] in ("L", "R"):
-                prev_strong = _ch["type"]
+            # W3. Change all ALs to R
+            run[0] = R if prev_type == AL else prev_type
+
+        prev_strong = sor
+        # types of the previous char before, and after, W4
+        prev_type = prev_resolved = None
+        # pending sequence of runs of European terminators, and whether it
+        # follows a European number
+        et_first = None
+        et_after_en = False
+
+        for idx in range(first, end):
+            run = runs[idx]
+            bidi_type = resolved = run[0]
+
+            # W4. A single European separator between two European numbers
+            # changes to a European number. A single common separator between
+            # two numbers of the same type changes to that type.
+            if bidi_type in (ES, CS) and run[3] == 1 and first < idx < end - 1:
+                if prev_type == runs[idx + 1][0] and (
+                    prev_type == EN or (bidi_type == CS and prev_type == AN)
+                ):
+                    resolved = prev_type
+
+            prev_type = bidi_type
+
+            # W5. A sequence of European terminators adjacent to European
+            # numbers changes to all European numbers.
+            if resolved == ET:
+                if et_first is None:
+                    et_first = idx
+                    et_after_en = prev_resolved == EN
+                prev_resolved = resolved
+                continue
+
+            if et_first is not None:
+                _resolve_terminators(
+                    runs, et_first, idx, et_after_en or resolved == EN, prev_strong
+                )
+                et_first = None
+
+            prev_resolved = resolved
+
+            # W6. Otherwise, separators and terminators change to Other
+            # Neutral.
+            if resolved in (ES, CS):
+                resolved = ON
+
+            # W7. Search backward from each instance of a European number until
+            # the first strong type (R, L, or sor) is found. If an L is found,
+            # then change the type of the European number to L.
+            elif resolved == EN and prev_strong == L:
+                resolved = L
+
+            if resolved in (L, R):
+                prev_strong = resolved
+
+            run[0] = resolved
+
+        if et_first is not None:
+            _resolve_terminators(runs, et_first, end, et_after_en, prev_strong)
 
     if debug:
         debug_storage(storage, runs=True)
 
 
-def resolve_neutral_types(storage, debug):
-    """Resolving neutral types. Implements N1 and N2
+def _resolve_terminators(runs, first, end, is_en, prev_strong):
+    """Resolves the runs of European terminators from `first` to `end`: W5
+    makes them European numbers if `is_en`, W6 neutrals otherwise, and W7
+    turns European numbers following L into L."""
+    if not is_en:
+        resolved = ON
+    elif prev_strong == L:
+        resolved = L
+    else:
+        resolved = EN
 
-    See: http://unicode.org/reports/tr9/#Resolving_Neutral_Types
+    for idx in range(first, end):
+        runs[idx][0] = resolved
 
-    """
 
-    prev_bidi_type = ""
-    for run in storage["runs"]:
-        start, length = run["start"], run["length"]
-        # use sor and eor
-        chars = (
-            [{"type": run["sor"]}]
-            + storage["chars"][start : start + length]
-            + [{"type": run["eor"]}]
-        )
-        total_chars = len(chars)
-
-        seq_start = None
-        for idx in range(total_chars):
-            _ch = chars[idx]
-            if _ch["type"] in ("B", "S", "WS", "ON"):
-                # N1. A sequence of neutrals takes the direction of the
-                # surrounding strong text if the text on both sides has the same
-                # direction. European and Arabic numbers act as if they were R
-                # in terms of their influence on neutrals. Start-of-level-run
-                # (sor) and end-of-level-run (eor) are used at level run
-                # boundaries.
-                if seq_start is None:
-                    seq_start = idx
-                    prev_bidi_type = chars[idx - 1]["type"]
-            else:
-                if seq_start is not None:
-                    next_bidi_type = chars[idx]["type"]
-
-                    if prev_bidi_type in ("AN", "EN"):
-                        prev_bidi_type = "R"
-
-                    if next_bidi_type in ("AN", "EN"):
-                        next_bidi_type = "R"
-
-                    for seq_idx in range(seq_start, idx):
-                        if prev_bidi_type == next_bidi_type:
-                            chars[seq_idx]["type"] = prev_bidi_type
-                        else:
-                            # N2. Any remaining neutrals take the embedding
-                            # direction. The embedding direction for the given
-                            # neutral character is derived from its embedding
-                            # level: L if the character is set to an even level,
-                            # and R if the level is odd.
-                            chars[seq_idx]["type"] = _embedding_direction(
-                                chars[seq_idx]["level"]
-                            )
-
-                    seq_start = None
+_NEUTRALS = frozenset((B, S, WS, ON))
 
-    if debug:
-        debug_storage(storage)
+# Types left once neutrals are resolved
+_RESOLVED = frozenset((L, R, EN, AN))
 
+# I1 and I2: how much the level of a char of each type goes up, at even and
+# at odd levels. Types other than those resolved follow AN and EN.
+_IMPLICIT_RAISE = (
+    bytes(0 if code == L else 1 if code == R else 2 for code in range(len(NAMES))),
+    bytes(0 if code == R else 1 for code in range(len(NAMES))),
+)
 
-def resolve_implicit_levels(storage, debug):
-    """Resolving implicit levels (I1, I2)
 
-    See: http://unicode.org/reports/tr9/#Resolving_Implicit_Levels
+def resolve_neutral_types_and_implicit_levels(storage, debug):
+    """Resolving neutral types (N1, N2) and implicit levels (I1, I2), in a
+    single pass per level run.
+
+    See: http://unicode.org/reports/tr9/#Resolving_Neutral_Types
+    and: http://unicode.org/reports/tr9/#Resolving_Implicit_Levels
 
     """
-    for run in storage["runs"]:
-        start, length = run["start"], run["length"]
-        chars = storage["chars"][start : start + length]
-
-        for _ch in chars:
-            # only those types are allowed at this stage
-            assert _ch["type"] in ("L", "R", "EN", "AN"), (
-                "{} not allowed here".format(_ch["type"])
-            )
+    runs = storage["runs"]
+
+    for first, end, sor, eor in storage["level_runs"]:
+        # type of the last char before the current sequence of neutrals,
+        # sor at the start of the run
+        prev_bidi_type = sor
+        seq_first = None
+
+        for idx in range(first, end):
+            run = runs[idx]
+            bidi_type = run[0]
+            if bidi_type in _NEUTRALS:
+                if seq_first is None:
+                    seq_first = idx
+                continue
 
-            if _embedding_direction(_ch["level"]) == "L":
-                # I1. For all characters with an even (left-to-right) embedding
-                # direction, those of type R go up one level and those of type
-                # AN or EN go up two levels.
-                if _ch["type"] == "R":
-                    _ch["level"] += 1
-                elif _ch["type"] != "L":
-                    _ch["level"] += 2
-            else:
-                # I2. For all characters with an odd (right-to-left) embedding
-                # direction, those of type L, EN or AN  go up one level.
-                if _ch["type"] != "R":
-                    _ch["level"] += 1
+            if seq_first is not None:
+                _resolve_neutrals(runs, seq_first, idx, prev_bidi_type, bidi_type)
+                seq_first = None
+
+            # I1. For all characters with an even (left-to-right) embedding
+            # direction, those of type R go up one level and those of type
+            # AN or EN go up two levels.
+            # I2. For all characters with an odd (right-to-left) embedding
+            # direction, those of type L, EN or AN  go up one level.
+            run[1] += _IMPLICIT_RAISE[run[1] % 2][bidi_type]
+            prev_bidi_type = bidi_type
+
+        # use eor
+        if seq_first is not None:
+            _resolve_neutrals(runs, seq_first, end, prev_bidi_type, eor)
+
+    # only those types are allowed at this stage
+    types = {run[0] for run in runs}
+    assert _RESOLVED.issuperset(types), "{} not allowed here".format(
+        ", ".join(sorted(NAMES[bidi_type] for bidi_type in types - _RESOLVED))
+    )
 
     if debug:
         debug_storage(storage, runs=True)
 
 
-def reverse_contiguous_sequence(
-    chars, line_start, line_end, highest_level, lowest_odd_level
-):
+def _resolve_neutrals(runs, first, end, prev_bidi_type, next_bidi_type):
+    """Resolves the sequence of runs of neutrals from `first` to `end`,
+    between chars of types `prev_bidi_type` and `next_bidi_type`."""
+
+    # N1. A sequence of neutrals takes the direction of the surrounding
+    # strong text if the text on both sides has the same direction. European
+    # and Arabic numbers act as if they were R in terms of their influence on
+    # neutrals. Start-of-level-run (sor) and end-of-level-run (eor) are used
+    # at level run boundaries.
+    if prev_bidi_type in (AN, EN):
+        prev_bidi_type = R
+
+    if next_bidi_type in (AN, EN):
+        next_bidi_type = R
+
+    for idx in range(first, end):
+        run = runs[idx]
+        if prev_bidi_type == next_bidi_type:
+            bidi_type = prev_bidi_type
+        else:
+            # N2. Any remaining neutrals take the embedding direction. The
+            # embedding direction for the given neutral character is derived
+            # from its embedding level: L if the character is set to an even
+            # level, and R if the level is odd.
+            bidi_type = _embedding_direction(run[1])
+
+        run[0] = bidi_type
+        # I1 and I2
+        run[1] += _IMPLICIT_RAISE[run[1] % 2][bidi_type]
+
+
+def get_visual_order(levels, line_start, line_end, lowest_odd_level):
     """L2. From the highest level found in the text to the lowest odd
     level on each line, including intermediate levels not actually
     present in the text, reverse any contiguous sequence of characters
     that are at that level or higher.
 
+    Returns the logical indices of the chars from `line_start` to
+    `line_end` in visual order.
+
     """
-    for level in range(highest_level, lowest_odd_level - 1, -1):
-        _start = _end = None
+    order = []
+    for start, end, reverse in _visual_segments(
+        levels, line_start, line_end, lowest_odd_level
+    ):
+        order.extend(range(end - 1, start - 1, -1) if reverse else range(start, end))
+    return order
 
-        for run_idx in range(line_start, line_end + 1):
-            run_ch = chars[run_idx]
 
-            if run_ch["level"] >= level:
-                if _start is None:
-                    _start = _end = run_idx
-                else:
-                    _end = run_idx
-            else:
-                if _end is not None:
-                    chars[_start : +_end + 1] = reversed(chars[_start : +_end + 1])
-                    _start = _end = None
+def _visual_segments(levels, line_start, line_end, lowest_odd_level):
+    """L2 for the chars from `line_start` to `line_end`, as (start, end,
+    reverse) segments of logical indices in visual order.
 
-        # anything remaining ?
-        if _start is not None and _end is not None:
-            chars[_start : +_end + 1] = reversed(chars[_start : +_end + 1])
+    Rather than reversing the line once per level, the runs of chars at the
+    same level are nested into a tree: a node per maximal sequence of chars
+    at a level or higher, holding the runs at its level and the nodes above
+    it. A node is reversed once per level between its own and its parent's,
+    so the order comes out of a single walk of the tree, whatever the depth.
 
+    """
+    if max(levels[line_start : line_end + 1], default=0) <= lowest_odd_level + 1:
+        return _flat_visual_segments(levels, line_start, line_end, lowest_odd_level)
+
+    # a node is [level, children], children are nodes and ranges of
+    # logical indices, levels below lowest_odd_level are never reversed
+    root = [lowest_odd_level - 1, []]
+    stack = [root]
+
+    for match in _SAME_BYTE_RUN.finditer(levels, line_start, line_end + 1):
+        run_start, run_end = match.span()
+        level = max(levels[run_start], root[0])
+        while stack[-1][0] > level:
+            node = stack.pop()
+            if stack[-1][0] < level:
+                stack.append([level, [node]])
+            else:
+                stack[-1][1].append(node)
+
+        if stack[-1][0] < level:
+            stack.append([level, []])
+
+        stack[-1][1].append(range(run_start, run_end))
+
+    while len(stack) > 1:
+        node = stack.pop()
+        stack[-1][1].append(node)
+
+    segments = []
+    _walk_visual_order(root, root[0], False, segments)
+    return segments
+
+
+def _flat_visual_segments(levels, line_start, line_end, lowest_odd_level):
+    """`_visual_segments` of a line with no level above lowest_odd_level + 1,
+    which most are: each sequence of chars at lowest_odd_level or higher is
+    reversed, and within it the runs at the level above are reversed back,
+    without building a tree."""
+
+    segments = []
+    # the runs of the sequence being reversed, in logical order
+    sequence = []
+    for match in _SAME_BYTE_RUN.finditer(levels, line_start, line_end + 1):
+        run_start, run_end = match.span()
+        level = levels[run_start]
+        if level < lowest_odd_level:
+            segments.extend(reversed(sequence))
+            sequence.clear()
+            segments.append((run_start, run_end, False))
+        else:
+            sequence.append((run_start, run_end, level == lowest_odd_level))
+    segments.extend(reversed(sequence))
 
-def reorder_resolved_levels(storage, debug):
-    """L1 and L2 rules"""
+    return segments
 
-    # Applies L1.
 
-    should_reset = True
-    chars = storage["chars"]
+def _walk_visual_order(node, parent_level, reverse, segments):
+    level, children = node
+    if (level - parent_level) % 2:
+        reverse = not reverse
 
-    for _ch in chars[::-1]:
-        # L1. On each line, reset the embedding level of the following
-        # characters to the paragraph embedding level:
-        if _ch["orig"] in ("B", "S"):
-            # 1. Segment separators,
-            # 2. Paragraph separators,
-            _ch["level"] = storage["base_level"]
-            should_reset = True
-        elif should_reset and _ch["orig"] in ("BN", "WS"):
-            # 3. Any sequence of whitespace characters preceding a segment
-            # separator or paragraph separator
-            # 4. Any sequence of white space characters at the end of the
-            # line.
-            _ch["level"] = storage["base_level"]
+    for child in reversed(children) if reverse else children:
+        if isinstance(child, range):
+            segments.append((child.start, child.stop, reverse))
         else:
-            should_reset = False
+            _walk_visual_order(child, level, reverse, segments)
+
+
+def _expand_runs(storage, with_types=True):
+    """The chars left by X9, with `bytearray`s of their levels, original
+    types and, if `with_types`, resolved types, expanded from the runs."""
+    chars, orig_types = storage["chars"], storage["orig_types"]
+    runs = storage["runs"]
+    levels = bytearray().join([_BYTES[run[1]] * run[3] for run in runs])
+    types = (
+        bytearray().join([_BYTES[run[0]] * run[3] for run in runs])
+        if with_types
+        else None
+    )
 
-    max_len = len(chars)
+    if len(levels) == len(chars):
+        # X9 removed nothing
+        return chars, levels, types, bytearray(orig_types)
 
-    # L2 should be per line
-    # Calculates highest level and lowest odd level on the fly.
+    kept_chars, kept_types = [], []
+    for _, _, start, length in runs:
+        kept_chars.append(chars[start : start + length])
+        kept_types.append(orig_types[start : start + length])
 
-    line_start = line_end = 0
-    highest_level = 0
-    lowest_odd_level = EXPLICIT_LEVEL_LIMIT
+    return _join_chars(kept_chars), levels, types, bytearray().join(kept_types)
 
-    for idx in range(max_len):
-        _ch = chars[idx]
 
-        # calc the levels
-        char_level = _ch["level"]
-        if char_level > highest_level:
-            highest_level = char_level
+def _reset_line_levels(levels, orig_types, base_level):
+    "Applies L1 to the `levels` of the chars left by X9"
 
-        if char_level % 2 and char_level < lowest_odd_level:
-            lowest_odd_level = char_level
+    # L1. On each line, reset the embedding level of the following
+    # characters to the paragraph embedding level:
+    # 1. Segment separators,
+    # 2. Paragraph separators,
+    # 3. Any sequence of whitespace characters preceding a segment
+    # separator or paragraph separator
+    # 4. Any sequence of white space characters at the end of the
+    # line.
+    for match in _L1_RESET.finditer(orig_types):
+        start, end = match.span()
+        levels[start:end] = bytes((base_level,)) * (end - start)
 
-        if _ch["orig"] == "B" or idx == max_len - 1:
-            line_end = idx
-            # omit line breaks
-            if _ch["orig"] == "B":
-                line_end -= 1
 
-            reverse_contiguous_sequence(
-                chars, line_start, line_end, highest_level, lowest_odd_level
-            )
+def _with_removed_levels(storage, levels):
+    """`levels` of the chars left by X9, with those of the chars it removed
+    added back: the level of the char before them, or the base level at the
+    start of the storage."""
+
+    if len(levels) == len(storage["orig_types"]):
+        return levels
+
+    pieces = []
+    pos = kept = 0
+    prev_level = storage["base_level"]
+    for _, _, start, length in storage["runs"]:
+        pieces.append(_BYTES[prev_level] * (start - pos))
+        pieces.append(levels[kept : kept + length])
+        kept += length
+        pos = start + length
+        prev_level = levels[kept - 1]
+    pieces.append(_BYTES[prev_level] * (len(storage["orig_types"]) - pos))
+
+    return bytearray().join(pieces)
+
+
+def reorder_resolved_levels(storage, debug, keep_types=False):
+    """L1 and L2 rules
+
+    The runs are expanded back to chars here, L1 resets sequences of chars
+    found by regular expressions and L2 moves whole segments of them.
 
-            # reset for next line run
-            line_start = idx + 1
-            highest_level = 0
-            lowest_odd_level = EXPLICIT_LEVEL_LIMIT
+    The resolved types are kept in the storage when debugging, or if
+    `keep_types` is set.
+
+    """
+    keep_types = keep_types or debug
+    chars, levels, types, orig_types = _expand_runs(storage, keep_types)
+    _reset_line_levels(levels, orig_types, storage["base_level"])
+
+    max_len = len(levels)
+    segments = []
+
+    # L2 should be per line, lines end with a paragraph separator
+    line_start = 0
+    while line_start < max_len:
+        line_break = orig_types.find(_PARAGRAPH_SEPARATOR, line_start)
+        idx = max_len - 1 if line_break == -1 else line_break
+
+        # the line break counts for the lowest odd level, but is omitted
+        # from the reordering
+        odd_levels = [
+            level for level in set(levels[line_start : idx + 1]) if level % 2
+        ]
+        lowest_odd_level = min(odd_levels, default=EXPLICIT_LEVEL_LIMIT)
+
+        line_end = idx - 1 if line_break != -1 else idx
+        segments.extend(
+            _visual_segments(levels, line_start, line_end, lowest_odd_level)
+        )
+        if line_break != -1:
+            segments.append((line_break, line_break + 1, False))
+
+        line_start = idx + 1
+
+    # moves the chars, along with their levels and types, to their visual
+    # position
+    def visual(seq):
+        return [
+            seq[start:end][::-1] if reverse else seq[start:end]
+            for start, end, reverse in segments
+        ]
+
+    storage["chars"] = _join_chars(visual(chars))
+    storage["levels"] = bytearray().join(visual(levels))
+    if keep_types:
+        storage["types"] = bytearray().join(visual(types))
+    storage["orig_types"] = bytearray().join(visual(orig_types))
 
     if debug:
         debug_storage(storage)
 
 
+def _mirror(chars):
+    if _IS_UCS2:
+        return [_ch.translate(_MIRRORING) for _ch in chars]
+    return chars.translate(_MIRRORING)
+
+
 def apply_mirroring(storage, debug):
     """Applies L4: mirroring
 
@@ -597,31 +890,72 @@ def apply_mirroring(storage, debug):
     # L4. A character is depicted by a mirrored glyph if and only if (a) the
     # resolved directionality of that character is R, and (b) the
     # Bidi_Mirrored property value of that character is true.
-    for _ch in storage["chars"]:
-        unichar = _ch["ch"]
-        if mirrored(unichar) and _embedding_direction(_ch["level"]) == "R":
-            _ch["ch"] = MIRRORED.get(unichar, unichar)
+    chars = storage["chars"]
+    pieces = []
+    pos = 0
+    for match in _ODD_LEVELS.finditer(storage["levels"]):
+        start, end = match.span()
+        pieces.append(chars[pos:start])
+        pieces.append(_mirror(chars[start:end]))
+        pos = end
+
+    if pieces:
+        pieces.append(chars[pos:])
+        storage["chars"] = _join_chars(pieces)
 
     if debug:
         debug_storage(storage)
 
 
 def get_empty_storage():
-    """Return an empty storage skeleton, usable for testing"""
+    """Return an empty storage skeleton, usable for testing.
+
+    Chars are stored as a str (a list in case of ucs2), along with the
+    codes (see `bidi.classes`) of their original bidi types. Up to L1, the
+    rules work on runs of consecutive chars of the same type, [type, level,
+    start, length] lists, grouped into (first, end, sor, eor) level runs.
+    Reordering expands them back into the chars left and `bytearray`s of
+    their levels and original types (and resolved types, when debugging),
+    in visual order.
+    """
     return {
         "base_level": None,
         "base_dir": None,
-        "chars": [],
-        "runs": deque(),
+        "chars": "",
+        "orig_types": b"",
+        "runs": [],
+        "level_runs": [],
+        "levels": None,
+        "types": None,
     }
 
 
+def set_tracer(
+    tracer: Optional[Callable[[PhaseTrace], None]] = None, snapshots: bool = False
+) -> None:
+    """Calls `tracer` with a `bidi.tracing.PhaseTrace` after each phase of
+    the algorithm, in every thread, until it is set back to None (the
+    default). Set `snapshots` to True to have the chars, levels and types
+    after each phase in the traces too, which slows the phases down.
+
+    Texts laid out as is and cached results are not traced.
+    """
+    global _tracing
+    _tracing = (tracer, snapshots and tracer is not None)
+
+
+def get_tracer() -> Optional[Callable[[PhaseTrace], None]]:
+    """The tracer set by `set_tracer`, if any."""
+    return _tracing[0]
+
+
 def get_display(
     str_or_bytes: StrOrBytes,
     encoding: str = "utf-8",
     upper_is_rtl: bool = False,
     base_dir: Optional[str] = None,
     debug: bool = False,
+    executor: Optional[Executor] = None,
 ) -> StrOrBytes:
     """Accepts `str` or `bytes`. In case it's `bytes`, `encoding`
     is needed as the algorithm works on `str` (default:"utf-8").
@@ -629,17 +963,50 @@ def get_display(
     Set `upper_is_rtl` to True to treat upper case chars as strong 'R'
     for debugging (default: False).
 
-    Set `base_dir` to 'L' or 'R' to override the calculated base_level.
+    Set `base_dir` to 'L' or 'R' to override the calculated base_level of
+    every paragraph.
 
     Set `debug` to True to display (using sys.stderr) the steps taken with the
-    algorithm.
+    algorithm, see `bidi.tracing.DebugTracer`.
+
+    The text is split into paragraphs, ending with paragraph separators,
+    which are laid out one at a time. Pass a `concurrent.futures.Executor`
+    as `executor` to lay out those of large texts in its threads or
+    processes instead.
 
     Returns the display layout, either as unicode or `encoding` encoded
-    string.
+    string. When laying out doesn't change the text, `str_or_bytes` itself
+    is returned.
+
+    Results are cached once `bidi.enable_cache()` is called, unless `debug`
+    is set.
 
     """
-    storage = get_empty_storage()
+    if debug:
+        return _get_display(
+            str_or_bytes, encoding, upper_is_rtl, base_dir, debug, executor
+        )
+
+    return cached(
+        "python",
+        "get_display",
+        str_or_bytes,
+        encoding,
+        (upper_is_rtl, base_dir),
+        lambda: _get_display(
+            str_or_bytes, encoding, upper_is_rtl, base_dir, debug, executor
+        ),
+    )
 
+
+def _get_display(
+    str_or_bytes: StrOrBytes,
+    encoding: str,
+    upper_is_rtl: bool,
+    base_dir: Optional[str],
+    debug: bool,
+    executor: Optional[Executor],
+) -> StrOrBytes:
     # utf-8 ? we need unicode
     if isinstance(str_or_bytes, bytes):
         text = str_or_bytes.decode(encoding)
@@ -648,26 +1015,277 @@ def get_display(
         text = str_or_bytes
         was_decoded = False
 
-    if base_dir is None:
-        base_level = get_base_level(text, upper_is_rtl)
+    if _is_displayed_as_is(text, upper_is_rtl, base_dir, debug):
+        return str_or_bytes
+
+    if executor is None or len(text) <= _TASK_CHARS:
+        display = _get_paragraphs_display(text, upper_is_rtl, base_dir, debug)
     else:
-        base_level = PARAGRAPH_LEVELS[base_dir]
+        display = "".join(
+            executor.map(
+                _get_paragraphs_display,
+                _split_tasks(text),
+                repeat(upper_is_rtl),
+                repeat(base_dir),
+                repeat(debug),
+            )
+        )
+
+    if display == text:
+        return str_or_bytes
+
+    if was_decoded:
+        display = display.encode(encoding)
+
+    return display
+
+
+def get_levels(
+    str_or_bytes: StrOrBytes,
+    encoding: str = "utf-8",
+    upper_is_rtl: bool = False,
+    base_dir: Optional[str] = None,
+) -> bytes:
+    """Returns the embedding levels the algorithm resolves for the chars of
+    `str_or_bytes`, one byte per char in logical order, with each paragraph
+    taken as a single line. Stops after L1, skipping the reordering and
+    mirroring of `get_display`.
+
+    Chars removed by rule X9 (explicit formatting chars and BN) get the
+    level of the char before them, or the paragraph level at its start.
+
+    The arguments are those of `get_display`, `bytes` are decoded with
+    `encoding` first. Results are cached once `bidi.enable_cache()` is
+    called.
+    """
+    return cached(
+        "python",
+        "get_levels",
+        str_or_bytes,
+        encoding,
+        (upper_is_rtl, base_dir),
+        lambda: _get_levels(str_or_bytes, encoding, upper_is_rtl, base_dir),
+    )
+
+
+def _get_levels(
+    str_or_bytes: StrOrBytes,
+    encoding: str,
+    upper_is_rtl: bool,
+    base_dir: Optional[str],
+) -> bytes:
+    if isinstance(str_or_bytes, bytes):
+        text = str_or_bytes.decode(encoding)
+    else:
+        text = str_or_bytes
+
+    if _is_displayed_as_is(text, upper_is_rtl, base_dir, False):
+        return bytes(len(text))
+
+    return _get_paragraphs_levels(text, upper_is_rtl, base_dir)
+
+
+def _is_displayed_as_is(text, upper_is_rtl, base_dir, debug):
+    "Whether `text` is ASCII, and laid out left to right, as is"
+
+    return (
+        not (upper_is_rtl or debug)
+        and base_dir in (None, "L")
+        and text.isascii()
+        and not _ASCII_BN.search(text)
+    )
+
+
+def _split_tasks(text):
+    "Splits `text` into consecutive paragraphs of at least _TASK_CHARS chars"
+
+    start = 0
+    while start < len(text):
+        match = _PARAGRAPH_END.search(text, start + _TASK_CHARS - 1)
+        end = match.end() if match else len(text)
+        yield text[start:end]
+        start = end
 
+
+def _get_paragraphs_display(text, upper_is_rtl, base_dir, debug):
+    "P1. Lays out the paragraphs of `text`"
+
+    return "".join(
+        _layout_paragraphs(_get_batch_display, text, upper_is_rtl, base_dir, debug)
+    )
+
+
+def _get_paragraphs_levels(text, upper_is_rtl, base_dir):
+    "P1. The levels of the chars of the paragraphs of `text`"
+
+    return b"".join(
+        _layout_paragraphs(_get_batch_levels, text, upper_is_rtl, base_dir, False)
+    )
+
+
+def _layout_paragraphs(layout_batch, text, upper_is_rtl, base_dir, debug):
+    """Lays out the paragraphs of `text` with `layout_batch`, each at its own
+    base level unless `base_dir` is set, and returns the results. Only a few
+    at a time are kept in storage: consecutive short paragraphs at the same
+    base level are laid out together, as the level runs end with paragraphs.
+
+    The text is classified once, the paragraphs and their base levels are
+    found in the types of its chars, which are handed on to `layout_batch`.
+    """
+
+    # in case of ucs2, the types don't line up with the code units of the
+    # text, and each batch classifies its own chars
+    orig_types = None if _IS_UCS2 else _classify_chars(text, upper_is_rtl)
+
+    if orig_types is None:
+        spans = [match.span() for match in _PARAGRAPH.finditer(text)]
+    elif orig_types.find(B, 0, len(text) - 1) == -1:
+        # a single paragraph, no need to split it
+        spans = [(0, len(text))] if text else []
+    else:
+        spans = [match.span() for match in _PARAGRAPH_TYPES.finditer(orig_types)]
+
+    # [start, end, base level] of the batches
+    batches = []
+    for start, end in spans:
+        if base_dir is not None:
+            base_level = PARAGRAPH_LEVELS[base_dir]
+        elif orig_types is None:
+            base_level = get_base_level(text[start:end], upper_is_rtl)
+        else:
+            base_level = _first_strong_level(orig_types, start, end)
+
+        if (
+            batches
+            and batches[-1][2] == base_level
+            and batches[-1][1] - batches[-1][0] < _BATCH_CHARS
+        ):
+            batches[-1][1] = end
+        else:
+            batches.append([start, end, base_level])
+
+    return [
+        layout_batch(
+            text[start:end],
+            base_level,
+            upper_is_rtl,
+            debug,
+            None if orig_types is None else orig_types[start:end],
+        )
+        for start, end, base_level in batches
+    ]
+
+
+def _first_strong_level(orig_types, start, end):
+    """P2 and P3. The base level of the paragraph of the chars from `start`
+    to `end`, found in their `orig_types`"""
+
+    match = _P2_STOP.search(orig_types, start, end)
+    return 1 if match and match.group()[0] in (R, AL) else 0
+
+
+def _get_batch_display(text, base_level, upper_is_rtl, debug, orig_types=None):
+    """Lays out consecutive paragraphs of `text` at the same `base_level`.
+    `orig_types` are those of the chars, when already classified."""
+
+    if not base_level and _is_displayed_as_is(text, upper_is_rtl, None, debug):
+        return text
+
+    storage = _batch_storage(base_level)
+    _run_phases(text, storage, upper_is_rtl, debug, orig_types=orig_types)
+
+    return "".join(storage["chars"])
+
+
+def _get_batch_levels(text, base_level, upper_is_rtl, debug, orig_types=None):
+    """The levels of the chars of consecutive paragraphs of `text` at the
+    same `base_level`, up to L1"""
+
+    if not base_level and _is_displayed_as_is(text, upper_is_rtl, None, debug):
+        return bytes(len(text))
+
+    storage = _batch_storage(base_level)
+    _run_phases(
+        text, storage, upper_is_rtl, debug, resolve_only=True, orig_types=orig_types
+    )
+
+    _, levels, _, orig_types = _expand_runs(storage, False)
+    _reset_line_levels(levels, orig_types, base_level)
+
+    return bytes(_with_removed_levels(storage, levels))
+
+
+def _batch_storage(base_level):
+    "An empty storage for a batch at `base_level`"
+
+    storage = get_empty_storage()
     storage["base_level"] = base_level
     storage["base_dir"] = ("L", "R")[base_level]
+    return storage
 
-    get_embedding_levels(text, storage, upper_is_rtl, debug)
-    explicit_embed_and_overrides(storage, debug)
-    resolve_weak_types(storage, debug)
-    resolve_neutral_types(storage, debug)
-    resolve_implicit_levels(storage, debug)
-    reorder_resolved_levels(storage, debug)
-    apply_mirroring(storage, debug)
 
-    chars = storage["chars"]
-    display = "".join([_ch["ch"] for _ch in chars])
+def _run_phases(
+    text, storage, upper_is_rtl, debug, resolve_only=False, orig_types=None
+):
+    """Runs the phases of the algorithm on `text` in `storage`, up to the
+    resolution of the levels if `resolve_only`, calling the tracer after
+    each when set"""
 
-    if was_decoded:
-        display = display.encode(encoding)
+    tracer, snapshots = _tracing
+    if debug:
+        tracer, snapshots = _debug_tracer(tracer), True
 
-    return display
+    phases = [
+        (get_embedding_levels, (text, storage, upper_is_rtl, False, orig_types)),
+        (explicit_embed_and_overrides, (storage,)),
+        (resolve_weak_types, (storage,)),
+        (resolve_neutral_types_and_implicit_levels, (storage, False)),
+    ]
+    if not resolve_only:
+        phases.append((reorder_resolved_levels, (storage, False, snapshots)))
+        phases.append((apply_mirroring, (storage, False)))
+
+    if tracer is None:
+        for phase, args in phases:
+            phase(*args)
+        return
+
+    for phase, args in phases:
+        wall_start, cpu_start = perf_counter(), thread_time()
+        phase(*args)
+        wall_time, cpu_time = perf_counter() - wall_start, thread_time() - cpu_start
+
+        tracer(
+            PhaseTrace(
+                phase.__name__,
+                wall_time,
+                cpu_time,
+                len(storage["chars"]),
+                len(storage["runs"]),
+                storage["base_level"],
+                _snapshot(storage) if snapshots else None,
+            )
+        )
+
+
+def _debug_tracer(tracer):
+    "Writes out the traces for `debug`, passing them on to `tracer` if set"
+
+    if tracer is None:
+        return _DEBUG_TRACER
+
+    def debug_tracer(trace):
+        _DEBUG_TRACER(trace)
+        tracer(trace)
+
+    return debug_tracer
+
+
+def _snapshot(storage):
+    "The chars left by X9, their levels and types as a `Snapshot`"
+
+    if storage["levels"] is None:
+        chars, levels, types, _ = _expand_runs(storage)
+    else:
+        chars, levels, types = storage["chars"], storage["levels"], storage["types"]
+    return Snapshot("".join(chars), bytes(levels), bytes(types))
@@ -0,0 +1,196 @@
+# This file is part of python-bidi
+#
+# python-bidi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Opt-in LRU cache of laid out texts, shared by both implementations.
+
+Entries are keyed on the input as given, `str` or `bytes`, so a hit skips
+decoding and encoding too. Other bytes-like objects are mutable or not
+hashable, and are never cached.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, NamedTuple, Optional, TypeVar
+
+T = TypeVar("T")
+
+DEFAULT_MAX_ENTRIES = 4096
+DEFAULT_MAX_CHARS = 1 << 20
+
+# Stored instead of results that are the input itself, so that hits keep
+# returning the very object they were given
+_SAME = object()
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    evictions: int
+    max_entries: int
+    max_chars: int
+    entries: int
+    chars: int
+
+
+class LRUCache:
+    """Least recently used cache bounded by a number of entries and a total
+    number of chars (or bytes) of the cached inputs and results.
+
+    Lookups and updates hold a lock, results are computed without it, so
+    the cache is safe to share between threads, free-threaded builds
+    included.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_chars: int = DEFAULT_MAX_CHARS,
+    ):
+        if max_entries < 1 or max_chars < 1:
+            raise ValueError("max_entries and max_chars must be positive")
+
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._clear_stats()
+
+    def _clear_stats(self) -> None:
+        self._hits = self._misses = self._evictions = self._chars = 0
+
+    def get_or_compute(
+        self, key: Hashable, text: Any, compute: Callable[[], T]
+    ) -> T:
+        """Returns the cached result for `key`, calling `compute` to get and
+        store it on a miss. `text` is the input the result was laid out from.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+            else:
+                self._misses += 1
+
+        if entry is not None:
+            result = entry[0]
+            return text if result is _SAME else result
+
+        result = compute()
+        if result is text:
+            stored, size = _SAME, len(text)
+        elif isinstance(result, (str, bytes)):
+            stored, size = result, len(text) + len(result)
+        else:
+            stored, size = result, len(text)
+
+        if size <= self.max_chars:
+            self._store(key, stored, size)
+
+        return result
+
+    def _store(self, key: Hashable, stored: Any, size: int) -> None:
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                # computed concurrently by another thread
+                self._chars -= old[1]
+
+            self._entries[key] = (stored, size)
+            self._chars += size
+
+            while (
+                len(self._entries) > self.max_entries
+                or self._chars > self.max_chars
+            ):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._chars -= evicted_size
+                self._evictions += 1
+
+    def cache_info(self) -> CacheInfo:
+        with self._lock:
+            return CacheInfo(
+                self._hits,
+                self._misses,
+                self._evictions,
+                self.max_entries,
+                self.max_chars,
+                len(self._entries),
+                self._chars,
+            )
+
+    def clear(self) -> None:
+        """Empties the cache and resets its statistics."""
+        with self._lock:
+            self._entries.clear()
+            self._clear_stats()
+
+
+_cache: Optional[LRUCache] = None
+
+
+def enable_cache(
+    max_entries: int = DEFAULT_MAX_ENTRIES, max_chars: int = DEFAULT_MAX_CHARS
+) -> None:
+    """Caches the results of `get_display` and `get_base_level`, for both
+    the Rust and the Python implementations, in a fresh LRU cache holding at
+    most `max_entries` results and `max_chars` chars of inputs and results.
+    """
+    global _cache
+    _cache = LRUCache(max_entries, max_chars)
+
+
+def disable_cache() -> None:
+    """Stops caching and drops the cached results."""
+    global _cache
+    _cache = None
+
+
+def cache_info() -> Optional[CacheInfo]:
+    """Returns the hits, misses, evictions, limits and current size of the
+    cache, or None when caching is disabled.
+    """
+    cache = _cache
+    return None if cache is None else cache.cache_info()
+
+
+def cache_clear() -> None:
+    """Empties the cache, if enabled, and resets its statistics."""
+    cache = _cache
+    if cache is not None:
+        cache.clear()
+
+
+def cached(
+    engine: str,
+    func: str,
+    text: Any,
+    encoding: Optional[str],
+    options: tuple,
+    compute: Callable[[], T],
+) -> T:
+    """Returns the result of `compute`, laying out `text` with `options`,
+    from the cache when enabled. `engine` and `func` tell the cached
+    functions apart, `encoding` only matters for `bytes`.
+    """
+    cache = _cache
+    if cache is None or type(text) not in (str, bytes):
+        return compute()
+
+    # str and bytes keys differ by encoding before their text is compared,
+    # str == bytes comparisons warn with -b
+    encoding = encoding if type(text) is bytes else None
+    key = (engine, func, encoding, options, text)
+    return cache.get_or_compute(key, text, compute)
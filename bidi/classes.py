@@ -0,0 +1,217 @@
+# This file is part of python-bidi
+#
+# python-bidi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Small integer codes of the bidi classes, as stored by the Python
+algorithm in place of the names `unicodedata.bidirectional` returns, and a
+code point to code lookup table.
+
+The table is a two-stage trie: an index of 256 code point blocks into the
+distinct blocks of codes. Blocks are built from `unicodedata` the first
+time one of their code points is looked up, or all at once by `load_table`,
+which can keep the table in a file. Whole strings are classified in bulk
+by `classify`, with `str.translate` and `bytes.translate`.
+"""
+
+import os
+import sys
+import threading
+import unicodedata
+from array import array
+
+NAMES = (
+    "L",
+    "R",
+    "AL",
+    "EN",
+    "ES",
+    "ET",
+    "AN",
+    "CS",
+    "NSM",
+    "BN",
+    "B",
+    "S",
+    "WS",
+    "ON",
+    "LRE",
+    "LRO",
+    "RLE",
+    "RLO",
+    "PDF",
+    "LRI",
+    "RLI",
+    "FSI",
+    "PDI",
+    # unassigned code points, for Python versions returning no class
+    "",
+)
+
+(
+    L,
+    R,
+    AL,
+    EN,
+    ES,
+    ET,
+    AN,
+    CS,
+    NSM,
+    BN,
+    B,
+    S,
+    WS,
+    ON,
+    LRE,
+    LRO,
+    RLE,
+    RLO,
+    PDF,
+    LRI,
+    RLI,
+    FSI,
+    PDI,
+    UNASSIGNED,
+) = range(len(NAMES))
+
+CODES = {name: code for code, name in enumerate(NAMES)}
+
+_BLOCK_SHIFT = 8
+_BLOCK_SIZE = 1 << _BLOCK_SHIFT
+_BLOCK_MASK = _BLOCK_SIZE - 1
+_UNBUILT = 0xFFFF
+_TABLE_MAGIC = b"pybidi-classes\0"
+
+
+class _Table:
+    def __init__(self):
+        self.index = array("H", [_UNBUILT]) * ((0x10FFFF >> _BLOCK_SHIFT) + 1)
+        self.blocks = bytearray()
+        self._block_ids = {}
+        self._lock = threading.Lock()
+
+    def _build_block(self, block_idx):
+        first = block_idx << _BLOCK_SHIFT
+        block = bytes(
+            CODES[unicodedata.bidirectional(chr(cp))]
+            for cp in range(first, first + _BLOCK_SIZE)
+        )
+        with self._lock:
+            block_id = self._block_ids.get(block)
+            if block_id is None:
+                block_id = self._block_ids[block] = len(self._block_ids)
+                self.blocks += block
+            self.index[block_idx] = block_id
+        return block_id
+
+    def lookup(self, cp):
+        block_id = self.index[cp >> _BLOCK_SHIFT]
+        if block_id == _UNBUILT:
+            block_id = self._build_block(cp >> _BLOCK_SHIFT)
+        return self.blocks[(block_id << _BLOCK_SHIFT) | (cp & _BLOCK_MASK)]
+
+    def build_all(self):
+        for block_idx, block_id in enumerate(self.index):
+            if block_id == _UNBUILT:
+                self._build_block(block_idx)
+
+    @staticmethod
+    def _header():
+        # the index is stored in native byte order
+        version = f"{unicodedata.unidata_version} {sys.byteorder}\n"
+        return _TABLE_MAGIC + version.encode()
+
+    def to_bytes(self):
+        header = self._header()
+        return header + self.index.tobytes() + bytes(self.blocks)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """The table stored in `data`, None if it is not a table built from
+        this Python's Unicode data."""
+        header = cls._header()
+        if not data.startswith(header):
+            return None
+
+        table = cls()
+        index_size = len(table.index) * table.index.itemsize
+        index = data[len(header) : len(header) + index_size]
+        blocks = data[len(header) + index_size :]
+        if len(index) != index_size or len(blocks) % _BLOCK_SIZE:
+            return None
+
+        table.index = array("H", index)
+        table.blocks = bytearray(blocks)
+        table._block_ids = {
+            bytes(blocks[pos : pos + _BLOCK_SIZE]): pos >> _BLOCK_SHIFT
+            for pos in range(0, len(blocks), _BLOCK_SIZE)
+        }
+        if max(table.index) >= len(table._block_ids):
+            return None
+        return table
+
+
+_table = _Table()
+
+
+def load_table(path):
+    """Loads the lookup table from the file at `path`. The table is built
+    in full, and saved there, if the file is missing or holds a table built
+    from another Unicode version."""
+    global _table
+
+    try:
+        with open(path, "rb") as table_file:
+            table = _Table.from_bytes(table_file.read())
+    except FileNotFoundError:
+        table = None
+
+    if table is None:
+        table = _Table()
+        table.build_all()
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as table_file:
+            table_file.write(table.to_bytes())
+        os.replace(tmp_path, path)
+
+    _table = table
+    _translation.clear()
+
+
+def bidi_class(ch):
+    """Code of the bidi class of the char `ch`."""
+    return _table.lookup(ord(ch))
+
+
+class _Translation(dict):
+    """`str.translate` table mapping code points to the char whose ordinal
+    is their class code, filled in on demand."""
+
+    def __missing__(self, cp):
+        code = self[cp] = chr(_table.lookup(cp))
+        return code
+
+
+_translation = _Translation()
+
+# Latin-1 texts are classified with bytes.translate
+_LATIN1 = bytes(_table.lookup(cp) for cp in range(256))
+
+
+def classify(text):
+    """Codes of the bidi classes of the chars of `text`, as `bytes`."""
+    try:
+        return text.encode("latin-1").translate(_LATIN1)
+    except UnicodeEncodeError:
+        return text.translate(_translation).encode("latin-1")
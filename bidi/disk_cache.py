@@ -0,0 +1,192 @@
+# This file is part of python-bidi
+#
+# python-bidi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Persistent cache of laid out texts in an SQLite file, for jobs laying
+out mostly the same texts run after run.
+
+Entries are keyed by a SHA-256 of the input, the options, the engine, the
+package version and the Unicode data version, so upgrading either makes
+stale entries miss on their own.
+"""
+
+import codecs
+import hashlib
+import os
+import threading
+from typing import Iterable, List, Optional, Union
+
+StrOrBytes = Union[str, bytes]
+
+# Keys looked up per query, below SQLite's default limit of 999 variables
+_LOOKUP_BATCH = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS displays (
+    key BLOB PRIMARY KEY,
+    display,
+    version TEXT NOT NULL
+) WITHOUT ROWID
+"""
+
+
+def _version_tag(engine: str) -> str:
+    from . import VERSION
+
+    if engine == "rust":
+        from .bidi import UNICODE_VERSION
+
+        unicode_version = ".".join(str(part) for part in UNICODE_VERSION)
+    elif engine == "python":
+        from unicodedata import unidata_version as unicode_version
+    else:
+        raise ValueError("engine can be 'rust' or 'python'")
+
+    return f"{engine}-{VERSION}-unicode-{unicode_version}"
+
+
+class DiskCache:
+    """Lays out texts like `get_display` and `get_display_many`, storing
+    the results in the SQLite file at `path`, created if missing.
+
+    `engine` is the implementation results are laid out with, 'rust'
+    (default) or 'python'. Instances may be shared between threads, and used
+    as context managers to close the file.
+    """
+
+    def __init__(self, path: Union[str, "os.PathLike[str]"], engine: str = "rust"):
+        self.engine = engine
+        self.version = _version_tag(engine)
+
+        # not every Python build ships sqlite3, only needed from here on
+        import sqlite3
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.fspath(path), check_same_thread=False)
+        with self._conn:
+            self._conn.execute(_SCHEMA)
+
+    def _key(
+        self, text: StrOrBytes, encoding: str, base_dir: Optional[str]
+    ) -> bytes:
+        digest = hashlib.sha256()
+        digest.update(f"{self.version}\0{base_dir or ''}\0".encode())
+        if isinstance(text, str):
+            digest.update(b"s")
+            digest.update(text.encode("utf-8", "surrogatepass"))
+        else:
+            digest.update(f"b{codecs.lookup(encoding).name}\0".encode())
+            digest.update(text)
+        return digest.digest()
+
+    def _layout_many(
+        self, texts: List[StrOrBytes], encoding: str, base_dir: Optional[str]
+    ) -> List[StrOrBytes]:
+        if self.engine == "rust":
+            from .wrapper import get_display_many
+
+            return get_display_many(texts, encoding, base_dir)
+
+        from .algorithm import get_display
+
+        return [get_display(text, encoding, base_dir=base_dir) for text in texts]
+
+    def get_display(
+        self,
+        str_or_bytes: StrOrBytes,
+        encoding: str = "utf-8",
+        base_dir: Optional[str] = None,
+    ) -> StrOrBytes:
+        """Like `bidi.get_display`, from the cache when possible."""
+        return self.get_display_many([str_or_bytes], encoding, base_dir)[0]
+
+    def get_display_many(
+        self,
+        texts: Iterable[StrOrBytes],
+        encoding: str = "utf-8",
+        base_dir: Optional[str] = None,
+    ) -> List[StrOrBytes]:
+        """Like `bidi.get_display_many`. Cached results are looked up, and
+        the missing ones laid out and stored, in a few bulk queries.
+        """
+        texts = [
+            text if isinstance(text, (str, bytes)) else bytes(text)
+            for text in texts
+        ]
+        keys = [self._key(text, encoding, base_dir) for text in texts]
+
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), _LOOKUP_BATCH):
+                batch = keys[start : start + _LOOKUP_BATCH]
+                rows = self._conn.execute(
+                    "SELECT key, display FROM displays WHERE key IN "
+                    f"({','.join('?' * len(batch))})",
+                    batch,
+                )
+                found.update(rows)
+
+        # first index of each missing text
+        missing = {}
+        for idx, key in enumerate(keys):
+            if key not in found:
+                missing.setdefault(key, idx)
+
+        if missing:
+            displays = self._layout_many(
+                [texts[idx] for idx in missing.values()], encoding, base_dir
+            )
+            rows = []
+            for idx, display in zip(missing.values(), displays):
+                # the input itself is stored as NULL
+                stored = None if display is texts[idx] else display
+                found[keys[idx]] = stored
+                rows.append((keys[idx], stored, self.version))
+
+            with self._lock, self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO displays VALUES (?, ?, ?)", rows
+                )
+
+        displays = []
+        for text, key in zip(texts, keys):
+            display = found[key]
+            displays.append(text if display is None else display)
+        return displays
+
+    def prune(self) -> int:
+        """Deletes the entries stored by other versions of this engine (or
+        the package), returning how many were deleted.
+        """
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "DELETE FROM displays WHERE version != ? AND version LIKE ?",
+                (self.version, f"{self.engine}-%"),
+            )
+        return cursor.rowcount
+
+    def clear(self) -> None:
+        """Deletes all the entries."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM displays")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self) -> "DiskCache":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -17,8 +17,9 @@
 # Copyright (C) 2010-2015 Meir kriheli <mkriheli@gmail.com>.
 """Mirrored chars"""
 
-# Can't seem to get this data from python's unicode data, so this is imported
-# from http://www.unicode.org/Public/UNIDATA/BidiMirroring.txt
+# Generated by tools/gen_mirror.py from BidiMirroring.txt (Unicode 14.0),
+# don't edit by hand. Chars with the Bidi_Mirrored property but no mirroring
+# char, listed at the end of that file, are left as they are.
 MIRRORED = {
     "\u0028": "\u0029",  # LEFT PARENTHESIS
     "\u0029": "\u0028",  # RIGHT PARENTHESIS
@@ -51,9 +52,16 @@ MIRRORED = {
     "\u220C": "\u2209",  # DOES NOT CONTAIN AS MEMBER
     "\u220D": "\u220A",  # SMALL CONTAINS AS MEMBER
     "\u2215": "\u29F5",  # DIVISION SLASH
+    "\u221F": "\u2BFE",  # RIGHT ANGLE
+    "\u2220": "\u29A3",  # ANGLE
+    "\u2221": "\u299B",  # MEASURED ANGLE
+    "\u2222": "\u29A0",  # SPHERICAL ANGLE
+    "\u2224": "\u2AEE",  # DOES NOT DIVIDE
     "\u223C": "\u223D",  # TILDE OPERATOR
     "\u223D": "\u223C",  # REVERSED TILDE
     "\u2243": "\u22CD",  # ASYMPTOTICALLY EQUAL TO
+    "\u2245": "\u224C",  # APPROXIMATELY EQUAL TO
+    "\u224C": "\u2245",  # ALL EQUAL TO
     "\u2252": "\u2253",  # APPROXIMATELY EQUAL TO OR THE IMAGE OF
     "\u2253": "\u2252",  # IMAGE OF OR APPROXIMATELY EQUAL TO
     "\u2254": "\u2255",  # COLON EQUALS
@@ -115,6 +123,7 @@ MIRRORED = {
     "\u22B5": "\u22B4",  # CONTAINS AS NORMAL SUBGROUP OR EQUAL TO
     "\u22B6": "\u22B7",  # ORIGINAL OF
     "\u22B7": "\u22B6",  # IMAGE OF
+    "\u22B8": "\u27DC",  # MULTIMAP
     "\u22C9": "\u22CA",  # LEFT NORMAL FACTOR SEMIDIRECT PRODUCT
     "\u22CA": "\u22C9",  # RIGHT NORMAL FACTOR SEMIDIRECT PRODUCT
     "\u22CB": "\u22CC",  # LEFT SEMIDIRECT PRODUCT
@@ -150,13 +159,17 @@ MIRRORED = {
     "\u22F0": "\u22F1",  # UP RIGHT DIAGONAL ELLIPSIS
     "\u22F1": "\u22F0",  # DOWN RIGHT DIAGONAL ELLIPSIS
     "\u22F2": "\u22FA",  # ELEMENT OF WITH LONG HORIZONTAL STROKE
-    "\u22F3": "\u22FB",  # ELEMENT OF WITH VERTICAL BAR AT END OF HORIZONTAL STROKE
-    "\u22F4": "\u22FC",  # SMALL ELEMENT OF WITH VERTICAL BAR AT END OF HORIZONTAL STROKE
+    # ELEMENT OF WITH VERTICAL BAR AT END OF HORIZONTAL STROKE
+    "\u22F3": "\u22FB",
+    # SMALL ELEMENT OF WITH VERTICAL BAR AT END OF HORIZONTAL STROKE
+    "\u22F4": "\u22FC",
     "\u22F6": "\u22FD",  # ELEMENT OF WITH OVERBAR
     "\u22F7": "\u22FE",  # SMALL ELEMENT OF WITH OVERBAR
     "\u22FA": "\u22F2",  # CONTAINS WITH LONG HORIZONTAL STROKE
-    "\u22FB": "\u22F3",  # CONTAINS WITH VERTICAL BAR AT END OF HORIZONTAL STROKE
-    "\u22FC": "\u22F4",  # SMALL CONTAINS WITH VERTICAL BAR AT END OF HORIZONTAL STROKE
+    # CONTAINS WITH VERTICAL BAR AT END OF HORIZONTAL STROKE
+    "\u22FB": "\u22F3",
+    # SMALL CONTAINS WITH VERTICAL BAR AT END OF HORIZONTAL STROKE
+    "\u22FC": "\u22F4",
     "\u22FD": "\u22F6",  # CONTAINS WITH OVERBAR
     "\u22FE": "\u22F7",  # SMALL CONTAINS WITH OVERBAR
     "\u2308": "\u2309",  # LEFT CEILING
@@ -185,8 +198,11 @@ MIRRORED = {
     "\u27C6": "\u27C5",  # RIGHT S-SHAPED BAG DELIMITER
     "\u27C8": "\u27C9",  # REVERSE SOLIDUS PRECEDING SUBSET
     "\u27C9": "\u27C8",  # SUPERSET PRECEDING SOLIDUS
+    "\u27CB": "\u27CD",  # MATHEMATICAL RISING DIAGONAL
+    "\u27CD": "\u27CB",  # MATHEMATICAL FALLING DIAGONAL
     "\u27D5": "\u27D6",  # LEFT OUTER JOIN
     "\u27D6": "\u27D5",  # RIGHT OUTER JOIN
+    "\u27DC": "\u22B8",  # LEFT MULTIMAP
     "\u27DD": "\u27DE",  # LONG RIGHT TACK
     "\u27DE": "\u27DD",  # LONG LEFT TACK
     "\u27E2": "\u27E3",  # WHITE CONCAVE-SIDED DIAMOND WITH LEFTWARDS TICK
@@ -225,6 +241,27 @@ MIRRORED = {
     "\u2996": "\u2995",  # DOUBLE RIGHT ARC LESS-THAN BRACKET
     "\u2997": "\u2998",  # LEFT BLACK TORTOISE SHELL BRACKET
     "\u2998": "\u2997",  # RIGHT BLACK TORTOISE SHELL BRACKET
+    "\u299B": "\u2221",  # MEASURED ANGLE OPENING LEFT
+    "\u29A0": "\u2222",  # SPHERICAL ANGLE OPENING LEFT
+    "\u29A3": "\u2220",  # REVERSED ANGLE
+    "\u29A4": "\u29A5",  # ANGLE WITH UNDERBAR
+    "\u29A5": "\u29A4",  # REVERSED ANGLE WITH UNDERBAR
+    # MEASURED ANGLE WITH OPEN ARM ENDING IN ARROW POINTING UP AND RIGHT
+    "\u29A8": "\u29A9",
+    # MEASURED ANGLE WITH OPEN ARM ENDING IN ARROW POINTING UP AND LEFT
+    "\u29A9": "\u29A8",
+    # MEASURED ANGLE WITH OPEN ARM ENDING IN ARROW POINTING DOWN AND RIGHT
+    "\u29AA": "\u29AB",
+    # MEASURED ANGLE WITH OPEN ARM ENDING IN ARROW POINTING DOWN AND LEFT
+    "\u29AB": "\u29AA",
+    # MEASURED ANGLE WITH OPEN ARM ENDING IN ARROW POINTING RIGHT AND UP
+    "\u29AC": "\u29AD",
+    # MEASURED ANGLE WITH OPEN ARM ENDING IN ARROW POINTING LEFT AND UP
+    "\u29AD": "\u29AC",
+    # MEASURED ANGLE WITH OPEN ARM ENDING IN ARROW POINTING RIGHT AND DOWN
+    "\u29AE": "\u29AF",
+    # MEASURED ANGLE WITH OPEN ARM ENDING IN ARROW POINTING LEFT AND DOWN
+    "\u29AF": "\u29AE",
     "\u29B8": "\u2298",  # CIRCLED REVERSE SOLIDUS
     "\u29C0": "\u29C1",  # CIRCLED LESS-THAN
     "\u29C1": "\u29C0",  # CIRCLED GREATER-THAN
@@ -240,6 +277,8 @@ MIRRORED = {
     "\u29D9": "\u29D8",  # RIGHT WIGGLY FENCE
     "\u29DA": "\u29DB",  # LEFT DOUBLE WIGGLY FENCE
     "\u29DB": "\u29DA",  # RIGHT DOUBLE WIGGLY FENCE
+    "\u29E8": "\u29E9",  # DOWN-POINTING TRIANGLE WITH LEFT HALF BLACK
+    "\u29E9": "\u29E8",  # DOWN-POINTING TRIANGLE WITH RIGHT HALF BLACK
     "\u29F5": "\u2215",  # REVERSE SOLIDUS OPERATOR
     "\u29F8": "\u29F9",  # BIG SOLIDUS
     "\u29F9": "\u29F8",  # BIG REVERSE SOLIDUS
@@ -257,6 +296,8 @@ MIRRORED = {
     "\u2A65": "\u2A64",  # Z NOTATION RANGE ANTIRESTRICTION
     "\u2A79": "\u2A7A",  # LESS-THAN WITH CIRCLE INSIDE
     "\u2A7A": "\u2A79",  # GREATER-THAN WITH CIRCLE INSIDE
+    "\u2A7B": "\u2A7C",  # [BEST FIT] LESS-THAN WITH QUESTION MARK ABOVE
+    "\u2A7C": "\u2A7B",  # [BEST FIT] GREATER-THAN WITH QUESTION MARK ABOVE
     "\u2A7D": "\u2A7E",  # LESS-THAN OR SLANTED EQUAL TO
     "\u2A7E": "\u2A7D",  # GREATER-THAN OR SLANTED EQUAL TO
     "\u2A7F": "\u2A80",  # LESS-THAN OR SLANTED EQUAL TO WITH DOT INSIDE
@@ -265,8 +306,20 @@ MIRRORED = {
     "\u2A82": "\u2A81",  # GREATER-THAN OR SLANTED EQUAL TO WITH DOT ABOVE
     "\u2A83": "\u2A84",  # LESS-THAN OR SLANTED EQUAL TO WITH DOT ABOVE RIGHT
     "\u2A84": "\u2A83",  # GREATER-THAN OR SLANTED EQUAL TO WITH DOT ABOVE LEFT
+    "\u2A85": "\u2A86",  # [BEST FIT] LESS-THAN OR APPROXIMATE
+    "\u2A86": "\u2A85",  # [BEST FIT] GREATER-THAN OR APPROXIMATE
+    "\u2A87": "\u2A88",  # [BEST FIT] LESS-THAN AND SINGLE-LINE NOT EQUAL TO
+    "\u2A88": "\u2A87",  # [BEST FIT] GREATER-THAN AND SINGLE-LINE NOT EQUAL TO
+    "\u2A89": "\u2A8A",  # [BEST FIT] LESS-THAN AND NOT APPROXIMATE
+    "\u2A8A": "\u2A89",  # [BEST FIT] GREATER-THAN AND NOT APPROXIMATE
     "\u2A8B": "\u2A8C",  # LESS-THAN ABOVE DOUBLE-LINE EQUAL ABOVE GREATER-THAN
     "\u2A8C": "\u2A8B",  # GREATER-THAN ABOVE DOUBLE-LINE EQUAL ABOVE LESS-THAN
+    "\u2A8D": "\u2A8E",  # [BEST FIT] LESS-THAN ABOVE SIMILAR OR EQUAL
+    "\u2A8E": "\u2A8D",  # [BEST FIT] GREATER-THAN ABOVE SIMILAR OR EQUAL
+    # [BEST FIT] LESS-THAN ABOVE SIMILAR ABOVE GREATER-THAN
+    "\u2A8F": "\u2A90",
+    # [BEST FIT] GREATER-THAN ABOVE SIMILAR ABOVE LESS-THAN
+    "\u2A90": "\u2A8F",
     "\u2A91": "\u2A92",  # LESS-THAN ABOVE GREATER-THAN ABOVE DOUBLE-LINE EQUAL
     "\u2A92": "\u2A91",  # GREATER-THAN ABOVE LESS-THAN ABOVE DOUBLE-LINE EQUAL
     # LESS-THAN ABOVE SLANTED EQUAL ABOVE GREATER-THAN ABOVE SLANTED EQUAL
@@ -281,6 +334,11 @@ MIRRORED = {
     "\u2A9A": "\u2A99",  # DOUBLE-LINE EQUAL TO OR GREATER-THAN
     "\u2A9B": "\u2A9C",  # DOUBLE-LINE SLANTED EQUAL TO OR LESS-THAN
     "\u2A9C": "\u2A9B",  # DOUBLE-LINE SLANTED EQUAL TO OR GREATER-THAN
+    "\u2A9D": "\u2A9E",  # [BEST FIT] SIMILAR OR LESS-THAN
+    "\u2A9E": "\u2A9D",  # [BEST FIT] SIMILAR OR GREATER-THAN
+    "\u2A9F": "\u2AA0",  # [BEST FIT] SIMILAR ABOVE LESS-THAN ABOVE EQUALS SIGN
+    # [BEST FIT] SIMILAR ABOVE GREATER-THAN ABOVE EQUALS SIGN
+    "\u2AA0": "\u2A9F",
     "\u2AA1": "\u2AA2",  # DOUBLE NESTED LESS-THAN
     "\u2AA2": "\u2AA1",  # DOUBLE NESTED GREATER-THAN
     "\u2AA6": "\u2AA7",  # LESS-THAN CLOSED BY CURVE
@@ -293,8 +351,16 @@ MIRRORED = {
     "\u2AAD": "\u2AAC",  # LARGER THAN OR EQUAL TO
     "\u2AAF": "\u2AB0",  # PRECEDES ABOVE SINGLE-LINE EQUALS SIGN
     "\u2AB0": "\u2AAF",  # SUCCEEDS ABOVE SINGLE-LINE EQUALS SIGN
+    "\u2AB1": "\u2AB2",  # [BEST FIT] PRECEDES ABOVE SINGLE-LINE NOT EQUAL TO
+    "\u2AB2": "\u2AB1",  # [BEST FIT] SUCCEEDS ABOVE SINGLE-LINE NOT EQUAL TO
     "\u2AB3": "\u2AB4",  # PRECEDES ABOVE EQUALS SIGN
     "\u2AB4": "\u2AB3",  # SUCCEEDS ABOVE EQUALS SIGN
+    "\u2AB5": "\u2AB6",  # [BEST FIT] PRECEDES ABOVE NOT EQUAL TO
+    "\u2AB6": "\u2AB5",  # [BEST FIT] SUCCEEDS ABOVE NOT EQUAL TO
+    "\u2AB7": "\u2AB8",  # [BEST FIT] PRECEDES ABOVE ALMOST EQUAL TO
+    "\u2AB8": "\u2AB7",  # [BEST FIT] SUCCEEDS ABOVE ALMOST EQUAL TO
+    "\u2AB9": "\u2ABA",  # [BEST FIT] PRECEDES ABOVE NOT ALMOST EQUAL TO
+    "\u2ABA": "\u2AB9",  # [BEST FIT] SUCCEEDS ABOVE NOT ALMOST EQUAL TO
     "\u2ABB": "\u2ABC",  # DOUBLE PRECEDES
     "\u2ABC": "\u2ABB",  # DOUBLE SUCCEEDS
     "\u2ABD": "\u2ABE",  # SUBSET WITH DOT
@@ -307,6 +373,12 @@ MIRRORED = {
     "\u2AC4": "\u2AC3",  # SUPERSET OF OR EQUAL TO WITH DOT ABOVE
     "\u2AC5": "\u2AC6",  # SUBSET OF ABOVE EQUALS SIGN
     "\u2AC6": "\u2AC5",  # SUPERSET OF ABOVE EQUALS SIGN
+    "\u2AC7": "\u2AC8",  # [BEST FIT] SUBSET OF ABOVE TILDE OPERATOR
+    "\u2AC8": "\u2AC7",  # [BEST FIT] SUPERSET OF ABOVE TILDE OPERATOR
+    "\u2AC9": "\u2ACA",  # [BEST FIT] SUBSET OF ABOVE ALMOST EQUAL TO
+    "\u2ACA": "\u2AC9",  # [BEST FIT] SUPERSET OF ABOVE ALMOST EQUAL TO
+    "\u2ACB": "\u2ACC",  # [BEST FIT] SUBSET OF ABOVE NOT EQUAL TO
+    "\u2ACC": "\u2ACB",  # [BEST FIT] SUPERSET OF ABOVE NOT EQUAL TO
     "\u2ACD": "\u2ACE",  # SQUARE LEFT OPEN BOX OPERATOR
     "\u2ACE": "\u2ACD",  # SQUARE RIGHT OPEN BOX OPERATOR
     "\u2ACF": "\u2AD0",  # CLOSED SUBSET
@@ -323,10 +395,12 @@ MIRRORED = {
     "\u2AE5": "\u22AB",  # DOUBLE VERTICAL BAR DOUBLE LEFT TURNSTILE
     "\u2AEC": "\u2AED",  # DOUBLE STROKE NOT SIGN
     "\u2AED": "\u2AEC",  # REVERSED DOUBLE STROKE NOT SIGN
+    "\u2AEE": "\u2224",  # DOES NOT DIVIDE WITH REVERSED NEGATION SLASH
     "\u2AF7": "\u2AF8",  # TRIPLE NESTED LESS-THAN
     "\u2AF8": "\u2AF7",  # TRIPLE NESTED GREATER-THAN
     "\u2AF9": "\u2AFA",  # DOUBLE-LINE SLANTED LESS-THAN OR EQUAL TO
     "\u2AFA": "\u2AF9",  # DOUBLE-LINE SLANTED GREATER-THAN OR EQUAL TO
+    "\u2BFE": "\u221F",  # REVERSED RIGHT ANGLE
     "\u2E02": "\u2E03",  # LEFT SUBSTITUTION BRACKET
     "\u2E03": "\u2E02",  # RIGHT SUBSTITUTION BRACKET
     "\u2E04": "\u2E05",  # LEFT DOTTED SUBSTITUTION BRACKET
@@ -347,6 +421,14 @@ MIRRORED = {
     "\u2E27": "\u2E26",  # RIGHT SIDEWAYS U BRACKET
     "\u2E28": "\u2E29",  # LEFT DOUBLE PARENTHESIS
     "\u2E29": "\u2E28",  # RIGHT DOUBLE PARENTHESIS
+    "\u2E55": "\u2E56",  # LEFT SQUARE BRACKET WITH STROKE
+    "\u2E56": "\u2E55",  # RIGHT SQUARE BRACKET WITH STROKE
+    "\u2E57": "\u2E58",  # LEFT SQUARE BRACKET WITH DOUBLE STROKE
+    "\u2E58": "\u2E57",  # RIGHT SQUARE BRACKET WITH DOUBLE STROKE
+    "\u2E59": "\u2E5A",  # TOP HALF LEFT PARENTHESIS
+    "\u2E5A": "\u2E59",  # TOP HALF RIGHT PARENTHESIS
+    "\u2E5B": "\u2E5C",  # BOTTOM HALF LEFT PARENTHESIS
+    "\u2E5C": "\u2E5B",  # BOTTOM HALF RIGHT PARENTHESIS
     "\u3008": "\u3009",  # LEFT ANGLE BRACKET
     "\u3009": "\u3008",  # RIGHT ANGLE BRACKET
     "\u300A": "\u300B",  # LEFT DOUBLE ANGLE BRACKET
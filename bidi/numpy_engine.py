@@ -0,0 +1,552 @@
+# This file is part of python-bidi
+#
+# python-bidi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Vectorized implementation of the algorithm, on NumPy arrays.
+
+For environments where NumPy is available but the Rust extension isn't.
+Texts are laid out as `bidi.algorithm` lays them out, working on arrays of
+the code points, class codes (see `bidi.classes`) and levels of the whole
+text. The rules are applied with array operations, in a few passes over
+the text each. Explicit embeddings and overrides are the exception, they
+are applied by a loop over the explicit formatting chars alone.
+
+Requires NumPy, which is not a dependency of python-bidi.
+"""
+
+from typing import Optional
+from unicodedata import mirrored
+
+import numpy as np
+
+from . import classes
+from .algorithm import (
+    EXPLICIT_LEVEL_LIMIT,
+    PARAGRAPH_LEVELS,
+    X2_X5_MAPPINGS,
+    X9_REMOVED,
+    StrOrBytes,
+    _is_displayed_as_is,
+    get_base_level,
+)
+from .cache import cached
+from .classes import (
+    AL,
+    AN,
+    B,
+    BN,
+    CS,
+    EN,
+    ES,
+    ET,
+    L,
+    NAMES,
+    NSM,
+    ON,
+    PDF,
+    R,
+    S,
+    WS,
+)
+from .mirror import MIRRORED
+
+__all__ = ["get_base_level", "get_display", "get_levels"]
+
+
+def _code_table(codes):
+    "Lookup table telling whether each class code is one of `codes`"
+    table = np.zeros(len(NAMES), dtype=bool)
+    table[list(codes)] = True
+    return table
+
+
+_IS_STRONG = _code_table((L, R, AL))
+_IS_EXPLICIT_OR_B = _code_table(set(X2_X5_MAPPINGS) | {PDF, B})
+_IS_REMOVED = _code_table(X9_REMOVED)
+_IS_NEUTRAL = _code_table((B, S, WS, ON))
+_IS_RESOLVED = _code_table((L, R, EN, AN))
+_IS_SEPARATOR = _code_table((B, S))
+_IS_WHITESPACE = _code_table((WS, BN))
+
+# I1 and I2, how much the level of a char goes up by level parity and type,
+# types other than those resolved follow AN and EN
+_IMPLICIT_RAISE = np.array(
+    [
+        [0 if code == L else 1 if code == R else 2 for code in range(len(NAMES))],
+        [0 if code == R else 1 for code in range(len(NAMES))],
+    ],
+    dtype=np.uint8,
+)
+
+# L4. The mirrored chars, sorted, and their mirrors
+_MIRRORS = sorted(
+    (ord(_ch), ord(mirror)) for _ch, mirror in MIRRORED.items() if mirrored(_ch)
+)
+_MIRRORED_CHARS = np.array([_ch for _ch, _ in _MIRRORS], dtype=np.uint32)
+_MIRROR_CHARS = np.array([mirror for _, mirror in _MIRRORS], dtype=np.uint32)
+
+# copy of the blocks of the lookup table, updated when blocks are added
+_blocks = (None, np.zeros(0, dtype=np.uint8))
+
+
+def _classify(code_points):
+    """Codes of the classes of `code_points`, looked up in the two-stage
+    table of `bidi.classes`, building its missing blocks first."""
+    global _blocks
+
+    table = classes._table
+    index = np.frombuffer(table.index, dtype=np.uint16)
+    block_idx = code_points >> classes._BLOCK_SHIFT
+
+    unbuilt = index[block_idx] == classes._UNBUILT
+    if unbuilt.any():
+        for idx in np.unique(block_idx[unbuilt]).tolist():
+            table._build_block(idx)
+
+    source, blocks = _blocks
+    if source is not table or len(blocks) != len(table.blocks):
+        blocks = np.frombuffer(bytes(table.blocks), dtype=np.uint8)
+        _blocks = (table, blocks)
+
+    block_ids = index[block_idx].astype(np.intp)
+    offsets = code_points & classes._BLOCK_MASK
+    return blocks[(block_ids << classes._BLOCK_SHIFT) | offsets]
+
+
+def _positions(size):
+    "The indices of an array of `size`, as narrow as they can be"
+    return np.arange(size, dtype=np.int32 if size < 1 << 31 else np.intp)
+
+
+def _fill_forward(values, mask):
+    "Sets each value to the last one, at or before it, where `mask` is set"
+    positions = np.where(mask, _positions(len(values)), 0)
+    np.maximum.accumulate(positions, out=positions)
+    return values[positions]
+
+
+def _fill_backward(values, mask):
+    "Sets each value to the first one, at or after it, where `mask` is set"
+    size = len(values)
+    positions = np.where(mask, _positions(size), size - 1)[::-1]
+    np.minimum.accumulate(positions, out=positions)
+    return values[positions[::-1]]
+
+
+def _direction(levels):
+    "Embedding direction of `levels`, L if even and R if odd"
+    return np.where(levels % 2 == 1, R, L).astype(np.uint8)
+
+
+def _base_levels(types, is_break, base_dir):
+    """P2 and P3, the base level of the paragraph of each char, or the one
+    of `base_dir` for all of them."""
+    if base_dir is not None:
+        return np.full(len(types), PARAGRAPH_LEVELS[base_dir], dtype=np.uint8)
+
+    paragraphs = np.cumsum(is_break) - is_break
+    starts = np.flatnonzero(np.concatenate(([True], is_break[:-1])))
+    strong = np.flatnonzero(_IS_STRONG[types])
+
+    # first strong char at or after the start of each paragraph, if it is
+    # still in the paragraph
+    first = np.searchsorted(strong, starts)
+    found = np.flatnonzero(first < len(strong))
+    first_strong = strong[first[found]]
+    found_in_paragraph = paragraphs[first_strong] == found
+
+    levels = np.zeros(len(starts), dtype=np.uint8)
+    levels[found[found_in_paragraph]] = types[first_strong[found_in_paragraph]] != L
+    return levels[paragraphs]
+
+
+def _explicit_levels(types, levels, base_levels):
+    """X1 to X8, in place, char by char for the explicit formatting chars
+    and paragraph separators, and a slice at a time in between."""
+    overflow_counter = almost_overflow_counter = 0
+    directional_override = None
+    stack = []
+    embedding_level = int(base_levels[0])
+    size = len(types)
+    start = 0
+
+    for idx in np.flatnonzero(_IS_EXPLICIT_OR_B[types]).tolist():
+        # X6, for the chars since the previous formatting char
+        if start < idx:
+            levels[start:idx] = embedding_level
+            if directional_override is not None:
+                segment = types[start:idx]
+                segment[segment != BN] = directional_override
+        start = idx + 1
+
+        bidi_type = int(types[idx])
+        level_func, override = X2_X5_MAPPINGS.get(bidi_type, (None, None))
+
+        if level_func:
+            if overflow_counter != 0:
+                overflow_counter += 1
+                continue
+
+            new_level = level_func(embedding_level)
+            if new_level < EXPLICIT_LEVEL_LIMIT:
+                stack.append((embedding_level, directional_override))
+                embedding_level, directional_override = new_level, override
+            elif embedding_level == EXPLICIT_LEVEL_LIMIT - 2:
+                almost_overflow_counter += 1
+            else:
+                overflow_counter += 1
+
+        # X7
+        elif bidi_type == PDF:
+            if overflow_counter:
+                overflow_counter -= 1
+            elif (
+                almost_overflow_counter
+                and embedding_level != EXPLICIT_LEVEL_LIMIT - 1
+            ):
+                almost_overflow_counter -= 1
+            elif stack:
+                embedding_level, directional_override = stack.pop()
+
+        # X8, the next paragraph starts at its own base level
+        else:
+            stack.clear()
+            overflow_counter = almost_overflow_counter = 0
+            directional_override = None
+            if idx + 1 < size:
+                embedding_level = int(base_levels[idx + 1])
+
+    if start < size:
+        levels[start:] = embedding_level
+        if directional_override is not None:
+            segment = types[start:]
+            segment[segment != BN] = directional_override
+
+
+def _resolve_weak_types(types, run_starts, run_ends, sor):
+    "W1 to W7, for the level runs starting at `run_starts`"
+
+    # W1. NSMs take the type of the previous char, sor at the run start
+    nsm = types == NSM
+    if nsm.any():
+        types = np.where(nsm & run_starts, sor, types)
+        types = _fill_forward(types, types != NSM)
+
+    # W2. European numbers following AL change to Arabic numbers
+    strong = _IS_STRONG[types]
+    last_strong = _fill_forward(np.where(strong, types, sor), strong | run_starts)
+    types = np.where((types == EN) & (last_strong == AL), AN, types)
+
+    # W3. AL changes to R
+    types[types == AL] = R
+
+    # W4. A single European separator between two European numbers, or
+    # common separator between two numbers of the same type, changes to
+    # their type
+    resolved = types.copy()
+    if len(types) > 2:
+        prev_types, curr_types, next_types = types[:-2], types[1:-1], types[2:]
+        single = (
+            ((curr_types == ES) | (curr_types == CS))
+            & ~run_starts[1:-1]
+            & ~run_ends[1:-1]
+            & (prev_types == next_types)
+            & ((prev_types == EN) | ((curr_types == CS) & (prev_types == AN)))
+        )
+        resolved[1:-1][single] = prev_types[single]
+
+    # W5. Sequences of European terminators next to European numbers (in
+    # the same level run) change to European numbers, W6 to Other Neutral
+    # otherwise
+    terminators = resolved == ET
+    if terminators.any():
+        # the chars before and after each sequence, or its own first and
+        # last terminators at the run ends
+        positions = _positions(len(types))
+        before = _fill_forward(positions, ~terminators | run_starts)
+        after = _fill_backward(positions, ~terminators | run_ends)
+        en_adjacent = (resolved[before] == EN) | (resolved[after] == EN)
+        resolved[terminators] = np.where(en_adjacent[terminators], EN, ON)
+
+    # W6. Remaining separators change to Other Neutral
+    resolved[(resolved == ES) | (resolved == CS)] = ON
+
+    # W7. European numbers following L change to L
+    strong = (types == L) | (types == R)
+    last_strong = _fill_forward(np.where(strong, types, sor), strong | run_starts)
+    resolved[(resolved == EN) & (last_strong == L)] = L
+
+    return resolved
+
+
+def _resolve_neutral_types(types, levels, run_starts, run_ends, sor, eor):
+    "N1 and N2, for the level runs starting at `run_starts`"
+
+    neutral = _IS_NEUTRAL[types]
+    if not neutral.any():
+        return types
+
+    # N1. Numbers act as R
+    strong = np.where((types == EN) | (types == AN), R, types).astype(np.uint8)
+    before = _fill_forward(np.where(neutral, sor, strong), ~neutral | run_starts)
+    after = _fill_backward(np.where(neutral, eor, strong), ~neutral | run_ends)
+
+    # N2. Otherwise the embedding direction
+    resolved = np.where(before == after, before, _direction(levels))
+    return np.where(neutral, resolved, types).astype(np.uint8)
+
+
+def _visual_order(levels, is_break):
+    """L2 for each line, ending with a paragraph separator, as the logical
+    indices of the chars in visual order.
+
+    Rather than reversing sequences of chars, each level from the highest
+    to the lowest odd one moves the chars at that level or higher to their
+    mirrored position in the sequence, a permutation computed for the whole
+    text at once.
+    """
+    size = len(levels)
+    lines = np.cumsum(is_break) - is_break
+    line_starts = np.flatnonzero(np.concatenate(([True], is_break[:-1])))
+
+    # the separator counts for the lowest odd level of its line
+    odd_levels = np.where(levels % 2 == 1, levels, EXPLICIT_LEVEL_LIMIT)
+    lowest_odd = np.minimum.reduceat(odd_levels, line_starts)[lines]
+
+    # separators are never moved, which keeps the chars in their lines
+    current = np.where(is_break, -1, levels.astype(np.int16))
+    order = _positions(size)
+    positions = _positions(size)
+
+    for level in range(int(current.max()), int(lowest_odd.min()) - 1, -1):
+        reversed_ = (current >= level) & (lowest_odd <= level)
+        if not reversed_.any():
+            continue
+
+        starts = reversed_ & ~np.concatenate(([False], reversed_[:-1]))
+        ends = reversed_ & ~np.concatenate((reversed_[1:], [False]))
+        first = _fill_forward(positions, starts)
+        last = _fill_backward(positions, ends)
+        moved = np.where(reversed_, first + last - positions, positions)
+
+        order = order[moved]
+        current = current[moved]
+
+    return order
+
+
+def _resolve_levels(text, upper_is_rtl, base_dir):
+    """Runs the algorithm on `text` up to L1, returning the code points of
+    the chars left by X9, with their levels and whether they are paragraph
+    separators, which chars were left and the paragraph levels of all"""
+
+    code_points = np.frombuffer(
+        text.encode("utf-32-le", "surrogatepass"), dtype="<u4"
+    ).astype(np.uint32)
+    orig_types = _classify(code_points)
+
+    if upper_is_rtl:
+        upper = np.fromiter((_ch.isupper() for _ch in text), bool, len(text))
+        orig_types[upper] = R
+
+    # P1, paragraphs end with their separator
+    is_break = orig_types == B
+    base_levels = _base_levels(orig_types, is_break, base_dir)
+
+    types = orig_types.copy()
+    levels = base_levels.copy()
+    if (_IS_EXPLICIT_OR_B[types] & ~is_break).any():
+        _explicit_levels(types, levels, base_levels)
+
+    # X9
+    paragraph_levels = base_levels
+    kept = ~_IS_REMOVED[types]
+    if not kept.all():
+        code_points, orig_types = code_points[kept], orig_types[kept]
+        types, levels = types[kept], levels[kept]
+        base_levels, is_break = base_levels[kept], is_break[kept]
+
+    size = len(types)
+    if not size:
+        return code_points, levels, is_break, kept, paragraph_levels
+
+    # X10. Level runs, which also end with paragraphs, and their sor and eor
+    run_starts = np.ones(size, dtype=bool)
+    run_starts[1:] = (levels[1:] != levels[:-1]) | is_break[:-1]
+    run_ends = np.ones(size, dtype=bool)
+    run_ends[:-1] = run_starts[1:]
+
+    # the levels next to each char, the paragraph level past its ends
+    paragraph_starts = np.concatenate(([True], is_break[:-1]))
+    paragraph_ends = np.concatenate((is_break[:-1], [True]))
+    prev_levels = np.where(paragraph_starts, base_levels, np.roll(levels, 1))
+    next_levels = np.where(paragraph_ends, base_levels, np.roll(levels, -1))
+    sor = _fill_forward(_direction(np.maximum(levels, prev_levels)), run_starts)
+    eor = _fill_backward(_direction(np.maximum(levels, next_levels)), run_ends)
+
+    types = _resolve_weak_types(types, run_starts, run_ends, sor)
+    types = _resolve_neutral_types(types, levels, run_starts, run_ends, sor, eor)
+
+    # only those types are allowed at this stage
+    unresolved = ~_IS_RESOLVED[types]
+    if unresolved.any():
+        names = sorted(NAMES[code] for code in np.unique(types[unresolved]))
+        raise AssertionError("{} not allowed here".format(", ".join(names)))
+
+    # I1 and I2
+    levels = levels + _IMPLICIT_RAISE[levels % 2, types]
+
+    # L1. Separators, and whitespace before them or at the end of the text,
+    # are reset to the paragraph level
+    separators = _IS_SEPARATOR[orig_types]
+    whitespace = _IS_WHITESPACE[orig_types]
+    followed_by_separator = _fill_backward(
+        np.concatenate((separators, [True])), np.concatenate((~whitespace, [True]))
+    )[:-1]
+    reset = separators | (whitespace & followed_by_separator)
+    levels[reset] = base_levels[reset]
+
+    return code_points, levels, is_break, kept, paragraph_levels
+
+
+def _layout(text, upper_is_rtl, base_dir):
+    "The display of `text`"
+
+    code_points, levels, is_break, _, _ = _resolve_levels(
+        text, upper_is_rtl, base_dir
+    )
+    if not len(code_points):
+        return ""
+
+    # L2
+    order = _visual_order(levels, is_break)
+    code_points = code_points[order]
+
+    # L4
+    odd = np.flatnonzero(levels[order] % 2 == 1)
+    if len(odd):
+        chars = code_points[odd]
+        mirror_idx = np.minimum(
+            np.searchsorted(_MIRRORED_CHARS, chars), len(_MIRRORED_CHARS) - 1
+        )
+        is_mirrored = _MIRRORED_CHARS[mirror_idx] == chars
+        code_points[odd[is_mirrored]] = _MIRROR_CHARS[mirror_idx[is_mirrored]]
+
+    return code_points.astype("<u4").tobytes().decode("utf-32-le", "surrogatepass")
+
+
+def _levels(text, upper_is_rtl, base_dir):
+    """The levels of the chars of `text` up to L1, those removed by X9 at
+    the level of the char before them, or their paragraph's at its start"""
+
+    _, levels, is_break, kept, paragraph_levels = _resolve_levels(
+        text, upper_is_rtl, base_dir
+    )
+    if kept.all():
+        return levels.tobytes()
+
+    # paragraph separators are never removed
+    breaks = np.zeros(len(kept), dtype=bool)
+    breaks[kept] = is_break
+    paragraph_starts = np.concatenate(([True], breaks[:-1]))
+
+    all_levels = paragraph_levels.copy()
+    all_levels[kept] = levels
+    return _fill_forward(all_levels, kept | paragraph_starts).tobytes()
+
+
+def get_display(
+    str_or_bytes: StrOrBytes,
+    encoding: str = "utf-8",
+    upper_is_rtl: bool = False,
+    base_dir: Optional[str] = None,
+) -> StrOrBytes:
+    """Accepts `str` or `bytes`, like `bidi.algorithm.get_display`, and
+    returns the same display layout.
+
+    Results are cached once `bidi.enable_cache()` is called.
+    """
+    return cached(
+        "numpy",
+        "get_display",
+        str_or_bytes,
+        encoding,
+        (upper_is_rtl, base_dir),
+        lambda: _get_display(str_or_bytes, encoding, upper_is_rtl, base_dir),
+    )
+
+
+def _get_display(
+    str_or_bytes: StrOrBytes,
+    encoding: str,
+    upper_is_rtl: bool,
+    base_dir: Optional[str],
+) -> StrOrBytes:
+    if isinstance(str_or_bytes, bytes):
+        text = str_or_bytes.decode(encoding)
+        was_decoded = True
+    else:
+        text = str_or_bytes
+        was_decoded = False
+
+    if _is_displayed_as_is(text, upper_is_rtl, base_dir, False):
+        return str_or_bytes
+
+    display = _layout(text, upper_is_rtl, base_dir)
+
+    if display == text:
+        return str_or_bytes
+
+    if was_decoded:
+        display = display.encode(encoding)
+
+    return display
+
+
+def get_levels(
+    str_or_bytes: StrOrBytes,
+    encoding: str = "utf-8",
+    upper_is_rtl: bool = False,
+    base_dir: Optional[str] = None,
+) -> bytes:
+    """Returns the same levels as `bidi.algorithm.get_levels`, one byte per
+    char, without reordering.
+
+    Results are cached once `bidi.enable_cache()` is called.
+    """
+    return cached(
+        "numpy",
+        "get_levels",
+        str_or_bytes,
+        encoding,
+        (upper_is_rtl, base_dir),
+        lambda: _get_levels(str_or_bytes, encoding, upper_is_rtl, base_dir),
+    )
+
+
+def _get_levels(
+    str_or_bytes: StrOrBytes,
+    encoding: str,
+    upper_is_rtl: bool,
+    base_dir: Optional[str],
+) -> bytes:
+    if isinstance(str_or_bytes, bytes):
+        text = str_or_bytes.decode(encoding)
+    else:
+        text = str_or_bytes
+
+    if _is_displayed_as_is(text, upper_is_rtl, base_dir, False):
+        return bytes(len(text))
+
+    return _levels(text, upper_is_rtl, base_dir)
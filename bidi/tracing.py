@@ -0,0 +1,145 @@
+# This file is part of python-bidi
+#
+# python-bidi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Per-phase tracing of the Python implementation.
+
+A tracer is any callable set with `bidi.algorithm.set_tracer`. It is called
+with a `PhaseTrace` after each phase of the algorithm, for each batch of
+paragraphs laid out, from the thread laying them out. `PhaseProfiler` adds
+up the traces of many calls, `DebugTracer` writes them out as `debug` does.
+"""
+
+import sys
+import threading
+from typing import Dict, List, NamedTuple, Optional, TextIO
+
+from .classes import NAMES
+
+
+class Snapshot(NamedTuple):
+    """The chars left by X9 after a phase, with their levels and types, in
+    logical order up to the reordering and visual order after it."""
+
+    chars: str
+    levels: bytes
+    types: bytes
+
+
+class PhaseTrace(NamedTuple):
+    """A phase run on a batch of paragraphs: its name, the elapsed wall
+    clock and thread CPU times in seconds, the number of chars and of runs
+    of chars of the same type in storage after it, the base level of the
+    paragraphs and a `Snapshot` when asked for."""
+
+    phase: str
+    wall_time: float
+    cpu_time: float
+    chars: int
+    runs: int
+    base_level: int
+    snapshot: Optional[Snapshot]
+
+
+class PhaseStats(NamedTuple):
+    """Totals of the traces of a phase."""
+
+    calls: int
+    chars: int
+    runs: int
+    wall_time: float
+    cpu_time: float
+
+
+class PhaseProfiler:
+    """Tracer adding up the traces of each phase, across calls and threads.
+
+    >>> profiler = PhaseProfiler()
+    >>> bidi.algorithm.set_tracer(profiler)
+    >>> ...
+    >>> print(profiler.report())
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals: Dict[str, List] = {}
+
+    def __call__(self, trace: PhaseTrace) -> None:
+        with self._lock:
+            totals = self._totals.get(trace.phase)
+            if totals is None:
+                totals = self._totals[trace.phase] = [0, 0, 0, 0.0, 0.0]
+            totals[0] += 1
+            totals[1] += trace.chars
+            totals[2] += trace.runs
+            totals[3] += trace.wall_time
+            totals[4] += trace.cpu_time
+
+    def stats(self) -> Dict[str, PhaseStats]:
+        """The totals of each phase, in the order the phases run."""
+        with self._lock:
+            return {
+                phase: PhaseStats(*totals) for phase, totals in self._totals.items()
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._totals.clear()
+
+    def report(self) -> str:
+        """A table of the totals of each phase and of its share of the
+        wall clock time."""
+        stats = self.stats()
+        total_time = sum(phase.wall_time for phase in stats.values()) or 1.0
+
+        lines = [
+            f"{'phase':42}{'calls':>8}{'chars':>12}{'wall ms':>12}"
+            f"{'cpu ms':>12}{'%':>7}"
+        ]
+        for name, phase in stats.items():
+            lines.append(
+                f"{name:42}{phase.calls:8}{phase.chars:12}"
+                f"{phase.wall_time * 1000:12.3f}{phase.cpu_time * 1000:12.3f}"
+                f"{phase.wall_time * 100 / total_time:7.1f}"
+            )
+        return "\n".join(lines)
+
+
+class DebugTracer:
+    """Tracer writing the levels and types of the chars after each phase
+    to `stream` (default: sys.stderr). Needs snapshots."""
+
+    def __init__(self, stream: Optional[TextIO] = None):
+        self.stream = stream
+
+    def __call__(self, trace: PhaseTrace) -> None:
+        stream = self.stream or sys.stderr
+        snapshot = trace.snapshot
+
+        stream.write(
+            f"in {trace.phase} ({trace.wall_time * 1000:.3f} ms, "
+            f"{trace.chars} chars, {trace.runs} runs)\n"
+        )
+        stream.write(f"  base level  : {trace.base_level}\n")
+        if snapshot is None:
+            return
+
+        stream.write(f"  Chars       : {snapshot.chars}\n")
+        levels = "".join([str(level) for level in snapshot.levels])
+        stream.write(f"  Res. levels : {levels}\n")
+
+        types = [NAMES[bidi_type].ljust(3) for bidi_type in snapshot.types]
+        for i in range(3):
+            output = "                %s\n" if i else "  Res. types  : %s\n"
+            stream.write(output % "".join([_t[i] for _t in types]))
@@ -1,11 +1,59 @@
 """Provides a wrpper for the Rust based implementation."""
 
-from typing import Optional, Union
+import codecs
+from typing import Iterable, List, NamedTuple, Optional, Sequence, Tuple, Union
 
-from .bidi import get_base_level_inner, get_display_inner
+from .bidi import (
+    fast_path_stats_inner,
+    get_base_level_inner,
+    get_base_level_many_inner,
+    get_display_inner,
+    get_display_lines_inner,
+    get_display_many_inner,
+    get_display_utf8_inner,
+    get_index_maps_inner,
+    get_levels_and_classes_inner,
+    get_levels_inner,
+    get_visual_runs_inner,
+    reset_fast_path_stats_inner,
+    set_fast_path_stats_inner,
+)
+from .cache import cached
 
 StrOrBytes = Union[str, bytes]
 
+
+class FastPathStats(NamedTuple):
+    """Numbers of texts laid out through the fast path, i.e. left as is
+    without running the algorithm as they have no RTL chars, and through the
+    full algorithm."""
+
+    hits: int
+    misses: int
+
+
+class LevelsAndClasses(NamedTuple):
+    """The embedding levels and the bidi classes (numbered as in
+    `bidi.classes`) of the chars of a text, as read-only memoryviews of one
+    byte per char."""
+
+    levels: memoryview
+    classes: memoryview
+
+
+class IndexMaps(NamedTuple):
+    """The visual position of each char of a text, in logical order, and the
+    logical position of each char shown, in visual order. Read-only
+    memoryviews of unsigned ints (format `I`)."""
+
+    logical_to_visual: memoryview
+    visual_to_logical: memoryview
+
+
+def _is_utf8(encoding: str) -> bool:
+    return codecs.lookup(encoding).name == "utf-8"
+
+
 def get_display(
     str_or_bytes: StrOrBytes,
     encoding: str = "utf-8",
@@ -20,9 +68,38 @@ def get_display(
     Set `debug` to True to return the calculated levels.
 
     Returns the display layout, either as unicode or `encoding` encoded
-    string.
+    string. When laying out doesn't change the text, `str_or_bytes` itself
+    is returned.
+
+    UTF-8 encoded input may be any bytes-like object (bytearray, memoryview,
+    mmap...), it is laid out natively without decoding and returned as bytes.
+
+    Results are cached once `bidi.enable_cache()` is called, unless `debug`
+    is set.
 
     """
+    if debug:
+        return _get_display(str_or_bytes, encoding, base_dir, debug)
+
+    return cached(
+        "rust",
+        "get_display",
+        str_or_bytes,
+        encoding,
+        (base_dir,),
+        lambda: _get_display(str_or_bytes, encoding, base_dir, debug),
+    )
+
+
+def _get_display(
+    str_or_bytes: StrOrBytes,
+    encoding: str,
+    base_dir: Optional[str],
+    debug: bool,
+) -> StrOrBytes:
+    if not (isinstance(str_or_bytes, str) or debug) and _is_utf8(encoding):
+        return get_display_utf8_inner(str_or_bytes, base_dir)
+
     if isinstance(str_or_bytes, bytes):
         text = str_or_bytes.decode(encoding)
         was_decoded = True
@@ -32,15 +109,260 @@ def get_display(
 
     display = get_display_inner(text, base_dir, debug)
 
+    if display is text:
+        return str_or_bytes
+
     if was_decoded:
         display = display.encode(encoding)
 
     return display
 
 
+def get_display_lines(
+    str_or_bytes: StrOrBytes,
+    line_breaks: Sequence[int],
+    encoding: str = "utf-8",
+    base_dir: Optional[str] = None,
+) -> List[StrOrBytes]:
+    """Returns the display layout of each line of `str_or_bytes`, wrapped
+    into lines ending at the sorted `line_breaks` offsets in chars (code
+    points). Bytes are decoded with `encoding` first, and the lines encoded
+    back.
+
+    The text is analysed once, each line is then reordered on its own with
+    the levels resolved in the context of its whole paragraph, which laying
+    out each line with `get_display` loses.
+
+    Set `base_dir` to 'L' or 'R' to override the calculated base_level.
+    """
+    if isinstance(str_or_bytes, bytes):
+        text = str_or_bytes.decode(encoding)
+    else:
+        text = str_or_bytes
+
+    line_breaks = list(line_breaks)
+    display = get_display_lines_inner(text, line_breaks, base_dir)
+
+    # reordering keeps each line in place
+    offsets = [0, *line_breaks, len(display)]
+    lines = [display[start:end] for start, end in zip(offsets, offsets[1:])]
+
+    if isinstance(str_or_bytes, bytes):
+        return [line.encode(encoding) for line in lines]
+    return lines
+
+
+def get_levels(
+    str_or_bytes: StrOrBytes,
+    encoding: str = "utf-8",
+    base_dir: Optional[str] = None,
+) -> bytes:
+    """Returns the embedding levels of the chars of `str_or_bytes`, one byte
+    per char (code point) in logical order, with each paragraph taken as a
+    single line. The levels are those laying it out would reorder by, after
+    rule L1, but nothing is reordered or mirrored.
+
+    Bytes are decoded with `encoding` first. Set `base_dir` to 'L' or 'R' to
+    override the calculated base_level.
+
+    Results are cached once `bidi.enable_cache()` is called.
+    """
+    return cached(
+        "rust",
+        "get_levels",
+        str_or_bytes,
+        encoding,
+        (base_dir,),
+        lambda: _get_levels(str_or_bytes, encoding, base_dir),
+    )
+
+
+def _get_levels(
+    str_or_bytes: StrOrBytes, encoding: str, base_dir: Optional[str]
+) -> bytes:
+    if isinstance(str_or_bytes, bytes):
+        text = str_or_bytes.decode(encoding)
+    else:
+        text = str_or_bytes
+
+    return get_levels_inner(text, base_dir)
+
+
+def get_levels_and_classes(
+    str_or_bytes: StrOrBytes,
+    encoding: str = "utf-8",
+    base_dir: Optional[str] = None,
+) -> LevelsAndClasses:
+    """Returns the embedding levels of the chars of `str_or_bytes`, as
+    `get_levels` does, and their original bidi classes.
+
+    Both are memoryviews of arrays held by the Rust extension, not copied
+    into Python objects, e.g. for `numpy.frombuffer`.
+    """
+    return cached(
+        "rust",
+        "get_levels_and_classes",
+        str_or_bytes,
+        encoding,
+        (base_dir,),
+        lambda: _get_levels_and_classes(str_or_bytes, encoding, base_dir),
+    )
+
+
+def _get_levels_and_classes(
+    str_or_bytes: StrOrBytes, encoding: str, base_dir: Optional[str]
+) -> LevelsAndClasses:
+    if isinstance(str_or_bytes, bytes):
+        text = str_or_bytes.decode(encoding)
+    else:
+        text = str_or_bytes
+
+    levels, classes = get_levels_and_classes_inner(text, base_dir)
+    return LevelsAndClasses(memoryview(levels), memoryview(classes))
+
+
+def get_index_maps(
+    str_or_bytes: StrOrBytes,
+    encoding: str = "utf-8",
+    base_dir: Optional[str] = None,
+) -> IndexMaps:
+    """Returns the maps between the logical and the visual positions of the
+    chars (code points) of `str_or_bytes`, laid out as `get_display` does
+    with each paragraph taken as a single line, e.g. to move a caret or
+    extend a selection.
+
+    Bytes are decoded with `encoding` first, the positions are those of the
+    decoded str. Set `base_dir` to 'L' or 'R' to override the calculated
+    base_level.
+
+    Results are cached once `bidi.enable_cache()` is called.
+    """
+    return cached(
+        "rust",
+        "get_index_maps",
+        str_or_bytes,
+        encoding,
+        (base_dir,),
+        lambda: _get_index_maps(str_or_bytes, encoding, base_dir),
+    )
+
+
+def _get_index_maps(
+    str_or_bytes: StrOrBytes, encoding: str, base_dir: Optional[str]
+) -> IndexMaps:
+    if isinstance(str_or_bytes, bytes):
+        text = str_or_bytes.decode(encoding)
+    else:
+        text = str_or_bytes
+
+    to_visual, to_logical = get_index_maps_inner(text, base_dir)
+    return IndexMaps(memoryview(to_visual).cast("I"), memoryview(to_logical).cast("I"))
+
+
+def get_visual_runs(
+    str_or_bytes: StrOrBytes,
+    encoding: str = "utf-8",
+    base_dir: Optional[str] = None,
+    line_breaks: Optional[Sequence[int]] = None,
+) -> List[Tuple[int, int, int]]:
+    """Returns the runs of chars at the same embedding level of
+    `str_or_bytes`, as `(start, end, level)` tuples with offsets in chars
+    (code points), without building the reordered text. Runs at odd levels are
+    drawn right to left.
+
+    The runs are listed line by line, and in visual order within each line.
+    A line ends with its paragraph, or at each of the sorted `line_breaks`
+    offsets.
+
+    Bytes are decoded with `encoding` first, the offsets are those of the
+    decoded str. Set `base_dir` to 'L' or 'R' to override the calculated
+    base_level.
+    """
+    if isinstance(str_or_bytes, bytes):
+        text = str_or_bytes.decode(encoding)
+    else:
+        text = str_or_bytes
+
+    return get_visual_runs_inner(text, base_dir, line_breaks)
+
+
 def get_base_level(text: str) -> int:
     """Returns the base unicode level of the 1st paragraph in `text`.
 
     Return value of 0 means LTR, while 1 means RTL.
     """
-    return get_base_level_inner(text)
+    return cached(
+        "rust", "get_base_level", text, None, (), lambda: get_base_level_inner(text)
+    )
+
+
+def get_display_many(
+    texts: Iterable[StrOrBytes],
+    encoding: str = "utf-8",
+    base_dir: Optional[str] = None,
+    dedupe: bool = False,
+    chunk_size: Optional[int] = None,
+) -> List[StrOrBytes]:
+    """Like `get_display`, for many strings or bytes in one call.
+
+    The texts are laid out in parallel, without holding the GIL, on a pool
+    of threads sized to the machine. Results are returned in input order,
+    bytes are decoded and encoded back using `encoding`. Texts left unchanged
+    by laying out are returned as is.
+
+    Set `dedupe` to True to lay out repeated texts only once per batch.
+
+    Set `chunk_size` to the number of texts handed to a worker at a time
+    (default: spread the batch evenly across the workers).
+
+    """
+    originals = list(texts)
+    was_decoded = [isinstance(text, bytes) for text in originals]
+
+    if not any(was_decoded):
+        return get_display_many_inner(originals, base_dir, dedupe, chunk_size)
+
+    texts = [
+        text.decode(encoding) if decoded else text
+        for text, decoded in zip(originals, was_decoded)
+    ]
+    displays = get_display_many_inner(texts, base_dir, dedupe, chunk_size)
+
+    for idx, decoded in enumerate(was_decoded):
+        if decoded:
+            display = displays[idx]
+            if display is texts[idx]:
+                displays[idx] = originals[idx]
+            else:
+                displays[idx] = display.encode(encoding)
+
+    return displays
+
+
+def get_base_level_many(
+    texts: Iterable[str], chunk_size: Optional[int] = None
+) -> List[int]:
+    """Like `get_base_level`, for many strings in one call, computed in
+    parallel without holding the GIL.
+
+    Raises ValueError if one of the texts contains no paragraphs.
+    """
+    return get_base_level_many_inner(list(texts), chunk_size)
+
+
+def set_fast_path_stats(enabled: bool = True) -> None:
+    """Starts (or with `enabled` False stops) counting how many texts take
+    the fast path. Counting is off by default, it covers every layout and
+    base level computed by this module, in all threads.
+    """
+    set_fast_path_stats_inner(enabled)
+
+
+def fast_path_stats() -> FastPathStats:
+    """Returns the fast path hits and misses counted so far."""
+    return FastPathStats(*fast_path_stats_inner())
+
+
+def reset_fast_path_stats() -> None:
+    """Sets the fast path counts back to zero."""
+    reset_fast_path_stats_inner()
@@ -0,0 +1,5 @@
+fn main() {
+    // cfgs like PyPy and Py_LIMITED_API, to tell where CPython internals
+    // (such as the PEP 393 str storage) are available
+    pyo3_build_config::use_pyo3_cfgs();
+}
@@ -0,0 +1,86 @@
+//! Arrays computed in Rust handed to Python without copying them.
+//!
+//! `ByteBuffer` owns the vector and exports its bytes through the buffer
+//! protocol, so `memoryview`, `bytes` or `numpy.frombuffer` read it in place.
+//! Arrays of wider integers are cast back to their item type on the Python
+//! side, e.g. with `memoryview.cast("I")`.
+
+use std::os::raw::{c_int, c_void};
+
+use pyo3::ffi;
+use pyo3::prelude::*;
+
+enum Data {
+    U8(Vec<u8>),
+    /// In native byte order
+    U32(Vec<u32>),
+}
+
+/// Read-only buffer of unsigned bytes (format `B`).
+#[pyclass(frozen, module = "bidi.bidi")]
+pub struct ByteBuffer {
+    data: Data,
+}
+
+impl ByteBuffer {
+    fn as_bytes(&self) -> &[u8] {
+        match &self.data {
+            Data::U8(data) => data,
+            // SAFETY: any u32 is made of 4 initialized bytes, and u8 has no
+            // alignment requirement.
+            Data::U32(data) => unsafe {
+                std::slice::from_raw_parts(data.as_ptr().cast(), std::mem::size_of_val(&data[..]))
+            },
+        }
+    }
+}
+
+impl From<Vec<u8>> for ByteBuffer {
+    fn from(data: Vec<u8>) -> Self {
+        ByteBuffer {
+            data: Data::U8(data),
+        }
+    }
+}
+
+impl From<Vec<u32>> for ByteBuffer {
+    fn from(data: Vec<u32>) -> Self {
+        ByteBuffer {
+            data: Data::U32(data),
+        }
+    }
+}
+
+#[pymethods]
+impl ByteBuffer {
+    fn __len__(&self) -> usize {
+        self.as_bytes().len()
+    }
+
+    #[cfg(any(not(Py_LIMITED_API), Py_3_11))]
+    unsafe fn __getbuffer__(
+        slf: Bound<'_, Self>,
+        view: *mut ffi::Py_buffer,
+        flags: c_int,
+    ) -> PyResult<()> {
+        let data = slf.get().as_bytes();
+        // SAFETY: the exporter is frozen, so the vector is neither moved nor
+        // changed while the buffer (which keeps a reference to it) is alive.
+        // The data is exported read-only, and asking for a writable buffer
+        // fails.
+        let filled = unsafe {
+            ffi::PyBuffer_FillInfo(
+                view,
+                slf.as_ptr(),
+                data.as_ptr() as *mut c_void,
+                data.len() as ffi::Py_ssize_t,
+                1,
+                flags,
+            )
+        };
+        if filled == -1 {
+            return Err(PyErr::fetch(slf.py()));
+        }
+        Ok(())
+    }
+}
@@ -0,0 +1,83 @@
+//! Telling apart text that needs no bidi analysis at all.
+//!
+//! Unless it holds characters of the R, AL or AN classes, or explicit RTL
+//! embeddings, overrides or isolates, every character of a paragraph that
+//! isn't forced to RTL resolves to an even level, and the visual order of
+//! the paragraph is its logical order.
+
+use std::sync::atomic::{AtomicBool, AtomicU64, Ordering};
+
+use unicode_bidi::Level;
+
+/// Code units checked at a time, without an early exit so the compiler can
+/// vectorize the checks.
+const CHUNK: usize = 64;
+
+static COUNTING: AtomicBool = AtomicBool::new(false);
+static HITS: AtomicU64 = AtomicU64::new(0);
+static MISSES: AtomicU64 = AtomicU64::new(0);
+
+/// Whether a code point may be of an RTL class. A superset of those made of
+/// the blocks of RTL scripts, whose unassigned code points default to R or
+/// AL too, and of RLM, RLE, RLO and RLI.
+#[inline]
+fn may_be_rtl(cp: u32) -> bool {
+    matches!(
+        cp,
+        0x0590..=0x08FF
+            | 0x200F
+            | 0x202B
+            | 0x202E
+            | 0x2067
+            | 0xFB1D..=0xFDFF
+            | 0xFE70..=0xFEFF
+            | 0x10800..=0x10FFF
+            | 0x1E800..=0x1EFFF
+    )
+}
+
+pub fn utf16_has_rtl(text: &[u16]) -> bool {
+    text.chunks(CHUNK).any(|chunk| {
+        chunk
+            .iter()
+            .fold(false, |found, &unit| found | may_be_rtl(u32::from(unit)))
+    })
+}
+
+pub fn str_has_rtl(text: &str) -> bool {
+    // code points from U+0590 up are encoded with lead bytes from 0xD6 up
+    let below = text.as_bytes().chunks(CHUNK).all(|chunk| {
+        chunk
+            .iter()
+            .fold(true, |below, &byte| below & (byte < 0xD6))
+    });
+
+    !below && text.chars().any(|ch| may_be_rtl(u32::from(ch)))
+}
+
+/// Whether laying out a text at `level` can skip the analysis, leaving the
+/// text as is. `has_rtl` is only called when the level isn't forced to RTL.
+pub fn skips_analysis(level: Option<Level>, has_rtl: impl FnOnce() -> bool) -> bool {
+    let skips = !level.is_some_and(|level| level.is_rtl()) && !has_rtl();
+
+    if COUNTING.load(Ordering::Relaxed) {
+        let counter = if skips { &HITS } else { &MISSES };
+        counter.fetch_add(1, Ordering::Relaxed);
+    }
+    skips
+}
+
+/// Starts or stops counting the layouts which took the fast path.
+pub fn set_counting(enabled: bool) {
+    COUNTING.store(enabled, Ordering::Relaxed);
+}
+
+/// Numbers of layouts which took the fast path, and which did not.
+pub fn counts() -> (u64, u64) {
+    (HITS.load(Ordering::Relaxed), MISSES.load(Ordering::Relaxed))
+}
+
+pub fn reset_counts() {
+    HITS.store(0, Ordering::Relaxed);
+    MISSES.store(0, Ordering::Relaxed);
+}
@@ -1,46 +1,451 @@
-use pyo3::exceptions::PyValueError;
+use std::collections::HashMap;
+use std::num::NonZeroUsize;
+use std::str::Utf8Error;
+use std::sync::atomic::{AtomicUsize, Ordering};
+use std::{slice, str, thread};
+
+use pyo3::buffer::PyBuffer;
+use pyo3::exceptions::{PyUnicodeDecodeError, PyValueError};
 use pyo3::prelude::*;
+use pyo3::types::{PyBytes, PyList, PyString};
 use unicode_bidi::{BidiInfo, Level};
 
-#[pyfunction]
-#[pyo3(signature = (text, base_dir=None, debug=false))]
-pub fn get_display_inner(text: &str, base_dir: Option<char>, debug: bool) -> PyResult<String> {
-    let level: Option<Level> = match base_dir {
-        Some('L') => Some(Level::ltr()),
-        Some('R') => Some(Level::rtl()),
-        None => None,
-        _ => return Err(PyValueError::new_err("base_dir can be 'L', 'R' or None")),
-    };
-    let bidi_info = BidiInfo::new(text, level);
+mod buffer;
+mod fast_path;
+mod text;
 
-    if debug {
-        return Ok(format!("{bidi_info:#?}"));
+use buffer::ByteBuffer;
+use text::Text;
+
+/// Number of chunks each worker gets, on average, when no chunk size is
+/// given. More than one evens out batches with uneven string lengths.
+const CHUNKS_PER_WORKER: usize = 4;
+
+/// Least number of code units laid out by each worker thread of a batch.
+/// Starting a thread costs more than laying out a few short strings, so
+/// small batches are laid out on the calling thread.
+const MIN_WORK_PER_WORKER: usize = 16 * 1024;
+
+/// Texts of at least this many code units are laid out with the GIL
+/// released. Below it, detaching costs more than it lets other threads gain.
+const DETACH_MIN_LEN: usize = 1024;
+
+/// Runs `f` with the GIL released when a text of `len` code units is large
+/// enough to be worth it.
+fn detach_for<T, F>(py: Python<'_>, len: usize, f: F) -> T
+where
+    T: Send,
+    F: FnOnce() -> T + Send,
+{
+    if len >= DETACH_MIN_LEN {
+        py.detach(f)
+    } else {
+        f()
+    }
+}
+
+fn parse_base_dir(base_dir: Option<char>) -> PyResult<Option<Level>> {
+    match base_dir {
+        Some('L') => Ok(Some(Level::ltr())),
+        Some('R') => Ok(Some(Level::rtl())),
+        None => Ok(None),
+        _ => Err(PyValueError::new_err("base_dir can be 'L', 'R' or None")),
+    }
+}
+
+fn check_line_breaks(breaks: &[usize], chars: usize) -> PyResult<()> {
+    let sorted = breaks.windows(2).all(|pair| pair[0] <= pair[1]);
+    if !sorted || breaks.last().is_some_and(|&offset| offset > chars) {
+        return Err(PyValueError::new_err(
+            "line_breaks must be sorted offsets within the text",
+        ));
     }
+    Ok(())
+}
+
+/// Maps `f` over `items` on a pool of scoped threads sized to the machine,
+/// returning the results in input order. `work` tells how many code units
+/// an item holds, each worker gets at least `MIN_WORK_PER_WORKER` of them.
+///
+/// Workers pull chunks of `chunk_size` items off a shared counter, so a few
+/// long strings don't leave the other workers idle.
+fn par_map<T, R, F, W>(items: &[T], chunk_size: Option<usize>, work: W, f: F) -> Vec<R>
+where
+    T: Sync,
+    R: Send,
+    F: Fn(&T) -> R + Sync,
+    W: Fn(&T) -> usize,
+{
+    let total_work: usize = items.iter().map(work).sum();
+    let workers = thread::available_parallelism()
+        .map_or(1, NonZeroUsize::get)
+        .min(total_work / MIN_WORK_PER_WORKER)
+        .max(1);
+    let chunk_size = chunk_size
+        .unwrap_or_else(|| items.len().div_ceil(workers * CHUNKS_PER_WORKER))
+        .max(1);
+    let n_chunks = items.len().div_ceil(chunk_size);
+
+    if workers == 1 || n_chunks <= 1 {
+        return items.iter().map(&f).collect();
+    }
+
+    let next_chunk = AtomicUsize::new(0);
+    let mut done: Vec<(usize, Vec<R>)> = thread::scope(|scope| {
+        let handles: Vec<_> = (0..workers.min(n_chunks))
+            .map(|_| {
+                scope.spawn(|| {
+                    let mut done = Vec::new();
+                    loop {
+                        let idx = next_chunk.fetch_add(1, Ordering::Relaxed);
+                        if idx >= n_chunks {
+                            break done;
+                        }
+                        let start = idx * chunk_size;
+                        let end = (start + chunk_size).min(items.len());
+                        done.push((idx, items[start..end].iter().map(&f).collect()));
+                    }
+                })
+            })
+            .collect();
+
+        handles
+            .into_iter()
+            .flat_map(|handle| handle.join().expect("bidi worker thread panicked"))
+            .collect()
+    });
 
-    let display: String = bidi_info
-        .paragraphs
+    done.sort_unstable_by_key(|(idx, _)| *idx);
+    done.into_iter().flat_map(|(_, results)| results).collect()
+}
+
+/// Returns the index of the first occurrence of each distinct text, and for
+/// every input the position of its distinct text in the former.
+fn dedupe_texts(texts: &[Text<'_>]) -> (Vec<usize>, Vec<usize>) {
+    let mut seen: HashMap<&Text, usize> = HashMap::with_capacity(texts.len());
+    let mut unique = Vec::new();
+    let slots = texts
         .iter()
-        .map(|para| {
-            let line = para.range.clone();
-            bidi_info.reorder_line(para, line)
+        .enumerate()
+        .map(|(idx, text)| {
+            *seen.entry(text).or_insert_with(|| {
+                unique.push(idx);
+                unique.len() - 1
+            })
         })
         .collect();
-    Ok(display)
+    (unique, slots)
+}
+
+fn texts_of<'a>(texts: &'a [Bound<'_, PyString>]) -> PyResult<Vec<Text<'a>>> {
+    texts.iter().map(Text::new).collect()
+}
+
+/// Borrows the contents of `data`, a bytes object, or copies those of any
+/// other exporter of `buffer` into `copy`. Even when exported read-only, the
+/// memory of a bytearray or NumPy array can be written to while we read it.
+fn buffer_bytes<'a>(
+    data: &Bound<'_, PyAny>,
+    buffer: &'a PyBuffer<u8>,
+    copy: &'a mut Vec<u8>,
+) -> PyResult<&'a [u8]> {
+    if buffer.len_bytes() == 0 {
+        return Ok(&[]);
+    }
+    if data.is_exact_instance_of::<PyBytes>() {
+        // SAFETY: bytes objects are immutable and their buffer is
+        // contiguous, it stays exported (and alive) for as long as `buffer`
+        // is borrowed.
+        return Ok(unsafe {
+            slice::from_raw_parts(buffer.buf_ptr() as *const u8, buffer.len_bytes())
+        });
+    }
+    *copy = buffer.to_vec(data.py())?;
+    Ok(copy)
+}
+
+fn utf8_decode_error(py: Python<'_>, bytes: &[u8], err: Utf8Error) -> PyErr {
+    let start = err.valid_up_to();
+    let (end, reason) = match err.error_len() {
+        Some(len) => (start + len, "invalid utf-8 byte sequence"),
+        None => (bytes.len(), "unexpected end of data"),
+    };
+    PyUnicodeDecodeError::new_err((
+        "utf-8",
+        PyBytes::new(py, bytes).unbind(),
+        start,
+        end,
+        reason,
+    ))
+}
+
+fn check_chunk_size(chunk_size: Option<usize>) -> PyResult<()> {
+    if chunk_size == Some(0) {
+        return Err(PyValueError::new_err(
+            "chunk_size must be a positive integer",
+        ));
+    }
+    Ok(())
+}
+
+#[pyfunction]
+#[pyo3(signature = (text, base_dir=None, debug=false))]
+pub fn get_display_inner<'py>(
+    py: Python<'py>,
+    text: &Bound<'py, PyString>,
+    base_dir: Option<char>,
+    debug: bool,
+) -> PyResult<Bound<'py, PyAny>> {
+    let level = parse_base_dir(base_dir)?;
+
+    if debug {
+        let text = text.to_cow()?;
+        let bidi_info = BidiInfo::new(&text, level);
+        return Ok(PyString::new(py, &format!("{bidi_info:#?}")).into_any());
+    }
+
+    let units = Text::new(text)?;
+    detach_for(py, units.len(), || units.reorder(level)).into_pystr(text)
+}
+
+/// Lays out `text` as `get_display_inner` does, but with each paragraph
+/// split into lines at the sorted `line_breaks` code point offsets, each
+/// line reordered on its own from a single analysis of the text.
+#[pyfunction]
+#[pyo3(signature = (text, line_breaks, base_dir=None))]
+pub fn get_display_lines_inner<'py>(
+    py: Python<'py>,
+    text: &Bound<'py, PyString>,
+    line_breaks: Vec<usize>,
+    base_dir: Option<char>,
+) -> PyResult<Bound<'py, PyAny>> {
+    let level = parse_base_dir(base_dir)?;
+    let units = Text::new(text)?;
+    check_line_breaks(&line_breaks, units.chars)?;
+    detach_for(py, units.len(), || units.reorder_lines(level, &line_breaks)).into_pystr(text)
 }
 
+/// Lays out UTF-8 encoded text from any buffer protocol object (bytes,
+/// bytearray, memoryview, mmap...), returning UTF-8 encoded bytes.
+///
+/// Bytes objects are validated and reordered in place, other objects (which
+/// may change while being read) are copied first. The result is written
+/// straight into the returned bytes object. When laying out doesn't
+/// change the text, `data` itself is returned if it's a bytes object.
 #[pyfunction]
-pub fn get_base_level_inner(text: &str) -> PyResult<u8> {
-    let bidi_info = BidiInfo::new(text, None);
-    if bidi_info.paragraphs.is_empty() {
-        return Err(PyValueError::new_err("Text contains no paragraphs"));
+#[pyo3(signature = (data, base_dir=None))]
+pub fn get_display_utf8_inner<'py>(
+    py: Python<'py>,
+    data: &Bound<'py, PyAny>,
+    base_dir: Option<char>,
+) -> PyResult<Bound<'py, PyAny>> {
+    let level = parse_base_dir(base_dir)?;
+    let buffer = PyBuffer::<u8>::get(data)?;
+    let mut copy = Vec::new();
+    let bytes = buffer_bytes(data, &buffer, &mut copy)?;
+    let text = str::from_utf8(bytes).map_err(|err| utf8_decode_error(py, bytes, err))?;
+
+    let units = Text::from_utf8(text);
+    let display = detach_for(py, units.len(), || units.reorder(level));
+    if display.is_unchanged() && data.is_exact_instance_of::<PyBytes>() {
+        return Ok(data.clone());
     }
+    Ok(display.into_pybytes(py, text)?.into_any())
+}
+
+/// Returns the embedding levels of the code points of `text`, as bytes,
+/// without reordering it.
+#[pyfunction]
+#[pyo3(signature = (text, base_dir=None))]
+pub fn get_levels_inner<'py>(
+    py: Python<'py>,
+    text: &Bound<'py, PyString>,
+    base_dir: Option<char>,
+) -> PyResult<Bound<'py, PyBytes>> {
+    let level = parse_base_dir(base_dir)?;
+    let text = Text::new(text)?;
+    let levels = detach_for(py, text.len(), || text.levels(level));
+    Ok(PyBytes::new(py, &levels))
+}
+
+/// Returns the embedding levels (as `get_levels_inner` does) and the bidi
+/// classes of the code points of `text`, as buffers of one byte per code
+/// point.
+#[pyfunction]
+#[pyo3(signature = (text, base_dir=None))]
+pub fn get_levels_and_classes_inner(
+    py: Python<'_>,
+    text: &Bound<'_, PyString>,
+    base_dir: Option<char>,
+) -> PyResult<(ByteBuffer, ByteBuffer)> {
+    let level = parse_base_dir(base_dir)?;
+    let text = Text::new(text)?;
+    let (levels, classes) = detach_for(py, text.len(), || (text.levels(level), text.classes()));
+    Ok((levels.into(), classes.into()))
+}
+
+/// Returns the maps of the code points of `text` from logical to visual
+/// positions and back, each paragraph taken as a single line, as buffers of
+/// native `u32`.
+#[pyfunction]
+#[pyo3(signature = (text, base_dir=None))]
+pub fn get_index_maps_inner(
+    py: Python<'_>,
+    text: &Bound<'_, PyString>,
+    base_dir: Option<char>,
+) -> PyResult<(ByteBuffer, ByteBuffer)> {
+    let level = parse_base_dir(base_dir)?;
+    let text = Text::new(text)?;
+    let (to_visual, to_logical) = detach_for(py, text.len(), || {
+        let to_logical = text.visual_order(level);
+        let mut to_visual = vec![0; to_logical.len()];
+        for (visual_idx, &logical_idx) in to_logical.iter().enumerate() {
+            to_visual[logical_idx as usize] = visual_idx as u32;
+        }
+        (to_visual, to_logical)
+    });
+    Ok((to_visual.into(), to_logical.into()))
+}
+
+/// Returns the visual runs of `text`, as (start, end, level) tuples with
+/// offsets in code points: line by line, and in visual order within each
+/// line. Lines end with their paragraph or at the `line_breaks` offsets.
+#[pyfunction]
+#[pyo3(signature = (text, base_dir=None, line_breaks=None))]
+pub fn get_visual_runs_inner(
+    py: Python<'_>,
+    text: &Bound<'_, PyString>,
+    base_dir: Option<char>,
+    line_breaks: Option<Vec<usize>>,
+) -> PyResult<Vec<(usize, usize, u8)>> {
+    let level = parse_base_dir(base_dir)?;
+    let text = Text::new(text)?;
+    let breaks = line_breaks.unwrap_or_default();
+    check_line_breaks(&breaks, text.chars)?;
+    Ok(detach_for(py, text.len(), || {
+        text.visual_runs(level, &breaks)
+    }))
+}
+
+#[pyfunction]
+pub fn get_base_level_inner(py: Python<'_>, text: &Bound<'_, PyString>) -> PyResult<u8> {
+    let text = Text::new(text)?;
+    detach_for(py, text.len(), || text.base_level())
+        .ok_or_else(|| PyValueError::new_err("Text contains no paragraphs"))
+}
 
-    Ok(bidi_info.paragraphs[0].level.number())
+#[pyfunction]
+#[pyo3(signature = (texts, base_dir=None, dedupe=false, chunk_size=None))]
+pub fn get_display_many_inner<'py>(
+    py: Python<'py>,
+    texts: Vec<Bound<'py, PyString>>,
+    base_dir: Option<char>,
+    dedupe: bool,
+    chunk_size: Option<usize>,
+) -> PyResult<Bound<'py, PyList>> {
+    let level = parse_base_dir(base_dir)?;
+    check_chunk_size(chunk_size)?;
+
+    let units = texts_of(&texts)?;
+    let (unique, slots) = if dedupe {
+        let (unique, slots) = dedupe_texts(&units);
+        (unique, Some(slots))
+    } else {
+        ((0..units.len()).collect(), None)
+    };
+
+    let displays = py.detach(|| {
+        par_map(
+            &unique,
+            chunk_size,
+            |&idx| units[idx].len(),
+            |&idx| units[idx].reorder(level),
+        )
+    });
+    let displays = displays
+        .into_iter()
+        .zip(&unique)
+        .map(|(display, &idx)| display.into_pystr(&texts[idx]))
+        .collect::<PyResult<Vec<_>>>()?;
+
+    match slots {
+        Some(slots) => PyList::new(
+            py,
+            slots.iter().enumerate().map(|(idx, &slot)| {
+                // a text left unchanged is returned as is, not as the first
+                // occurrence it was laid out from
+                let display = &displays[slot];
+                if display.as_ptr() == texts[unique[slot]].as_ptr() {
+                    texts[idx].as_any()
+                } else {
+                    display
+                }
+            }),
+        ),
+        None => PyList::new(py, displays),
+    }
+}
+
+#[pyfunction]
+#[pyo3(signature = (texts, chunk_size=None))]
+pub fn get_base_level_many_inner<'py>(
+    py: Python<'py>,
+    texts: Vec<Bound<'py, PyString>>,
+    chunk_size: Option<usize>,
+) -> PyResult<Bound<'py, PyList>> {
+    check_chunk_size(chunk_size)?;
+
+    let texts = texts_of(&texts)?;
+    let levels = py.detach(|| par_map(&texts, chunk_size, Text::len, Text::base_level));
+    let levels = levels
+        .into_iter()
+        .enumerate()
+        .map(|(idx, level)| {
+            level.ok_or_else(|| {
+                PyValueError::new_err(format!("Text at index {idx} contains no paragraphs"))
+            })
+        })
+        .collect::<PyResult<Vec<u8>>>()?;
+
+    // Vec<u8> would convert to bytes, keep the levels as a list of ints
+    PyList::new(py, levels)
+}
+
+/// Starts or stops counting how many layouts take the fast path.
+#[pyfunction]
+#[pyo3(signature = (enabled=true))]
+pub fn set_fast_path_stats_inner(enabled: bool) {
+    fast_path::set_counting(enabled);
+}
+
+/// Returns the numbers of layouts which took the fast path, and which went
+/// through the full analysis, since counting started or was last reset.
+#[pyfunction]
+pub fn fast_path_stats_inner() -> (u64, u64) {
+    fast_path::counts()
+}
+
+#[pyfunction]
+pub fn reset_fast_path_stats_inner() {
+    fast_path::reset_counts();
 }
 
 #[pymodule(gil_used = false)]
 fn bidi(m: &Bound<'_, PyModule>) -> PyResult<()> {
+    m.add("UNICODE_VERSION", unicode_bidi::UNICODE_VERSION)?;
+    m.add_class::<ByteBuffer>()?;
     m.add_function(wrap_pyfunction!(get_display_inner, m)?)?;
+    m.add_function(wrap_pyfunction!(get_display_utf8_inner, m)?)?;
+    m.add_function(wrap_pyfunction!(get_display_lines_inner, m)?)?;
+    m.add_function(wrap_pyfunction!(get_levels_inner, m)?)?;
+    m.add_function(wrap_pyfunction!(get_levels_and_classes_inner, m)?)?;
+    m.add_function(wrap_pyfunction!(get_index_maps_inner, m)?)?;
+    m.add_function(wrap_pyfunction!(get_visual_runs_inner, m)?)?;
     m.add_function(wrap_pyfunction!(get_base_level_inner, m)?)?;
+    m.add_function(wrap_pyfunction!(get_display_many_inner, m)?)?;
+    m.add_function(wrap_pyfunction!(get_base_level_many_inner, m)?)?;
+    m.add_function(wrap_pyfunction!(set_fast_path_stats_inner, m)?)?;
+    m.add_function(wrap_pyfunction!(fast_path_stats_inner, m)?)?;
+    m.add_function(wrap_pyfunction!(reset_fast_path_stats_inner, m)?)?;
     Ok(())
 }
@@ -0,0 +1,642 @@
+//! Python str contents read in place from CPython's compact (PEP 393)
+//! storage, and laid out text written straight into a new str of the same
+//! kind.
+//!
+//! Asking CPython for the UTF-8 of a non-ASCII str makes it build, and keep
+//! for the lifetime of the object, a UTF-8 copy of the whole string. Latin-1
+//! and UCS-2 storage is analysed as UTF-16 instead and UCS-4 storage through
+//! a transient UTF-8 buffer, so no copy is left behind on the input.
+//!
+//! Text without RTL characters is left untouched unless it is forced to RTL,
+//! see the `fast_path` module.
+
+use std::borrow::Cow;
+use std::iter;
+use std::ops::Range;
+#[cfg(not(any(Py_LIMITED_API, PyPy, GraalPy)))]
+use std::slice;
+
+#[cfg(not(any(Py_LIMITED_API, PyPy, GraalPy)))]
+use pyo3::ffi;
+use pyo3::prelude::*;
+#[cfg(not(any(Py_LIMITED_API, PyPy, GraalPy)))]
+use pyo3::types::PyStringData;
+use pyo3::types::{PyBytes, PyString};
+use unicode_bidi::{bidi_class, utf16, BidiClass, BidiInfo, Level, ParagraphInfo};
+
+use crate::fast_path;
+
+/// Code units of a text, in a form `unicode_bidi` can analyse.
+#[derive(Debug, PartialEq, Eq, Hash)]
+pub enum Units<'a> {
+    /// Latin-1 never holds RTL characters, it is only widened to UTF-16 when
+    /// forced to RTL
+    Latin1(&'a [u8]),
+    Utf8(Cow<'a, str>),
+    Utf16(Cow<'a, [u16]>),
+}
+
+/// Storage kind of a str, i.e. the range of its widest code point.
+#[derive(Clone, Copy, Debug, PartialEq, Eq, PartialOrd, Ord, Hash)]
+pub enum Kind {
+    Ascii,
+    Ucs1,
+    Ucs2,
+    Ucs4,
+}
+
+impl Kind {
+    fn of_char(ch: char) -> Kind {
+        match u32::from(ch) {
+            0..=0x7F => Kind::Ascii,
+            0x80..=0xFF => Kind::Ucs1,
+            0x100..=0xFFFF => Kind::Ucs2,
+            _ => Kind::Ucs4,
+        }
+    }
+
+    #[cfg(any(Py_LIMITED_API, PyPy, GraalPy))]
+    fn of_str(text: &str) -> Kind {
+        text.chars().map(Kind::of_char).max().unwrap_or(Kind::Ascii)
+    }
+}
+
+#[cfg(not(any(Py_LIMITED_API, PyPy, GraalPy)))]
+fn is_surrogate(unit: u16) -> bool {
+    (0xD800..=0xDFFF).contains(&unit)
+}
+
+/// The text of a Python str.
+#[derive(Debug, PartialEq, Eq, Hash)]
+pub struct Text<'a> {
+    pub units: Units<'a>,
+    pub kind: Kind,
+    /// Length in code points
+    pub chars: usize,
+}
+
+impl<'a> Text<'a> {
+    #[cfg(not(any(Py_LIMITED_API, PyPy, GraalPy)))]
+    pub fn new(text: &'a Bound<'_, PyString>) -> PyResult<Self> {
+        // SAFETY: str objects are immutable, and the data is borrowed for as
+        // long as `text` is.
+        let data = unsafe { text.data()? };
+        let chars = match data {
+            PyStringData::Ucs1(data) => data.len(),
+            PyStringData::Ucs2(data) => data.len(),
+            PyStringData::Ucs4(data) => data.len(),
+        };
+        let (units, kind) = match data {
+            PyStringData::Ucs1(data) if data.is_ascii() => {
+                // SAFETY: ASCII is valid UTF-8
+                let text = unsafe { std::str::from_utf8_unchecked(data) };
+                (Units::Utf8(Cow::Borrowed(text)), Kind::Ascii)
+            }
+            PyStringData::Ucs1(data) => (Units::Latin1(data), Kind::Ucs1),
+            PyStringData::Ucs2(data) if data.iter().any(|&unit| is_surrogate(unit)) => {
+                // lone surrogates, let PyO3 raise the usual encode error
+                (Units::Utf8(text.to_cow()?), Kind::Ucs2)
+            }
+            PyStringData::Ucs2(data) => (Units::Utf16(Cow::Borrowed(data)), Kind::Ucs2),
+            PyStringData::Ucs4(data) => {
+                let utf8: Option<String> = data.iter().map(|&ch| char::from_u32(ch)).collect();
+                match utf8 {
+                    Some(utf8) => (Units::Utf8(Cow::Owned(utf8)), Kind::Ucs4),
+                    // lone surrogates, let PyO3 raise the usual encode error
+                    None => (Units::Utf8(text.to_cow()?), Kind::Ucs4),
+                }
+            }
+        };
+        Ok(Text { units, kind, chars })
+    }
+
+    #[cfg(any(Py_LIMITED_API, PyPy, GraalPy))]
+    pub fn new(text: &'a Bound<'_, PyString>) -> PyResult<Self> {
+        let text = text.to_cow()?;
+        let kind = Kind::of_str(&text);
+        let chars = text.chars().count();
+        Ok(Text {
+            units: Units::Utf8(text),
+            kind,
+            chars,
+        })
+    }
+
+    /// The text of a UTF-8 encoded buffer, borrowed in place.
+    pub fn from_utf8(text: &'a str) -> Self {
+        let (kind, chars) = if text.is_ascii() {
+            (Kind::Ascii, text.len())
+        } else {
+            text.chars().fold((Kind::Ascii, 0), |(kind, chars), ch| {
+                (kind.max(Kind::of_char(ch)), chars + 1)
+            })
+        };
+        Text {
+            units: Units::Utf8(Cow::Borrowed(text)),
+            kind,
+            chars,
+        }
+    }
+
+    /// Number of code units, to tell how much work laying it out is.
+    pub fn len(&self) -> usize {
+        match &self.units {
+            Units::Latin1(text) => text.len(),
+            Units::Utf8(text) => text.len(),
+            Units::Utf16(text) => text.len(),
+        }
+    }
+
+    fn has_rtl(&self) -> bool {
+        match &self.units {
+            Units::Latin1(_) => false,
+            Units::Utf8(_) if self.kind == Kind::Ascii => false,
+            Units::Utf8(text) => fast_path::str_has_rtl(text),
+            Units::Utf16(text) => fast_path::utf16_has_rtl(text),
+        }
+    }
+
+    /// Whether the text holds LRE, LRO, LRI or FSI characters, the only
+    /// ones raising the level of text without RTL characters.
+    fn has_ltr_embeddings(&self) -> bool {
+        let is_embedding = |cp: u32| matches!(cp, 0x202A | 0x202D | 0x2066 | 0x2068);
+        match &self.units {
+            Units::Latin1(_) => false,
+            Units::Utf8(_) if self.kind == Kind::Ascii => false,
+            Units::Utf8(text) => text.chars().any(|ch| is_embedding(u32::from(ch))),
+            Units::Utf16(text) => text.iter().any(|&unit| is_embedding(u32::from(unit))),
+        }
+    }
+
+    /// Reorders each paragraph as a single line.
+    pub fn reorder(&self, level: Option<Level>) -> Reordered<'_> {
+        self.reorder_lines(level, &[])
+    }
+
+    /// Reorders each line of each paragraph on its own, lines ending with
+    /// their paragraph or at `breaks`, sorted code point offsets.
+    pub fn reorder_lines(&self, level: Option<Level>, breaks: &[usize]) -> Reordered<'_> {
+        let parts = if fast_path::skips_analysis(level, || self.has_rtl()) {
+            Parts::Unchanged
+        } else {
+            self.reorder_all(level, breaks)
+        };
+        Reordered {
+            parts,
+            kind: self.kind,
+            chars: self.chars,
+        }
+    }
+
+    fn reorder_all(&self, level: Option<Level>, breaks: &[usize]) -> Parts<'_> {
+        match &self.units {
+            Units::Latin1(text) => {
+                let widened: Vec<u16> = text.iter().map(|&unit| u16::from(unit)).collect();
+                let parts = utf16_reorder(&utf16::BidiInfo::new(&widened, level), breaks);
+                if parts.iter().all(|part| matches!(part, Cow::Borrowed(_))) {
+                    Parts::Unchanged
+                } else {
+                    Parts::Utf16(
+                        parts
+                            .into_iter()
+                            .map(|part| Cow::Owned(part.into_owned()))
+                            .collect(),
+                    )
+                }
+            }
+            Units::Utf8(text) => {
+                let breaks = byte_offsets(text, breaks);
+                Parts::Utf8(utf8_reorder(&BidiInfo::new(text, level), &breaks))
+            }
+            Units::Utf16(text) => {
+                Parts::Utf16(utf16_reorder(&utf16::BidiInfo::new(text, level), breaks))
+            }
+        }
+    }
+
+    /// Embedding levels of the code points, after L1, with each paragraph
+    /// taken as a single line.
+    pub fn levels(&self, level: Option<Level>) -> Vec<u8> {
+        let skips =
+            fast_path::skips_analysis(level, || self.has_rtl() || self.has_ltr_embeddings());
+        if skips {
+            return vec![0; self.chars];
+        }
+        let (levels, _) = self.paragraph_levels(level);
+        levels.iter().map(Level::number).collect()
+    }
+
+    /// Logical index of the code point at each visual position, with each
+    /// paragraph taken as a single line.
+    pub fn visual_order(&self, level: Option<Level>) -> Vec<u32> {
+        if fast_path::skips_analysis(level, || self.has_rtl()) {
+            return (0..self.chars as u32).collect();
+        }
+        let (levels, ends) = self.paragraph_levels(level);
+
+        let mut order = Vec::with_capacity(levels.len());
+        let mut start = 0;
+        for end in ends {
+            let indices = BidiInfo::reorder_visual(&levels[start..end]);
+            order.extend(indices.into_iter().map(|idx| (start + idx) as u32));
+            start = end;
+        }
+        order
+    }
+
+    /// Levels of the code points after L1, with each paragraph taken as a
+    /// single line, and the end of each paragraph in code points.
+    fn paragraph_levels(&self, level: Option<Level>) -> (Vec<Level>, Vec<usize>) {
+        match &self.units {
+            Units::Latin1(text) => {
+                let widened: Vec<u16> = text.iter().map(|&unit| u16::from(unit)).collect();
+                utf16_levels(&utf16::BidiInfo::new(&widened, level))
+            }
+            Units::Utf8(text) => utf8_levels(&BidiInfo::new(text, level)),
+            // each code unit of UCS-2 storage is a code point
+            Units::Utf16(text) => utf16_levels(&utf16::BidiInfo::new(text, level)),
+        }
+    }
+
+    /// Runs of code points at the same level, as (start, end, level), line
+    /// by line in logical order and in visual order within each line. Lines
+    /// end with their paragraph or at `breaks`, sorted code point offsets.
+    pub fn visual_runs(&self, level: Option<Level>, breaks: &[usize]) -> Vec<(usize, usize, u8)> {
+        match &self.units {
+            Units::Latin1(text) => {
+                let widened: Vec<u16> = text.iter().map(|&unit| u16::from(unit)).collect();
+                utf16_visual_runs(&utf16::BidiInfo::new(&widened, level), breaks)
+            }
+            Units::Utf8(text) => {
+                let breaks = byte_offsets(text, breaks);
+                utf8_visual_runs(&BidiInfo::new(text, level), &breaks)
+            }
+            Units::Utf16(text) => utf16_visual_runs(&utf16::BidiInfo::new(text, level), breaks),
+        }
+    }
+
+    /// Bidi classes of the code points, numbered as in `bidi.classes`.
+    pub fn classes(&self) -> Vec<u8> {
+        // Latin-1 and UCS-2 code units are chars, as strs with lone
+        // surrogates are rejected
+        let code_of = |cp: u32| class_code(char::from_u32(cp).map_or(BidiClass::L, bidi_class));
+        match &self.units {
+            Units::Latin1(text) => text.iter().map(|&unit| code_of(u32::from(unit))).collect(),
+            Units::Utf8(text) => text.chars().map(|ch| class_code(bidi_class(ch))).collect(),
+            Units::Utf16(text) => text.iter().map(|&unit| code_of(u32::from(unit))).collect(),
+        }
+    }
+
+    /// Base level of the first paragraph, if there is one.
+    pub fn base_level(&self) -> Option<u8> {
+        if fast_path::skips_analysis(None, || self.has_rtl()) {
+            // without strong RTL characters every paragraph is LTR
+            return (self.len() > 0).then_some(0);
+        }
+        let para = match &self.units {
+            // no RTL characters, so the fast path was taken
+            Units::Latin1(_) => unreachable!(),
+            Units::Utf8(text) => BidiInfo::new(text, None).paragraphs.into_iter().next(),
+            Units::Utf16(text) => utf16::BidiInfo::new(text, None)
+                .paragraphs
+                .into_iter()
+                .next(),
+        };
+        para.map(|para| para.level.number())
+    }
+}
+
+/// Code of a bidi class in `bidi.classes`.
+fn class_code(class: BidiClass) -> u8 {
+    match class {
+        BidiClass::L => 0,
+        BidiClass::R => 1,
+        BidiClass::AL => 2,
+        BidiClass::EN => 3,
+        BidiClass::ES => 4,
+        BidiClass::ET => 5,
+        BidiClass::AN => 6,
+        BidiClass::CS => 7,
+        BidiClass::NSM => 8,
+        BidiClass::BN => 9,
+        BidiClass::B => 10,
+        BidiClass::S => 11,
+        BidiClass::WS => 12,
+        BidiClass::ON => 13,
+        BidiClass::LRE => 14,
+        BidiClass::LRO => 15,
+        BidiClass::RLE => 16,
+        BidiClass::RLO => 17,
+        BidiClass::PDF => 18,
+        BidiClass::LRI => 19,
+        BidiClass::RLI => 20,
+        BidiClass::FSI => 21,
+        BidiClass::PDI => 22,
+    }
+}
+
+/// The analysis of a line of a paragraph of `bidi_info` as a text of its
+/// own.
+///
+/// `BidiInfo` methods laying out a line clone the levels of the whole text,
+/// calling them on each line on its own keeps laying out a text linear.
+fn line_info<'t>(
+    bidi_info: &BidiInfo<'t>,
+    para: &ParagraphInfo,
+    line: Range<usize>,
+) -> BidiInfo<'t> {
+    BidiInfo {
+        text: &bidi_info.text[line.clone()],
+        original_classes: bidi_info.original_classes[line.clone()].to_vec(),
+        levels: bidi_info.levels[line.clone()].to_vec(),
+        paragraphs: vec![ParagraphInfo {
+            range: 0..line.len(),
+            level: para.level,
+        }],
+    }
+}
+
+/// `line_info` for UTF-16 text.
+fn utf16_line_info<'t>(
+    bidi_info: &utf16::BidiInfo<'t>,
+    para: &ParagraphInfo,
+    line: Range<usize>,
+) -> utf16::BidiInfo<'t> {
+    utf16::BidiInfo {
+        text: &bidi_info.text[line.clone()],
+        original_classes: bidi_info.original_classes[line.clone()].to_vec(),
+        levels: bidi_info.levels[line.clone()].to_vec(),
+        paragraphs: vec![ParagraphInfo {
+            range: 0..line.len(),
+            level: para.level,
+        }],
+    }
+}
+
+/// Splits the `range` of a paragraph into lines at the `breaks` (sorted
+/// offsets in code units) within it.
+fn split_lines(range: Range<usize>, breaks: &[usize]) -> Vec<Range<usize>> {
+    let first = breaks.partition_point(|&offset| offset <= range.start);
+    let last = breaks.partition_point(|&offset| offset < range.end);
+
+    let mut lines = Vec::with_capacity(last - first + 1);
+    let mut start = range.start;
+    for &offset in &breaks[first..last] {
+        if offset > start {
+            lines.push(start..offset);
+            start = offset;
+        }
+    }
+    lines.push(start..range.end);
+    lines
+}
+
+/// Byte offsets in `text` of the sorted code point `offsets`, at most the
+/// number of chars of `text`.
+fn byte_offsets(text: &str, offsets: &[usize]) -> Vec<usize> {
+    let mut boundaries = text
+        .char_indices()
+        .map(|(idx, _)| idx)
+        .chain(iter::once(text.len()));
+    let mut next = 0;
+    let mut last = 0;
+    offsets
+        .iter()
+        .map(|&offset| {
+            if offset >= next {
+                last = boundaries
+                    .nth(offset - next)
+                    .expect("offset within the text");
+                next = offset + 1;
+            }
+            last
+        })
+        .collect()
+}
+
+/// Levels of the chars of each paragraph after L1, in logical order, and the
+/// end of each paragraph in chars.
+fn utf8_levels(bidi_info: &BidiInfo<'_>) -> (Vec<Level>, Vec<usize>) {
+    let mut levels = Vec::with_capacity(bidi_info.text.len());
+    let mut ends = Vec::with_capacity(bidi_info.paragraphs.len());
+    for para in &bidi_info.paragraphs {
+        let info = line_info(bidi_info, para, para.range.clone());
+        levels.extend(info.reordered_levels_per_char(&info.paragraphs[0], 0..info.text.len()));
+        ends.push(levels.len());
+    }
+    (levels, ends)
+}
+
+/// Levels of the code units of each paragraph after L1, in logical order,
+/// and the end of each paragraph in code units.
+fn utf16_levels(bidi_info: &utf16::BidiInfo<'_>) -> (Vec<Level>, Vec<usize>) {
+    let mut levels = Vec::with_capacity(bidi_info.text.len());
+    let mut ends = Vec::with_capacity(bidi_info.paragraphs.len());
+    for para in &bidi_info.paragraphs {
+        let info = utf16_line_info(bidi_info, para, para.range.clone());
+        levels.extend(info.reordered_levels(&info.paragraphs[0], 0..info.text.len()));
+        ends.push(levels.len());
+    }
+    (levels, ends)
+}
+
+/// Each line of each paragraph reordered, split at the `breaks` byte offsets.
+fn utf8_reorder<'t>(bidi_info: &BidiInfo<'t>, breaks: &[usize]) -> Vec<Cow<'t, str>> {
+    let mut parts = Vec::with_capacity(bidi_info.paragraphs.len());
+    for para in &bidi_info.paragraphs {
+        for line in split_lines(para.range.clone(), breaks) {
+            let info = line_info(bidi_info, para, line);
+            parts.push(info.reorder_line(&info.paragraphs[0], 0..info.text.len()));
+        }
+    }
+    parts
+}
+
+/// Each line of each paragraph reordered, split at the `breaks` code unit
+/// offsets.
+fn utf16_reorder<'t>(bidi_info: &utf16::BidiInfo<'t>, breaks: &[usize]) -> Vec<Cow<'t, [u16]>> {
+    let mut parts = Vec::with_capacity(bidi_info.paragraphs.len());
+    for para in &bidi_info.paragraphs {
+        for line in split_lines(para.range.clone(), breaks) {
+            let info = utf16_line_info(bidi_info, para, line);
+            parts.push(info.reorder_line(&info.paragraphs[0], 0..info.text.len()));
+        }
+    }
+    parts
+}
+
+/// Visual runs of each line of each paragraph, split at the `breaks` byte
+/// offsets, with offsets in chars.
+fn utf8_visual_runs(bidi_info: &BidiInfo<'_>, breaks: &[usize]) -> Vec<(usize, usize, u8)> {
+    let mut runs = Vec::new();
+    let mut line_start = 0;
+    for para in &bidi_info.paragraphs {
+        for line in split_lines(para.range.clone(), breaks) {
+            let info = line_info(bidi_info, para, line);
+            let (levels, line_runs) = info.visual_runs(&info.paragraphs[0], 0..info.text.len());
+
+            let char_starts: Vec<usize> = info.text.char_indices().map(|(idx, _)| idx).collect();
+            let to_chars =
+                |offset: usize| line_start + char_starts.partition_point(|&start| start < offset);
+            runs.extend(line_runs.into_iter().map(|run| {
+                (
+                    to_chars(run.start),
+                    to_chars(run.end),
+                    levels[run.start].number(),
+                )
+            }));
+            line_start += char_starts.len();
+        }
+    }
+    runs
+}
+
+/// Visual runs of each line of each paragraph, split at the `breaks` code
+/// unit offsets.
+fn utf16_visual_runs(bidi_info: &utf16::BidiInfo<'_>, breaks: &[usize]) -> Vec<(usize, usize, u8)> {
+    let mut runs = Vec::new();
+    for para in &bidi_info.paragraphs {
+        for line in split_lines(para.range.clone(), breaks) {
+            let info = utf16_line_info(bidi_info, para, line.clone());
+            let (levels, line_runs) = info.visual_runs(&info.paragraphs[0], 0..info.text.len());
+            runs.extend(line_runs.into_iter().map(|run| {
+                (
+                    line.start + run.start,
+                    line.start + run.end,
+                    levels[run.start].number(),
+                )
+            }));
+        }
+    }
+    runs
+}
+
+enum Parts<'a> {
+    /// Laying out leaves the text as is
+    Unchanged,
+    Utf8(Vec<Cow<'a, str>>),
+    Utf16(Vec<Cow<'a, [u16]>>),
+}
+
+/// Reordered paragraphs of a text, in visual order.
+#[cfg_attr(any(Py_LIMITED_API, PyPy, GraalPy), allow(dead_code))]
+pub struct Reordered<'a> {
+    parts: Parts<'a>,
+    kind: Kind,
+    chars: usize,
+}
+
+impl Reordered<'_> {
+    /// Whether every paragraph is already in visual order.
+    pub fn is_unchanged(&self) -> bool {
+        match &self.parts {
+            Parts::Unchanged => true,
+            Parts::Utf8(parts) => parts.iter().all(|part| matches!(part, Cow::Borrowed(_))),
+            Parts::Utf16(parts) => parts.iter().all(|part| matches!(part, Cow::Borrowed(_))),
+        }
+    }
+
+    /// Builds the laid out str, or returns `original`, the str the text was
+    /// read from, when laying it out didn't change it.
+    pub fn into_pystr<'py>(self, original: &Bound<'py, PyString>) -> PyResult<Bound<'py, PyAny>> {
+        if self.is_unchanged() {
+            return Ok(original.clone().into_any());
+        }
+        self.build(original.py())
+    }
+
+    /// Builds the laid out text as UTF-8 encoded bytes, `original` being
+    /// the UTF-8 it was read from.
+    pub fn into_pybytes<'py>(
+        self,
+        py: Python<'py>,
+        original: &str,
+    ) -> PyResult<Bound<'py, PyBytes>> {
+        let parts = match self.parts {
+            Parts::Unchanged => return Ok(PyBytes::new(py, original.as_bytes())),
+            Parts::Utf8(parts) => parts,
+            Parts::Utf16(_) => unreachable!("UTF-8 text is reordered as UTF-8"),
+        };
+        let len = parts.iter().map(|part| part.len()).sum();
+        PyBytes::new_with(py, len, |out| {
+            copy_parts(out, parts.iter().map(|part| part.as_bytes()));
+            Ok(())
+        })
+    }
+
+    /// Builds the laid out str.
+    ///
+    /// Reordering only moves code points around, so the output has the
+    /// length and kind of the input. The str is allocated at that size up
+    /// front and the code points are written straight into its storage.
+    #[cfg(not(any(Py_LIMITED_API, PyPy, GraalPy)))]
+    fn build<'py>(self, py: Python<'py>) -> PyResult<Bound<'py, PyAny>> {
+        let max_char = match self.kind {
+            Kind::Ascii => 0x7F,
+            Kind::Ucs1 => 0xFF,
+            Kind::Ucs2 => 0xFFFF,
+            Kind::Ucs4 => 0x10FFFF,
+        };
+        // SAFETY: PyUnicode_New returns a new reference, or NULL with an
+        // exception set
+        let display = unsafe {
+            Bound::from_owned_ptr_or_err(
+                py,
+                ffi::PyUnicode_New(self.chars as ffi::Py_ssize_t, max_char),
+            )?
+        };
+        // SAFETY: the str was just created for `max_char`, so its storage
+        // holds `self.chars` code units of the matching width, and nothing
+        // else has seen it yet.
+        unsafe {
+            let data = ffi::PyUnicode_DATA(display.as_ptr());
+            match (self.parts, self.kind) {
+                (Parts::Unchanged, _) => unreachable!("unchanged text is returned as is"),
+                (Parts::Utf8(parts), Kind::Ascii) => {
+                    let out = slice::from_raw_parts_mut(data.cast::<u8>(), self.chars);
+                    copy_parts(out, parts.iter().map(|part| part.as_bytes()));
+                }
+                (Parts::Utf8(parts), _) => {
+                    let out = slice::from_raw_parts_mut(data.cast::<u32>(), self.chars);
+                    let chars = parts.iter().flat_map(|part| part.chars());
+                    for (slot, ch) in out.iter_mut().zip(chars) {
+                        *slot = u32::from(ch);
+                    }
+                }
+                (Parts::Utf16(parts), Kind::Ucs1) => {
+                    let out = slice::from_raw_parts_mut(data.cast::<u8>(), self.chars);
+                    let units = parts.iter().flat_map(|part| part.iter());
+                    for (slot, &unit) in out.iter_mut().zip(units) {
+                        // Latin-1 widened to UTF-16, narrow it back
+                        *slot = unit as u8;
+                    }
+                }
+                (Parts::Utf16(parts), _) => {
+                    let out = slice::from_raw_parts_mut(data.cast::<u16>(), self.chars);
+                    copy_parts(out, parts.iter().map(|part| &part[..]));
+                }
+            }
+        }
+        Ok(display)
+    }
+
+    /// Builds the laid out str.
+    #[cfg(any(Py_LIMITED_API, PyPy, GraalPy))]
+    fn build<'py>(self, py: Python<'py>) -> PyResult<Bound<'py, PyAny>> {
+        let display = match self.parts {
+            Parts::Unchanged => unreachable!("unchanged text is returned as is"),
+            Parts::Utf8(parts) => parts.concat(),
+            Parts::Utf16(parts) => String::from_utf16_lossy(&parts.concat()),
+        };
+        Ok(PyString::new(py, &display).into_any())
+    }
+}
+
+/// Copies consecutive `parts` into `out`.
+fn copy_parts<'a, T: Copy + 'a>(out: &mut [T], parts: impl Iterator<Item = &'a [T]>) {
+    let mut pos = 0;
+    for part in parts {
+        out[pos..pos + part.len()].copy_from_slice(part);
+        pos += part.len();
+    }
+}
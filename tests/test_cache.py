@@ -0,0 +1,165 @@
+# This file is part of python-bidi
+#
+# python-bidi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Result cache tests"""
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from bidi.algorithm import get_display
+from bidi.cache import LRUCache, cache_clear, cache_info, disable_cache, enable_cache
+from bidi.disk_cache import DiskCache
+
+
+class TestLRUCache(unittest.TestCase):
+    """The cache itself"""
+
+    def test_lru_eviction(self):
+        cache = LRUCache(max_entries=2)
+        for text in ("a", "b", "a", "c"):
+            cache.get_or_compute(text, text, lambda: text.upper())
+
+        # "b" was the least recently used when "c" came in
+        info = cache.cache_info()
+        self.assertEqual((info.hits, info.misses, info.evictions), (1, 3, 1))
+        self.assertEqual((info.entries, info.chars), (2, 4))
+        self.assertEqual(cache.get_or_compute("a", "a", lambda: "X"), "A")
+        self.assertEqual(cache.get_or_compute("b", "b", lambda: "X"), "X")
+
+    def test_max_chars(self):
+        cache = LRUCache(max_chars=10)
+        cache.get_or_compute("big", "x" * 20, lambda: "y" * 20)
+        self.assertEqual(cache.cache_info().entries, 0)
+
+        for text in ("abc", "def", "ghi"):
+            cache.get_or_compute(text, text, lambda: text)
+        info = cache.cache_info()
+        self.assertEqual((info.entries, info.chars, info.evictions), (3, 9, 0))
+
+        cache.get_or_compute("jk", "jk", lambda: "kj")
+        info = cache.cache_info()
+        self.assertEqual((info.entries, info.chars, info.evictions), (3, 10, 1))
+
+        cache.clear()
+        self.assertEqual(cache.cache_info()[:3], (0, 0, 0))
+
+    def test_invalid_limits(self):
+        with self.assertRaises(ValueError):
+            LRUCache(max_entries=0)
+
+
+class TestDisplayCache(unittest.TestCase):
+    """Caching get_display"""
+
+    def setUp(self):
+        enable_cache(max_entries=100)
+
+    def tearDown(self):
+        disable_cache()
+
+    def test_get_display(self):
+        storage = "".join(["ש", "ל", "ו", "ם"])
+        display = get_display(storage)
+        self.assertIs(get_display(storage), display)
+        self.assertEqual(cache_info()[:2], (1, 1))
+
+        # options and types are part of the key
+        self.assertEqual(get_display(storage, base_dir="L"), display)
+        encoded = get_display(storage.encode("utf-8"))
+        self.assertEqual(encoded, display.encode("utf-8"))
+        self.assertIs(get_display(storage.encode("utf-8")), encoded)
+        self.assertEqual(get_display(storage.encode("cp1255"), "cp1255"),
+                         display.encode("cp1255"))
+        self.assertEqual(cache_info()[:2], (2, 4))
+
+        # the input itself is returned for unchanged texts
+        storage = " ".join(["car", "is", "123"])
+        self.assertIs(get_display(storage), storage)
+        copy = "".join(storage)
+        self.assertIs(get_display(copy), copy)
+        self.assertEqual(cache_info().entries, 5)
+
+        cache_clear()
+        self.assertEqual(cache_info()[:2], (0, 0))
+
+    def test_disabled(self):
+        disable_cache()
+        self.assertIsNone(cache_info())
+        get_display("abc")
+        cache_clear()
+
+    def test_concurrent(self):
+        texts = [f"{i} " + "".join(["ש", "ל", "ו", "ם"]) for i in range(50)]
+        expected = [get_display(text) for text in texts]
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(get_display, texts * 20))
+
+        self.assertEqual(results, expected * 20)
+        info = cache_info()
+        self.assertEqual(info.hits + info.misses, 50 * 21)
+        self.assertEqual(info.entries, 50)
+
+
+class TestDiskCache(unittest.TestCase):
+    """Persistent cache"""
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.path = os.path.join(tmp_dir.name, "displays.sqlite")
+
+    def stored(self):
+        with sqlite3.connect(self.path) as conn:
+            return conn.execute("SELECT COUNT(*) FROM displays").fetchone()[0]
+
+    def test_get_display_many(self):
+        hello_heb = "".join(["ש", "ל", "ו", "ם"])
+        texts = [hello_heb, "Hello", hello_heb.encode("utf-8"), hello_heb] * 300
+        expected = [get_display(text) for text in texts]
+
+        with DiskCache(self.path, engine="python") as cache:
+            self.assertEqual(cache.get_display_many(texts), expected)
+        self.assertEqual(self.stored(), 3)
+
+        with DiskCache(self.path, engine="python") as cache:
+            self.assertEqual(cache.get_display_many(texts), expected)
+            self.assertEqual(cache.get_display(hello_heb, base_dir="L"), expected[0])
+            self.assertEqual(
+                cache.get_display(hello_heb.encode("cp1255"), "cp1255"),
+                expected[0].encode("cp1255"),
+            )
+            storage = " ".join(["car", "is", "123"])
+            self.assertIs(cache.get_display(storage), storage)
+            self.assertIs(cache.get_display(storage), storage)
+        self.assertEqual(self.stored(), 6)
+
+    def test_version_change(self):
+        with DiskCache(self.path, engine="python") as cache:
+            cache.get_display("Hello")
+            cache.version = "python-0-unicode-0"
+            cache.get_display("Hello")
+            self.assertEqual(self.stored(), 2)
+
+            self.assertEqual(cache.prune(), 1)
+            cache.clear()
+        self.assertEqual(self.stored(), 0)
+
+    def test_invalid_engine(self):
+        with self.assertRaises(ValueError):
+            DiskCache(self.path, engine="java")
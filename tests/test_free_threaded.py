@@ -16,6 +16,8 @@
 """Stress the Rust extension from multiple threads (free-threaded / GIL builds)."""
 
 from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+import time
 import unittest
 
 from bidi import get_display
@@ -38,3 +40,31 @@ class TestConcurrentRustBidi(unittest.TestCase):
             futures = [pool.submit(work) for _ in range(64)]
             for f in as_completed(futures):
                 self.assertEqual(f.result(), expected)
+
+    def test_gil_released_on_large_inputs(self):
+        """Python threads keep running while a large input is laid out"""
+        text = (HELLO_HEB_LOGICAL + " abc 123, ") * 200000
+        ticks = []
+        done = threading.Event()
+
+        def tick():
+            while not done.is_set():
+                ticks.append(time.perf_counter())
+                # sleeping lets go of the GIL, waking up waits for it
+                time.sleep(0.001)
+
+        thread = threading.Thread(target=tick)
+        thread.start()
+        try:
+            while not ticks:
+                time.sleep(0.001)
+            start = time.perf_counter()
+            get_display(text)
+            end = time.perf_counter()
+        finally:
+            done.set()
+            thread.join()
+
+        # away from the ends of the call, where the GIL is held anyway
+        margin = (end - start) / 4
+        self.assertTrue(any(start + margin < t < end - margin for t in ticks))
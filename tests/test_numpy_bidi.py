@@ -0,0 +1,126 @@
+# This file is part of python-bidi
+#
+# python-bidi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""NumPy implementation tests, skipped without NumPy"""
+
+import random
+import unittest
+
+from bidi import algorithm
+
+try:
+    from bidi import numpy_engine
+except ImportError:
+    numpy_engine = None
+
+HELLO_HEB_LOGICAL = "".join(["ש", "ל", "ו", "ם"])
+HELLO_HEB_DISPLAY = "".join(["ם", "ו", "ל", "ש"])
+
+# fribidi's CapRtl encoding of explicit formatting chars
+EXPLICIT = {
+    "_>": "\u200e",  # LRM
+    "_<": "\u200f",  # RLM
+    "_l": "\u202a",  # LRE
+    "_r": "\u202b",  # RLE
+    "_o": "\u202c",  # PDF
+    "_L": "\u202d",  # LRO
+    "_R": "\u202e",  # RLO
+}
+
+
+@unittest.skipIf(numpy_engine is None, "NumPy is not installed")
+class TestNumpyBidi(unittest.TestCase):
+    """Tests the NumPy based implementation"""
+
+    def assertSameDisplay(self, text, **kwargs):
+        try:
+            expected = algorithm.get_display(text, **kwargs)
+        except AssertionError:
+            with self.assertRaises(AssertionError):
+                numpy_engine.get_display(text, **kwargs)
+        else:
+            self.assertEqual(numpy_engine.get_display(text, **kwargs), expected)
+            self.assertEqual(
+                numpy_engine.get_levels(text, **kwargs),
+                algorithm.get_levels(text, **kwargs),
+            )
+
+    def test_display(self):
+        get_display = numpy_engine.get_display
+
+        self.assertEqual(get_display(HELLO_HEB_LOGICAL), HELLO_HEB_DISPLAY)
+        self.assertEqual(
+            get_display(f"{HELLO_HEB_LOGICAL}:", base_dir="L"), f"{HELLO_HEB_DISPLAY}:"
+        )
+        self.assertEqual(
+            get_display(b"\xf9\xec\xe5\xed", encoding="cp1255"), b"\xed\xe5\xec\xf9"
+        )
+        self.assertEqual(
+            get_display("HELLO \U0001d7f612", upper_is_rtl=True), "\U0001d7f612 OLLEH"
+        )
+        self.assertEqual(
+            get_display('he said "IT IS (123, 456), OK"', upper_is_rtl=True),
+            'he said "KO ,(456 ,123) SI TI"',
+        )
+        self.assertEqual(get_display("car !\nCAR !", upper_is_rtl=True), "car !\n! RAC")
+        self.assertEqual(get_display("car\x00 is\x7f 123"), "car is 123")
+        self.assertEqual(get_display(""), "")
+
+        self.assertEqual(
+            numpy_engine.get_levels(f"{HELLO_HEB_LOGICAL} 12"), bytes([1] * 5 + [2, 2])
+        )
+        self.assertEqual(numpy_engine.get_levels("car"), bytes(3))
+
+    def test_unchanged_returns_input(self):
+        storage = " ".join(["car", "is", "123"])
+        self.assertIs(numpy_engine.get_display(storage), storage)
+        storage = f"\u200e{storage}"
+        self.assertIs(numpy_engine.get_display(storage), storage)
+
+    def test_same_as_python(self):
+        """Laid out like the Python implementation does"""
+
+        tests = [
+            "car is THE CAR in arabic",
+            "CAR IS the car IN ENGLISH",
+            'HE SAID "it is a car!x" AND RAN',
+            "SOLVE 1*5 1-5 1/5 1+5",
+            "THE RANGE IS 2.5..5",
+            "-2 CELSIUS IS COLD",
+            "<H123>shalom</H123>",
+            "a _L_L_L_L_L_L_L_L_L_L_L_L_L_L_L_L_L_L_L_L_L_L_L_L_L_L_L_L_L_L_L_Rbug",
+            "AN ARABIC _l _o 123-456 PAIR",
+            "this bug 67_r_o89 caught!",
+            "THE _rbest _lONE and",
+            "1 2 3 ניסיון",
+            "abc\tDEF ١٢%°\nGHI $12.5\u2029(x) [Y]\r\nال 12",
+        ]
+        for text in tests:
+            for key, val in EXPLICIT.items():
+                text = text.replace(key, val)
+            for base_dir in (None, "L", "R"):
+                self.assertSameDisplay(text, upper_is_rtl=True, base_dir=base_dir)
+
+        chars = list("aA1 ,.-+$%()\t\nאا١۱\u0300\u2029\x00")
+        chars += list(EXPLICIT.values()) + ["\U0001d7f6", "\u2067"]
+        rand = random.Random(0)
+        for _ in range(500):
+            text = "".join(rand.choice(chars) for _ in range(rand.randint(1, 30)))
+            for base_dir in (None, "R"):
+                self.assertSameDisplay(text, upper_is_rtl=True, base_dir=base_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
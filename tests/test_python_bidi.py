@@ -17,9 +17,32 @@
 # Meir kriheli <meir@mksoft.co.il>
 """BiDi algorithm unit tests"""
 
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
+import io
+import os
+import random
+import tempfile
+import time
 import unittest
+from unicodedata import bidirectional
 
-from bidi.algorithm import get_display, get_embedding_levels, get_empty_storage
+from bidi import algorithm, classes
+from bidi.algorithm import (
+    explicit_embed_and_overrides,
+    get_base_level,
+    get_display,
+    get_embedding_levels,
+    get_empty_storage,
+    get_levels,
+    get_tracer,
+    get_visual_order,
+    resolve_weak_types,
+    set_tracer,
+)
+from bidi.classes import B, EN, NAMES, L, R, classify
+from bidi.mirror import MIRRORED
+from bidi.tracing import PhaseProfiler
 
 
 class TestPythonBidiAlgorithm(unittest.TestCase):
@@ -37,9 +60,8 @@ class TestPythonBidiAlgorithm(unittest.TestCase):
         self.assertEqual(len(storage['chars']), 9)
 
         # Is the expected result ? should be EN
-        _ch = storage['chars'][6]
-        self.assertEqual(_ch['ch'], '\U0001d7f6')
-        self.assertEqual(_ch['type'], 'EN')
+        self.assertEqual(storage['chars'][6], '\U0001d7f6')
+        self.assertEqual(storage['orig_types'][6], EN)
 
         display = get_display(text, upper_is_rtl=True)
         self.assertEqual(display, '\U0001d7f612 OLLEH')
@@ -90,6 +112,237 @@ class TestPythonBidiAlgorithm(unittest.TestCase):
 
         self.assertEqual(get_display(storage, encoding='cp1255'), display)
 
+    def test_unchanged_returns_input(self):
+        """The input itself is returned when the layout doesn't change it"""
+
+        storage = ' '.join(['car', 'is', '123'])
+        self.assertIs(get_display(storage), storage)
+
+        storage = storage.encode('utf-8')
+        self.assertIs(get_display(storage), storage)
+
+        storage = ' '.join(['car', 'IS'])
+        self.assertEqual(get_display(storage, upper_is_rtl=True), 'car SI')
+
+    def test_classify(self):
+        """Bulk classification matches unicodedata"""
+
+        for text in ('caf\xe9 123\n', 'a\u05d0\u0661\u202b\ud800\U0001d7f6', ''):
+            self.assertEqual([NAMES[code] for code in classify(text)],
+                             [bidirectional(ch) for ch in text])
+
+        text = 'a' * 1000 + '\u05d0'
+        self.assertEqual(get_base_level(text), 0)
+        self.assertEqual(get_base_level(text[1:].replace('a', ' ')), 1)
+
+    def test_load_table(self):
+        """The lookup table is built once and saved to disk"""
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'classes.bin')
+            classes.load_table(path)
+            self.assertTrue(os.path.exists(path))
+            classes.load_table(path)
+
+            text = ''.join(chr(cp) for cp in range(0, 0x110000, 251))
+            self.assertEqual([NAMES[code] for code in classify(text)],
+                             [bidirectional(ch) for ch in text])
+
+            with open(path, 'r+b') as table_file:
+                table_file.write(b'stale')
+            classes.load_table(path)
+            with open(path, 'rb') as table_file:
+                self.assertTrue(table_file.read().startswith(b'pybidi'))
+
+    def test_weak_types_linear(self):
+        """Weak types are resolved in linear time, price lists and long
+        sequences of terminators included"""
+
+        def timing(size):
+            text = '\u05d0 ' + '$1' * size + '%' * size + '1,2.3+4' * size
+            best = None
+            for _ in range(3):
+                storage = get_empty_storage()
+                storage['base_level'] = 1
+                get_embedding_levels(text, storage)
+                explicit_embed_and_overrides(storage)
+
+                start = time.perf_counter()
+                resolve_weak_types(storage)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            return best
+
+        # 8 times the input, quadratic time would be 64 times slower
+        self.assertLess(timing(16000), timing(2000) * 20)
+
+    def test_visual_order(self):
+        """L2 reverses sequences at each level, nested levels included"""
+
+        def reverse_per_level(levels, lowest_odd_level):
+            order = list(range(len(levels)))
+            for level in range(max(levels), lowest_odd_level - 1, -1):
+                idx = 0
+                while idx < len(order):
+                    end = idx
+                    while end < len(order) and levels[order[end]] >= level:
+                        end += 1
+                    order[idx:end] = order[idx:end][::-1]
+                    idx = end + 1
+            return order
+
+        rand = random.Random(0)
+        # levels up to lowest_odd_level + 1 are mostly reordered without a tree
+        for highest in [8] * 200 + [3] * 100:
+            size = rand.randint(1, 40)
+            levels = bytearray(rand.randrange(highest) for _ in range(size))
+            lowest_odd_level = min((lvl for lvl in levels if lvl % 2), default=62)
+            self.assertEqual(
+                get_visual_order(levels, 0, len(levels) - 1, lowest_odd_level),
+                reverse_per_level(levels, lowest_odd_level),
+            )
+
+        levels = bytearray([1, 61, 3, 1])
+        self.assertEqual(get_visual_order(levels, 1, 2, 1), [2, 1])
+
+    def test_ascii_fast_path(self):
+        """ASCII text is displayed as is, less its BN chars"""
+
+        self.assertEqual(get_display('car\x00 is\x7f 123'), 'car is 123')
+        self.assertEqual(get_display('car !', base_dir='R'), '! car')
+        self.assertEqual(get_display('car 123', base_dir='L'), 'car 123')
+
+    def test_paragraphs(self):
+        """Paragraphs are laid out on their own, at their own base level"""
+
+        self.assertEqual(get_display('car !\nCAR !', upper_is_rtl=True),
+                         'car !\n! RAC')
+        self.assertEqual(get_display('CAR !\u2029car !', upper_is_rtl=True),
+                         '! RAC\u2029car !')
+        self.assertEqual(
+            get_display('car !\r\nCAR !', upper_is_rtl=True, base_dir='R'),
+            '! car\r\n! RAC')
+        self.assertEqual(get_display('CAR !\n', upper_is_rtl=True), '! RAC\n')
+        self.assertEqual(get_display('\n\nCAR', upper_is_rtl=True), '\n\nRAC')
+        self.assertEqual(get_base_level('\nCAR', upper_is_rtl=True), 0)
+        self.assertEqual(get_base_level('\n\u05d0'), 0)
+
+        # the paragraph separators are those of the B class
+        bmp = ''.join(map(chr, range(0xd800)))
+        separators = ''.join(
+            ch for ch, bidi_type in zip(bmp, classify(bmp)) if bidi_type == B)
+        self.assertEqual(separators, algorithm._PARAGRAPH_SEPARATORS)
+
+    def test_executor(self):
+        """Paragraphs of large texts are laid out by an executor"""
+
+        hello_heb = '\u05e9\u05dc\u05d5\u05dd'
+        text = '\n'.join(f'{i} {hello_heb}!' for i in range(10000))
+        expected = get_display(text)
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            self.assertEqual(get_display(text, executor=pool), expected)
+            encoded = text.encode('utf-8')
+            self.assertEqual(get_display(encoded, executor=pool),
+                             expected.encode('utf-8'))
+
+            text = 'car\n' * 20000
+            self.assertIs(get_display(text, executor=pool), text)
+
+    def test_mirroring(self):
+        """Chars are mirrored at odd levels only"""
+
+        self.assertEqual(get_display('A (B) [C] <D>', upper_is_rtl=True),
+                         '<D> [C] (B) A')
+        self.assertEqual(get_display('a \u2264 b', base_dir='R'),
+                         'a \u2264 b')
+        self.assertEqual(get_display('A \u2264 B', upper_is_rtl=True),
+                         'B \u2265 A')
+        self.assertEqual(get_display('A \u2e55B\u2e56', upper_is_rtl=True),
+                         '\u2e55B\u2e56 A')
+        # mirrored, but with no mirroring char
+        self.assertEqual(get_display('A \u221a B', upper_is_rtl=True),
+                         'B \u221a A')
+
+        for ch, mirror in MIRRORED.items():
+            self.assertEqual(MIRRORED.get(mirror), ch)
+
+    def test_mirroring_unicode_14_pairs(self):
+        """Pairs added in BidiMirroring.txt for Unicode 14.0 are mirrored"""
+
+        pairs = [
+            ('\u221f', '\u2bfe'),  # RIGHT ANGLE
+            ('\u2220', '\u29a3'),  # ANGLE
+            ('\u2224', '\u2aee'),  # DOES NOT DIVIDE
+            ('\u2245', '\u224c'),  # APPROXIMATELY EQUAL TO
+            ('\u22b8', '\u27dc'),  # MULTIMAP
+            ('\u29a4', '\u29a5'),  # ANGLE WITH UNDERBAR
+            ('\u29ae', '\u29af'),  # MEASURED ANGLE WITH OPEN ARM ...
+            ('\u29e8', '\u29e9'),  # DOWN-POINTING TRIANGLE WITH LEFT ...
+        ]
+        for ch, mirror in pairs:
+            self.assertEqual(MIRRORED[ch], mirror)
+            self.assertEqual(MIRRORED[mirror], ch)
+            self.assertEqual(get_display(f'A {ch} B', upper_is_rtl=True),
+                             f'B {mirror} A')
+
+    def test_get_levels(self):
+        """Levels of the chars in logical order, without reordering"""
+
+        hello_heb = '\u05e9\u05dc\u05d5\u05dd'
+        self.assertEqual(get_levels(f'{hello_heb} 12'),
+                         bytes([1, 1, 1, 1, 1, 2, 2]))
+        self.assertEqual(get_levels('car'), bytes(3))
+        self.assertEqual(get_levels('car', base_dir='R'), bytes([2, 2, 2]))
+        self.assertEqual(get_levels('CAR is \n car', upper_is_rtl=True),
+                         bytes([1, 1, 1, 1, 2, 2, 1, 1, 0, 0, 0, 0]))
+        # removed by X9, at the level of the char before them, or the
+        # paragraph level at its start
+        self.assertEqual(get_levels('\u202bCAR\u202c\x00 a', upper_is_rtl=True),
+                         bytes([1, 3, 3, 3, 3, 3, 1, 2]))
+        self.assertEqual(get_levels(b'\xf9\xec', encoding='cp1255'),
+                         bytes([1, 1]))
+
+    def test_tracer(self):
+        """Tracers get each phase of each batch of paragraphs"""
+
+        phases = ['get_embedding_levels', 'explicit_embed_and_overrides',
+                  'resolve_weak_types',
+                  'resolve_neutral_types_and_implicit_levels',
+                  'reorder_resolved_levels', 'apply_mirroring']
+        traces = []
+        set_tracer(traces.append, snapshots=True)
+        try:
+            self.assertEqual(get_display('car IS (12)', upper_is_rtl=True),
+                             'car 12) SI)')
+        finally:
+            set_tracer(None)
+        self.assertIsNone(get_tracer())
+
+        self.assertEqual([trace.phase for trace in traces], phases)
+        self.assertEqual(traces[0].chars, 11)
+        self.assertEqual(traces[-1].snapshot,
+                         ('car 12) SI)', bytes([0, 0, 0, 0, 2, 2, 1, 1, 1, 1, 0]),
+                          bytes([L, L, L, L, EN, EN, R, R, R, R, L])))
+
+        profiler = PhaseProfiler()
+        set_tracer(profiler)
+        try:
+            get_display('שלום 12!\n' * 1000)
+            get_display('car is 123')
+        finally:
+            set_tracer(None)
+        stats = profiler.stats()
+        self.assertEqual(list(stats), phases)
+        self.assertEqual(stats['apply_mirroring'].chars, 9000)
+        self.assertIn('resolve_weak_types', profiler.report())
+
+        output = io.StringIO()
+        with contextlib.redirect_stderr(output):
+            get_display('car IS', upper_is_rtl=True, debug=True)
+        self.assertIn('in reorder_resolved_levels', output.getvalue())
+        self.assertIn('  Chars       : car SI', output.getvalue())
+
     def test_explicit_with_upper_is_rtl(self):
         """Explicit tests"""
         tests = (
@@ -17,9 +17,29 @@
 # Meir kriheli <meir@mksoft.co.il>
 """BiDi algorithm unit tests"""
 
+import os
+import tempfile
 import unittest
 
-from bidi import get_base_level, get_display
+from bidi import (
+    DiskCache,
+    cache_info,
+    disable_cache,
+    enable_cache,
+    fast_path_stats,
+    get_base_level,
+    get_base_level_many,
+    get_display,
+    get_display_lines,
+    get_display_many,
+    get_index_maps,
+    get_levels,
+    get_levels_and_classes,
+    get_visual_runs,
+    reset_fast_path_stats,
+    set_fast_path_stats,
+)
+from bidi.classes import CODES
 
 # keep as list with char per line to prevent browsers from changing display order
 HELLO_HEB_LOGICAL = "".join(["ש", "ל", "ו", "ם"])
@@ -63,6 +83,146 @@ class TestRustBidiAlgorithm(unittest.TestCase):
 
         self.assertEqual(get_display(storage, encoding="cp1255"), display)
 
+    def test_str_kinds(self):
+        """Latin-1, UCS-2 and UCS-4 strings are laid out in their own kind"""
+
+        tests = (
+            ("caf\xe9 12", "L", "caf\xe9 12"),
+            ("caf\xe9 12", "R", "caf\xe9 12"),
+            (f"{HELLO_HEB_LOGICAL} caf\xe9", None, f"caf\xe9 {HELLO_HEB_DISPLAY}"),
+            (f"{HELLO_HEB_LOGICAL} \U0001f600", None, f"\U0001f600 {HELLO_HEB_DISPLAY}"),
+        )
+        for storage, base_dir, display in tests:
+            self.assertEqual(get_display(storage, base_dir=base_dir), display)
+
+        # lone surrogates can't be laid out, whatever the kind of the str
+        for storage in (f"\ud800{HELLO_HEB_LOGICAL}", "\ud800\U0001f600"):
+            with self.assertRaises(UnicodeEncodeError):
+                get_display(storage)
+            with self.assertRaises(UnicodeEncodeError):
+                get_levels(storage)
+
+    def test_large_text(self):
+        """Output of every kind is sized and filled correctly"""
+
+        tests = (
+            (" ".join(["caf\xe9"] * 100_000), " ".join(["caf\xe9"] * 100_000)),
+            (
+                " ".join([HELLO_HEB_LOGICAL] * 100_000),
+                " ".join([HELLO_HEB_DISPLAY] * 100_000),
+            ),
+            (
+                " ".join([HELLO_HEB_LOGICAL + "\U0001f600"] * 100_000),
+                " ".join(["\U0001f600" + HELLO_HEB_DISPLAY] * 100_000),
+            ),
+        )
+        for storage, display in tests:
+            self.assertEqual(get_display(storage), display)
+
+    def test_utf8_buffers(self):
+        """UTF-8 bytes-like input is laid out natively and returned as bytes"""
+
+        storage = f"{HELLO_HEB_LOGICAL} 123".encode("utf-8")
+        display = f"123 {HELLO_HEB_DISPLAY}".encode("utf-8")
+
+        for data in (storage, bytearray(storage), memoryview(storage)):
+            self.assertEqual(get_display(data), display)
+
+        # read-only views of mutable memory are copied, not read in place
+        data = bytearray(storage * 200)
+        self.assertEqual(
+            get_display(memoryview(data).toreadonly()), get_display(bytes(data))
+        )
+
+        self.assertEqual(get_display(storage, encoding="UTF8"), display)
+        paragraphs = "\n".join([f"{HELLO_HEB_LOGICAL} 123"] * 3)
+        self.assertEqual(
+            get_display(paragraphs.encode("utf-8")),
+            get_display(paragraphs).encode("utf-8"),
+        )
+        self.assertEqual(get_display(b""), b"")
+
+        with self.assertRaises(UnicodeDecodeError):
+            get_display(b"\xf9\xec\xe5\xed")
+
+    def test_unchanged_returns_input(self):
+        """The input itself is returned when the layout doesn't change it"""
+
+        for storage, encoding in (
+            (" ".join(["Hello", "123"]), "utf-8"),
+            (" ".join(["caf\xe9", "123"]), "utf-8"),
+            (" ".join(["Hello", "\U0001f600"]), "utf-8"),
+            (" ".join(["caf\xe9", "123"]).encode("utf-8"), "utf-8"),
+            (" ".join(["Hello", "123"]).encode("cp1255"), "cp1255"),
+        ):
+            self.assertIs(get_display(storage, encoding=encoding), storage)
+            self.assertIs(get_display_many([storage], encoding=encoding)[0], storage)
+
+        storage = " ".join(["Hello", HELLO_HEB_LOGICAL])
+        self.assertIsNot(get_display(storage, base_dir="R"), storage)
+
+    def test_fast_path(self):
+        """Texts without RTL chars skip the analysis, unless forced to RTL"""
+
+        self.assertEqual(get_display("caf\xe9 !", base_dir="R"), "! caf\xe9")
+        self.assertEqual(get_display(b"Hello !", base_dir="R"), b"! Hello")
+        self.assertEqual(get_base_level("caf\xe9"), 0)
+        # AN isn't strong, it doesn't make a paragraph RTL
+        self.assertEqual(
+            get_base_level_many(["Hello", "\u0661", "\u05d0"]), [0, 0, 1]
+        )
+
+        reset_fast_path_stats()
+        self.assertEqual(fast_path_stats(), (0, 0))
+        get_display("not counted")
+
+        set_fast_path_stats()
+        try:
+            for storage in ("Hello", "caf\xe9", "\u2603 \U0001f600", b"Hello"):
+                get_display(storage)
+            get_display(HELLO_HEB_LOGICAL)
+            get_display("\u0661\u0662")
+            get_display("Hello", base_dir="R")
+            self.assertEqual(fast_path_stats(), (4, 3))
+        finally:
+            set_fast_path_stats(False)
+            reset_fast_path_stats()
+
+    def test_cache(self):
+        """Results are cached apart from the Python implementation's"""
+
+        from bidi.algorithm import get_display as get_display_python
+
+        enable_cache()
+        try:
+            storage = HELLO_HEB_LOGICAL.encode("utf-8")
+            display = get_display(storage)
+            self.assertIs(get_display(storage), display)
+            self.assertEqual(get_base_level(HELLO_HEB_LOGICAL), 1)
+            self.assertEqual(get_base_level(HELLO_HEB_LOGICAL), 1)
+            self.assertEqual(get_display_python(storage), display)
+
+            # mutable buffers and debug output are not cached
+            get_display(bytearray(storage))
+            get_display(HELLO_HEB_LOGICAL, debug=True)
+
+            info = cache_info()
+            self.assertEqual((info.hits, info.misses, info.entries), (2, 3, 3))
+        finally:
+            disable_cache()
+
+    def test_disk_cache(self):
+        """Persistent cache with the Rust implementation"""
+
+        texts = [HELLO_HEB_LOGICAL, bytearray(b"Hello"), HELLO_HEB_LOGICAL]
+        expected = [HELLO_HEB_DISPLAY, b"Hello", HELLO_HEB_DISPLAY]
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "displays.sqlite")
+            for _ in range(2):
+                with DiskCache(path) as cache:
+                    self.assertEqual(cache.get_display_many(texts), expected)
+
     def test_mixed_hebrew_numbers_issue10(self):
         """Test for the case reported in https://github.com/MeirKriheli/python-bidi/issues/10"""
 
@@ -85,6 +245,157 @@ class TestRustBidiAlgorithm(unittest.TestCase):
         self.assertEqual(get_base_level(HELLO_HEB_LOGICAL), 1)
         self.assertEqual(get_base_level("Hello"), 0)
 
+    def test_get_levels(self):
+        """Levels of the chars in logical order, without reordering"""
+
+        self.assertEqual(get_levels(f"{HELLO_HEB_LOGICAL} 12"), bytes([1] * 5 + [2, 2]))
+        self.assertEqual(get_levels("car"), bytes(3))
+        self.assertEqual(get_levels("car", base_dir="R"), bytes([2, 2, 2]))
+        self.assertEqual(get_levels("a\u202ab"), bytes([0, 0, 2]))
+        self.assertEqual(
+            get_levels(f"car\n{HELLO_HEB_LOGICAL}\U0001d7f6"), bytes([0] * 4 + [1] * 4 + [2])
+        )
+        self.assertEqual(
+            get_levels(HELLO_HEB_LOGICAL.encode("cp1255"), encoding="cp1255"),
+            bytes([1] * 4),
+        )
+        self.assertEqual(get_levels(""), b"")
+
+    def test_get_levels_and_classes(self):
+        """Levels and original classes as buffers of the Rust arrays"""
+
+        levels, classes = get_levels_and_classes(f"{HELLO_HEB_LOGICAL} 12")
+        self.assertEqual(levels, bytes([1] * 5 + [2, 2]))
+        self.assertEqual(
+            classes.tolist(), [CODES[name] for name in ["R"] * 4 + ["WS", "EN", "EN"]]
+        )
+        self.assertTrue(levels.readonly)
+        self.assertEqual(levels.format, "B")
+        with self.assertRaises(TypeError):
+            levels[0] = 0
+        # views keep the array they were taken from alive
+        del classes
+        self.assertEqual(bytes(memoryview(levels.obj)), bytes([1] * 5 + [2, 2]))
+
+        levels, classes = get_levels_and_classes("\U0001d7f6a\u202b")
+        self.assertEqual(levels, bytes(3))
+        self.assertEqual(classes.tolist(), [CODES["EN"], CODES["L"], CODES["RLE"]])
+        self.assertEqual(
+            get_levels_and_classes("car", base_dir="R").levels, bytes([2, 2, 2])
+        )
+        self.assertEqual(get_levels_and_classes(""), (b"", b""))
+
+    def test_get_index_maps(self):
+        """Maps between logical and visual positions, in code points"""
+
+        text = f"{HELLO_HEB_LOGICAL} 12"
+        to_visual, to_logical = get_index_maps(text)
+        self.assertEqual(to_logical.tolist(), [5, 6, 4, 3, 2, 1, 0])
+        self.assertEqual(to_visual.tolist(), [6, 5, 4, 3, 2, 0, 1])
+        self.assertEqual("".join(text[idx] for idx in to_logical), get_display(text))
+        self.assertEqual(to_logical.format, "I")
+        self.assertEqual(to_logical.nbytes, 4 * len(text))
+
+        self.assertEqual(
+            get_index_maps("a\U0001d7f6").visual_to_logical.tolist(), [0, 1]
+        )
+        self.assertEqual(
+            get_index_maps(f"car\n{HELLO_HEB_LOGICAL}").visual_to_logical.tolist(),
+            [0, 1, 2, 3, 7, 6, 5, 4],
+        )
+        self.assertEqual(
+            get_index_maps("car", base_dir="R").logical_to_visual.tolist(), [0, 1, 2]
+        )
+        self.assertEqual(get_index_maps("").logical_to_visual.tolist(), [])
+
+    def test_get_visual_runs(self):
+        """Runs in visual order, line by line, with offsets in code points"""
+
+        self.assertEqual(
+            get_visual_runs(f"{HELLO_HEB_LOGICAL} 12"), [(5, 7, 2), (0, 5, 1)]
+        )
+        self.assertEqual(
+            get_visual_runs(f"car {HELLO_HEB_LOGICAL}"), [(0, 4, 0), (4, 8, 1)]
+        )
+        self.assertEqual(
+            get_visual_runs(f"car {HELLO_HEB_LOGICAL}", line_breaks=[2]),
+            [(0, 2, 0), (2, 4, 0), (4, 8, 1)],
+        )
+        self.assertEqual(
+            get_visual_runs(f"{HELLO_HEB_LOGICAL}\ncar"), [(0, 5, 1), (5, 8, 0)]
+        )
+        self.assertEqual(get_visual_runs("a\U0001d7f6"), [(0, 2, 0)])
+        self.assertEqual(get_visual_runs("car", base_dir="R"), [(0, 3, 2)])
+        self.assertEqual(get_visual_runs(""), [])
+
+        with self.assertRaises(ValueError):
+            get_visual_runs("car", line_breaks=[2, 1])
+        with self.assertRaises(ValueError):
+            get_visual_runs("car", line_breaks=[4])
+
+    def test_get_display_lines(self):
+        """Lines reordered on their own, in the context of their paragraph"""
+
+        text = f"{HELLO_HEB_LOGICAL} abc {HELLO_HEB_LOGICAL}"
+        self.assertEqual(
+            get_display_lines(text, [5]),
+            [f" {HELLO_HEB_DISPLAY}", f"{HELLO_HEB_DISPLAY} abc"],
+        )
+        self.assertEqual(get_display(text[5:]), f"abc {HELLO_HEB_DISPLAY}")
+        self.assertEqual(get_display_lines(text, []), [get_display(text)])
+
+        text = f"car\n{HELLO_HEB_LOGICAL}"
+        self.assertEqual(get_display_lines(text, []), [get_display(text)])
+        self.assertEqual(get_display_lines("car is", [4]), ["car ", "is"])
+        self.assertEqual(
+            get_display_lines(b"\xf9\xec\xe5\xed", [2], encoding="cp1255"),
+            [b"\xec\xf9", b"\xed\xe5"],
+        )
+
+        with self.assertRaises(ValueError):
+            get_display_lines("car", [2, 1])
+
+    def test_get_display_many(self):
+        """Batch layout keeps input order and types"""
+
+        texts = [
+            HELLO_HEB_LOGICAL,
+            "Hello",
+            HELLO_HEB_LOGICAL.encode("utf-8"),
+            f"{HELLO_HEB_LOGICAL}:",
+        ] * 50
+        expected = [get_display(text) for text in texts]
+
+        self.assertEqual(get_display_many(texts), expected)
+        self.assertEqual(get_display_many(iter(texts), chunk_size=1), expected)
+        self.assertEqual(get_display_many(texts, dedupe=True), expected)
+        self.assertEqual(get_display_many([]), [])
+
+        # repeated unchanged texts are each returned as is
+        repeated = ["".join(["car", "s"]) for _ in range(3)]
+        repeated += [b"".join([b"car", b"s"]) for _ in range(3)]
+        for text, display in zip(repeated, get_display_many(repeated, dedupe=True)):
+            self.assertIs(display, text)
+
+        self.assertEqual(
+            get_display_many([f"{HELLO_HEB_LOGICAL}:"], base_dir="L"),
+            [f"{HELLO_HEB_DISPLAY}:"],
+        )
+
+        with self.assertRaises(ValueError):
+            get_display_many(texts, chunk_size=0)
+
+    def test_get_base_level_many(self):
+        """Batch base levels"""
+
+        self.assertEqual(
+            get_base_level_many([HELLO_HEB_LOGICAL, "Hello"] * 10, chunk_size=3),
+            [1, 0] * 10,
+        )
+
+        with self.assertRaises(ValueError):
+            get_base_level_many(["Hello", ""])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,114 @@
+# This file is part of python-bidi
+#
+# python-bidi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Generates bidi/mirror.py from the Unicode BidiMirroring.txt data file.
+
+Usage::
+
+    python tools/gen_mirror.py [--unicode-version X.Y.Z] [--source PATH]
+                               [--output PATH]
+
+The data file is downloaded from unicode.org unless a local copy is given with
+--source. The version defaults to the one of Python's unicodedata, which the
+Python implementation uses for the bidi classes, so both stay in sync.
+"""
+
+import argparse
+import pathlib
+import unicodedata
+import urllib.request
+
+URL = "https://www.unicode.org/Public/{version}/ucd/BidiMirroring.txt"
+MAX_LINE_LENGTH = 79
+TARGET = pathlib.Path(__file__).resolve().parent.parent / "bidi" / "mirror.py"
+
+HEADER = '''\
+# This file is part of python-bidi
+#
+# python-bidi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Copyright (C) 2008-2010 Yaacov Zamir <kzamir_a_walla.co.il>,
+# Copyright (C) 2010-2015 Meir kriheli <mkriheli@gmail.com>.
+"""Mirrored chars"""
+
+# Generated by tools/gen_mirror.py from BidiMirroring.txt (Unicode {version}),
+# don't edit by hand. Chars with the Bidi_Mirrored property but no mirroring
+# char, listed at the end of that file, are left as they are.
+MIRRORED = {{
+'''
+
+
+def parse(lines):
+    """Yields (char, mirror, comment) for each mapping in the data file"""
+
+    for line in lines:
+        data, _, comment = line.partition("#")
+        if not data.strip():
+            continue
+        char, mirror = (field.strip() for field in data.split(";"))
+        yield chr(int(char, 16)), chr(int(mirror, 16)), comment.strip()
+
+
+def escape(char):
+    if ord(char) > 0xFFFF:
+        return f"\\U{ord(char):08X}"
+    return f"\\u{ord(char):04X}"
+
+
+def render(mappings, version):
+    out = [HEADER.format(version=version)]
+    for char, mirror, comment in sorted(mappings):
+        entry = f'    "{escape(char)}": "{escape(mirror)}",'
+        if len(entry) + len(comment) + 4 > MAX_LINE_LENGTH:
+            out.append(f"    # {comment}\n{entry}\n")
+        else:
+            out.append(f"{entry}  # {comment}\n")
+    out.append("}\n")
+    return "".join(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--unicode-version", default=unicodedata.unidata_version)
+    parser.add_argument("--source", type=pathlib.Path)
+    parser.add_argument("--output", type=pathlib.Path, default=TARGET)
+    options = parser.parse_args()
+
+    if options.source:
+        text = options.source.read_text(encoding="utf-8")
+    else:
+        url = URL.format(version=options.unicode_version)
+        with urllib.request.urlopen(url) as response:
+            text = response.read().decode("utf-8")
+
+    mappings = list(parse(text.splitlines()))
+    version = ".".join(options.unicode_version.split(".")[:2])
+    options.output.write_text(render(mappings, version), encoding="utf-8")
+    print(f"Wrote {len(mappings)} mirrored chars to {options.output}")
+
+
+if __name__ == "__main__":
+    main()